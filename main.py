@@ -2,6 +2,7 @@ from typing import Annotated, Optional
 from typing_extensions import TypedDict
 from pydantic import BaseModel
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 # from slowapi import Limiter
 # from slowapi.util import get_remote_address
 from langgraph.graph import StateGraph, START, END
@@ -10,8 +11,15 @@ from langgraph.graph.message import add_messages
 from src.agents import (
     query_understanding,
     rag,
-    response_quality
+    response_quality,
+    web_agent
 )
+from src.utils import vectorstore
+from src.utils.emergency import emergency_classifier
+from src.utils.llm_utils import llm_registry
+from src.utils.site_mirror import site_mirror
+from src.utils.speculation import speculator
+from src.utils.streaming import graph_events, sse_event, time_to_first_token
 
 # limiter = Limiter(key_func=get_remote_address)
 
@@ -22,10 +30,13 @@ class ConversationState(TypedDict):
     query: str  # Current user query
     location: Optional[str]  # Optional location context
     analysis: Optional[query_understanding.QueryAnalysis]
+    speculation_token: Optional[str]  # Retrieval started on the raw query during query understanding
     # Analysis from query understanding, which has all the context we need
     # To keep consistency in conversation (language, emotional state, extracted_entities,
     # domains, query_type, etc.)
+    query_context: Optional[dict]  # Query context handed to the web agent when RAG finds nothing
     initial_response: Optional[rag.RAGOutput]  # Response from RAG
+    web_agent_response: Optional[dict]  # Response from the web search fallback
     final_response: Optional[str]  # Quality review feedback
 
 
@@ -38,10 +49,11 @@ def build_conversation_graph():
     # workflow.set_entry_point("handle_greeting")
     # Like David said, to have the bot start the conversation
 
-    # Add all agent nodes
-    workflow.add_node("query_understanding", query_understanding.query_understanding_node)
-    workflow.add_node("rag", rag.rag_node)
-    workflow.add_node("response_quality", response_quality.response_quality_node)
+    # Add all agent nodes (async variants, the graph runs with ainvoke)
+    workflow.add_node("query_understanding", query_understanding.aquery_understanding_node)
+    workflow.add_node("rag", rag.arag_node)
+    workflow.add_node("response_quality", response_quality.aresponse_quality_node)
+    workflow.add_node("web_agent", web_agent.aweb_agent_node)
 
     # Add simple routing nodes
     def await_clarification_node(state):
@@ -105,8 +117,8 @@ def build_conversation_graph():
         }
     )
 
-    # Connect RAG to response quality - normal flow
-    workflow.add_edge("rag", "response_quality")
+    # RAG routes itself with Command: response_quality in the normal flow,
+    # web_agent when nothing relevant was retrieved
 
     # Somewhere here would be the base agent
 
@@ -114,6 +126,7 @@ def build_conversation_graph():
     workflow.add_edge("emergency", END)
     workflow.add_edge("await_clarification", END)
     workflow.add_edge("response_quality", END)
+    workflow.add_edge("web_agent", END)
 
     return workflow.compile()
 
@@ -125,6 +138,80 @@ app = FastAPI()
 conversation_graph = build_conversation_graph()
 
 
+@app.on_event("startup")
+def load_retrieval_resources():
+    """Open the vectorstore and load the embedding model once, before the first request"""
+    try:
+        vectorstore.get_resources()
+    except ValueError as e:
+        print(f"Vectorstore not available at startup: {e}")
+
+
+@app.post("/vectorstore/rebuild")
+def rebuild_vectorstore():
+    """Reopen the collection and reload the embedding model, e.g. after re-ingestion"""
+    try:
+        resources = vectorstore.rebuild_resources()
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    # The trusted site mirror may have been re-synced too
+    site_mirror.reload()
+    return {"collection": resources.collection_name, "generation": resources.generation}
+
+
+@app.get("/metrics/caches")
+def cache_metrics():
+    """Hit/miss/eviction counters of the in-process caches"""
+    return {
+        "query_embedding_cache": vectorstore.query_embedding_cache.stats(),
+        "answer_cache": rag.answer_cache.stats(),
+        "query_analysis_cache": query_understanding.analysis_cache.stats(),
+        "contact_cache": web_agent.contact_cache.stats(),
+        "web_search_cache": web_agent.cached_search.stats(),
+    }
+
+
+@app.get("/metrics/streaming")
+def streaming_metrics():
+    """Time to first token of /chat/stream"""
+    return {"time_to_first_token": time_to_first_token.stats()}
+
+
+@app.get("/metrics/inclusive_language")
+def inclusive_language_metrics():
+    """How often answers are fixed locally and how often the LLM review is still needed"""
+    return response_quality.language_rewriter.stats()
+
+
+@app.get("/metrics/llm_connections")
+def llm_connection_metrics():
+    """Requests to the LLM API and how many of them reused a pooled keep-alive connection"""
+    return llm_registry.connection_stats()
+
+
+@app.on_event("shutdown")
+async def close_llm_connections():
+    await llm_registry.aclose()
+
+
+@app.get("/metrics/speculation")
+def speculation_metrics():
+    """Speculative retrievals started during query understanding, and what became of them"""
+    return speculator.stats()
+
+
+@app.get("/metrics/site_mirror")
+def site_mirror_metrics():
+    """Web fallbacks answered from the local mirror of the trusted sites instead of a live search"""
+    return site_mirror.stats()
+
+
+@app.get("/metrics/emergency")
+def emergency_metrics():
+    """Emergencies caught by the local pre-classifier, before the query analysis LLM call"""
+    return emergency_classifier.stats()
+
+
 class ChatInput(BaseModel):
     message: str
     location: Optional[str] = None
@@ -135,13 +222,9 @@ class ChatResponse(BaseModel):
     response: str
 
 
-@app.post("/chat")
-# @limiter.limit("5/minute")  # Limit to 5 requests per minute per IP - for later
-async def chat(chat_input: ChatInput) -> ChatResponse:
-    """Handle chat requests"""
-
-    # Initialize state for this conversation turn
-    initial_state = {
+def conversation_turn(chat_input: ChatInput) -> dict:
+    """Initial graph state for this conversation turn"""
+    return {
         "messages": [],  # Conversation history
         "query": chat_input.message,
         "location": chat_input.location,
@@ -150,15 +233,26 @@ async def chat(chat_input: ChatInput) -> ChatResponse:
         "final_response": None  # For response quality output
     }
 
+
+@app.post("/chat")
+# @limiter.limit("5/minute")  # Limit to 5 requests per minute per IP - for later
+async def chat(chat_input: ChatInput) -> ChatResponse:
+    """Handle chat requests"""
+
+    # Initialize state for this conversation turn
+    initial_state = conversation_turn(chat_input)
+
     print(f"Initial state: {initial_state}")
 
     try:
         # Process through agent graph
-        result = conversation_graph.invoke(initial_state)
+        result = await conversation_graph.ainvoke(initial_state)
 
         # Extract final response
-        if "final_response" in result:
+        if result.get("final_response"):
             response_text = result["final_response"]["text"]
+        elif result.get("web_agent_response"):
+            response_text = result["web_agent_response"]["web_agent_response"]
         else:
             # Fallback to last message if no final_response
             response_text = result["messages"][-1]["content"]
@@ -170,6 +264,31 @@ async def chat(chat_input: ChatInput) -> ChatResponse:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/chat/stream")
+async def chat_stream(chat_input: ChatInput) -> StreamingResponse:
+    """
+    Handle chat requests as Server-Sent Events: routing decisions, the emergency or
+    clarification message and the answer token by token, then the reviewed answer
+    as a "final" event (it replaces the streamed draft) and a closing "done" event.
+    """
+    initial_state = conversation_turn(chat_input)
+    timer = time_to_first_token.start()
+
+    async def events():
+        try:
+            async for mode, chunk in conversation_graph.astream(initial_state, stream_mode=["updates", "messages"]):
+                for event, data in graph_events(mode, chunk):
+                    if event in ("token", "message", "final"):
+                        timer.first_output()
+                    yield sse_event(event, data)
+        except Exception as e:
+            print(f"Error processing request: {e}")
+            yield sse_event("error", {"detail": str(e)})
+        yield sse_event("done", {"time_to_first_token_ms": round(timer.elapsed * 1000, 1) if timer.elapsed is not None else None})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -1,12 +1,17 @@
+import asyncio
 import typing
 from typing import Annotated, List, Optional, Literal
 from typing_extensions import TypedDict, Union
 from pydantic import BaseModel, Field
-from langchain_anthropic import ChatAnthropic
 from langgraph.graph import StateGraph, START
 from langgraph.graph.message import add_messages
 from langgraph.types import Command
-from src.utils.llm_utils import get_api_key
+from src.utils.llm_utils import get_api_key, get_llm
+from src.utils.emergency import EmergencySignal, emergency_classifier
+from src.utils.language_id import conversation_language, reply_language
+from src.utils.caching import SQLiteTTLCache, TTLCache, normalize_text
+from src.utils.speculation import SPECULATIVE_RETRIEVAL, speculator
+from src.agents.rag import speculative_search
 import os
 import logging
 
@@ -15,6 +20,12 @@ logger = logging.getLogger(__name__)
 
 api_key = get_api_key()
 
+# Cache of LLM query analyses, for the same questions asked again (by anyone) at the same location
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "4096"))
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", "86400"))
+# SQLite file to keep the cache across restarts; empty for an in-memory cache
+ANALYSIS_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", "")
+
 Domains = Literal[
     "Where to go first",
     "Shelter",
@@ -65,26 +76,27 @@ class QueryAnalysis(BaseModel):
     # here we can add some of the multi-choice questions to help the user express their need
     # I leave that empty because this needs some brainstorming 🧠⛈️🌪️
 
+if ANALYSIS_CACHE_PATH:
+    analysis_cache = SQLiteTTLCache(ANALYSIS_CACHE_PATH, maxsize=ANALYSIS_CACHE_SIZE, ttl=ANALYSIS_CACHE_TTL)
+else:
+    analysis_cache = TTLCache(maxsize=ANALYSIS_CACHE_SIZE, ttl=ANALYSIS_CACHE_TTL)
+
+
 class AgentState(TypedDict):
     """State for Query Understanding Agent"""
     messages: Annotated[list, add_messages]
     query: str
     location: Optional[str]
     analysis: Optional[QueryAnalysis]
+    speculation_token: Optional[str]
 
 
-def query_understanding_node(state: AgentState):
-    """
-    Analyzes user query and routes to appropriate next steps.
-    """
+def _analysis_request(state: AgentState):
+    """LLM client and messages for the structured query analysis"""
     if not os.getenv("ANTHROPIC_API_KEY"):
         raise ValueError("ANTHROPIC_API_KEY environment variable is not set")
 
-    llm = ChatAnthropic(
-        model="claude-3-5-haiku-20241022", # cheapest claude model
-        temperature=0,
-        api_key=os.getenv("ANTHROPIC_API_KEY"),
-    )
+    llm = get_llm("haiku")  # cheapest claude model
 
     domain_list = "\n    - ".join(typing.get_args(Domains))
 
@@ -110,16 +122,33 @@ def query_understanding_node(state: AgentState):
     6. Key entities (locations, dates, needs)
     """.format(domain_list, domain_list)
 
-    # Get structured analysis from LLM
-    structured_analysis = llm.with_structured_output(QueryAnalysis).invoke(
-        [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Query: {state['query']}\nLocation: {state.get('location', 'Not provided')}"}
-        ]
-    )
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Query: {state['query']}\nLocation: {state.get('location', 'Not provided')}"}
+    ]
+    return llm.with_structured_output(QueryAnalysis), messages
 
+
+def _start_speculation(state: AgentState) -> Optional[str]:
+    """Start retrieval on the raw query while the LLM analyses it; rag picks the results up"""
+    if not SPECULATIVE_RETRIEVAL:
+        return None
+    return speculator.start(speculative_search, state["query"], state.get("location"))
+
+
+def _route(state: AgentState, structured_analysis: QueryAnalysis, speculation_token: Optional[str] = None) -> Command:
+    """Turn the analysis into the next step of the graph"""
+    # The LLM's language wins; the local language ID only fills in when the analysis has none
+    # (fast paths that skip the LLM set it themselves, see _emergency_analysis)
+    structured_analysis.language = reply_language(
+        structured_analysis.language, state["query"], state.get("messages")
+    ) or structured_analysis.language
     print(structured_analysis)
 
+    if structured_analysis.query_type != "clear":
+        # Emergency and clarification replies don't use retrieval
+        speculator.cancel(speculation_token)
+
     if structured_analysis.query_type == "needs_clarification":
         # Filter clarification options to only include valid domains
         structured_analysis.clarification_options = list(typing.get_args(Domains))
@@ -150,6 +179,7 @@ def query_understanding_node(state: AgentState):
             goto="rag",
             update={
                 "analysis": structured_analysis.model_dump(),
+                "speculation_token": speculation_token,
                 "query_context": {
                     "original_query": state["query"],
                     "domains": structured_analysis.domains,
@@ -159,3 +189,74 @@ def query_understanding_node(state: AgentState):
             }
         )
 
+
+def _emergency_analysis(state: AgentState, signal: EmergencySignal) -> QueryAnalysis:
+    """Analysis for a query the local pre-classifier flagged, without waiting for the LLM"""
+    return QueryAnalysis(
+        query_type="emergency",
+        domains=["Safety & Protection"],
+        emotional_state="distressed",
+        language=conversation_language(state["query"], state.get("messages"), default=signal.language) or "unknown",
+        confidence=1.0,
+        extracted_entities={"location": state.get("location"), "emergency_signal": signal.model_dump()},
+    )
+
+
+def _analysis_key(state: AgentState):
+    # The analysis prompt only sees the query and the location, so they fully determine the result
+    return normalize_text(state["query"]), normalize_text(state.get("location") or "")
+
+
+def query_understanding_node(state: AgentState):
+    """
+    Analyzes user query and routes to appropriate next steps.
+    """
+    # Local emergency check first, so urgent queries skip the LLM round trip
+    signal = emergency_classifier.classify(state["query"])
+    if signal:
+        return _route(state, _emergency_analysis(state, signal))
+
+    cached_analysis = analysis_cache.get(_analysis_key(state))
+    if cached_analysis is not None:
+        return _route(state, QueryAnalysis(**cached_analysis))
+
+    structured_llm, messages = _analysis_request(state)
+    speculation_token = _start_speculation(state)
+
+    # Get structured analysis from LLM
+    try:
+        structured_analysis = structured_llm.invoke(messages)
+    except Exception:
+        speculator.cancel(speculation_token)
+        raise
+    analysis_cache.set(_analysis_key(state), structured_analysis.model_dump())
+
+    return _route(state, structured_analysis, speculation_token)
+
+
+async def aquery_understanding_node(state: AgentState):
+    """
+    Async variant of query_understanding_node, for graphs run with ainvoke.
+    """
+    # The phrase check takes microseconds; the embedding check runs off the event loop
+    signal = await asyncio.to_thread(emergency_classifier.classify, state["query"])
+    if signal:
+        return _route(state, _emergency_analysis(state, signal))
+
+    # The cache may be a SQLite file (ANALYSIS_CACHE_PATH), keep its reads and writes off the event loop
+    cached_analysis = await asyncio.to_thread(analysis_cache.get, _analysis_key(state))
+    if cached_analysis is not None:
+        return _route(state, QueryAnalysis(**cached_analysis))
+
+    structured_llm, messages = _analysis_request(state)
+    speculation_token = _start_speculation(state)
+
+    # Get structured analysis from LLM without blocking the event loop
+    try:
+        structured_analysis = await structured_llm.ainvoke(messages)
+    except Exception:
+        speculator.cancel(speculation_token)
+        raise
+    await asyncio.to_thread(analysis_cache.set, _analysis_key(state), structured_analysis.model_dump())
+
+    return _route(state, structured_analysis, speculation_token)
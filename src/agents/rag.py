@@ -1,14 +1,20 @@
 from typing import List, Dict, Optional
-from chromadb.errors import InvalidCollectionException
 from typing_extensions import TypedDict
 from pydantic import BaseModel, Field
 from datetime import datetime
-import chromadb
-from chromadb.utils import embedding_functions
-from langchain_anthropic import ChatAnthropic
 from langgraph.types import Command
+import asyncio
 import json
-from src.utils.llm_utils import get_api_key
+from src.utils.llm_utils import get_api_key, get_llm
+from src.utils import vectorstore
+from src.utils.adaptive_retrieval import choose_k
+from src.utils.chunking import collapse_chunks
+from src.utils.context_packing import pack_context
+from src.utils.geo import municipalities_near
+from src.utils.lexical_index import BM25Index, reciprocal_rank_fusion
+from src.utils.retrievers import Retriever
+from src.utils.semantic_cache import SemanticCache, answer_scope
+from src.utils.speculation import speculator
 import os
 import logging
 
@@ -18,6 +24,44 @@ logger = logging.getLogger(__name__)
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 api_key = get_api_key()
 
+# Configuration
+# How many candidates per domain the single multi-domain search asks for before splitting the hits
+DOMAIN_OVERFETCH = int(os.getenv("RAG_DOMAIN_OVERFETCH", "3"))
+GEO_FILTER_ENABLED = os.getenv("GEO_FILTER_ENABLED", "true").lower() == "true"
+GEO_RADIUS_KM = float(os.getenv("GEO_RADIUS_KM", "25"))
+# Estimated tokens of retrieved text sent to the LLM, and relevance/diversity trade-off when packing it
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1500"))
+MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+# Relevance gate: hits further than this (squared L2 between unit vectors, 0-4) are ignored and
+# a query without relevant hits goes to the web agent without calling the LLM
+MAX_DISTANCE = float(os.getenv("RAG_MAX_DISTANCE", "1.3"))
+# Per-domain overrides as JSON, e.g. RAG_MAX_DISTANCE_PER_DOMAIN='{"Shelter": 1.1}'
+MAX_DISTANCE_PER_DOMAIN = {
+    domain.lower(): float(threshold)
+    for domain, threshold in json.loads(os.getenv("RAG_MAX_DISTANCE_PER_DOMAIN", "{}")).items()
+}
+MIN_BM25_SCORE = float(os.getenv("RAG_MIN_BM25_SCORE", "3.0"))
+# Adaptive retrieval depth (see adaptive_retrieval.choose_k)
+MIN_K = int(os.getenv("RAG_MIN_K", "1"))
+DEFAULT_K = int(os.getenv("RAG_DEFAULT_K", "3"))
+MAX_K = int(os.getenv("RAG_MAX_K", "6"))
+K_GAP = float(os.getenv("RAG_K_GAP", "0.15"))
+K_DOMINANCE_GAP = float(os.getenv("RAG_K_DOMINANCE_GAP", "0.3"))
+K_CLOSE_MARGIN = float(os.getenv("RAG_K_CLOSE_MARGIN", "0.05"))
+# Hits fetched by the speculative search on the raw query, enough to cover several domains
+SPECULATIVE_N_RESULTS = int(os.getenv("RAG_SPECULATIVE_N_RESULTS", "60"))
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+
+# Generated answers, shared across requests and scoped by language, domains and location
+answer_cache = SemanticCache(
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    maxsize=SEMANTIC_CACHE_SIZE,
+    ttl=SEMANTIC_CACHE_TTL
+)
+
 # Input/Output schemas
 class RAGInput(BaseModel):
     """Expected input from query understanding agent"""
@@ -50,47 +94,185 @@ class RAGOutput(BaseModel):
     metadata: InformationMetadata = Field(description="Metadata about the information")
     relevant_chunks: List[str] = Field(description="Retrieved relevant text chunks")
     domains_covered: List[str] = Field(description="List of domains for which information was found")
+    retrieval_info: Dict = Field(
+        description="Per domain, the number of hits kept and why (adaptive retrieval depth)",
+        default_factory=dict
+    )
     # query_context: Optional[RAGInput]
 
 
 class RAGState(TypedDict):
     """State for RAG Agent"""
     query_context: RAGInput
+    speculation_token: Optional[str]
     response: Optional[RAGOutput]
 
 
 def initialize_vectorstore():
-    """Initialize and return Chroma vectorstore with embeddings"""
-    # Initialize persistent Chroma client
-    client = chromadb.PersistentClient(path="./chroma_db")
+    """Return the shared Chroma collection (created once per process)"""
+    return vectorstore.get_collection()
 
-    # client.delete_collection("test_collection")
 
-    # Create or get existing collection
-    try:
-        collection = client.get_collection(
-            name="test_collection",
-            embedding_function=embedding_functions.DefaultEmbeddingFunction()
-        )
-        print("Collection obtained.")
+def location_filter(location: Optional[str]) -> Optional[Dict]:
+    """
+    Metadata filter keeping offers in municipalities near `location`, plus offers without
+    a known municipality (national helplines, online services). None if the location is unknown.
+    """
+    if not GEO_FILTER_ENABLED:
+        return None
+    municipalities = municipalities_near(location, GEO_RADIUS_KM)
+    if not municipalities:
+        return None
+    return {"municipality": {"$in": municipalities + [""]}}
 
-        return collection
 
-    except (ValueError, InvalidCollectionException):  # Collection doesn't exist
-        raise ValueError("Collection doesn't exist")
+def relevance_threshold(domain: str) -> float:
+    """Largest distance a hit for this domain may have to count as relevant"""
+    return MAX_DISTANCE_PER_DOMAIN.get(domain.lower(), MAX_DISTANCE)
 
-def rag_node(state: RAGState):
+
+def filter_relevant(results_by_domain: Dict[str, List[Dict]]) -> Dict[str, List[Dict]]:
     """
-    RAG agent that retrieves relevant information and generates a response with metadata.
+    Keep only relevant hits: dense hits within the domain's distance threshold and
+    lexical-only hits (no distance) with a strong enough BM25 score.
+    Domains left without hits are dropped.
+    """
+    relevant = {}
+    for domain, hits in results_by_domain.items():
+        threshold = relevance_threshold(domain)
+        kept = [
+            hit for hit in hits
+            if (hit["distance"] <= threshold if hit["distance"] is not None
+                else hit.get("bm25_score", 0.0) >= MIN_BM25_SCORE)
+        ]
+        if kept:
+            relevant[domain] = kept
+    return relevant
+
+
+def split_by_domain(rankings: List[List[Dict]], domains, n_results_per_domain: int) -> Dict[str, List[Dict]]:
+    """
+    Split rankings (dense, lexical) of a search over several domains per domain, keeping the order,
+    then fuse and collapse chunks within every domain. Domains without hits are left out.
+    """
+    named_domains = {domain.lower(): domain for domain in domains}
+    rankings_by_domain = {domain: [[] for _ in rankings] for domain in named_domains.values()}
+    for i, ranking in enumerate(rankings):
+        for hit in ranking:
+            domain = named_domains.get(str(hit["metadata"].get("domain", "")).lower())
+            if domain is not None:
+                rankings_by_domain[domain][i].append(hit)
+    results_by_domain = {}
+    for domain, domain_rankings in rankings_by_domain.items():
+        hits = collapse_chunks(reciprocal_rank_fusion(domain_rankings, None))[:n_results_per_domain]
+        if hits:
+            results_by_domain[domain] = hits
+    return results_by_domain
+
+
+def speculative_search(query: str, location: Optional[str]) -> Dict:
+    """
+    Search on the raw query and location, before the query analysis is known (see
+    speculation.Speculator). One search over all domains, split per domain once rag knows them.
+    """
+    where = location_filter(location)
+    query_embedding = vectorstore.embed_query(query)
+    rankings = [vectorstore.get_retriever().search(query_embedding, n_results=SPECULATIVE_N_RESULTS, where=where)]
+    lexical_index = vectorstore.get_lexical_index()
+    if lexical_index is not None:
+        rankings.append(lexical_index.search(query, n_results=SPECULATIVE_N_RESULTS, where=where))
+    return {"rankings": rankings, "where": where, "generation": vectorstore.get_resources().generation}
+
+
+def reuse_speculative(speculation: Optional[Dict], domains: List[str], n_results_per_domain: int,
+                      where: Optional[Dict]) -> Dict[str, List[Dict]]:
     """
-    collection = initialize_vectorstore()
+    Domains the speculative search already answers in full: at least n_results_per_domain hits,
+    searched with the same location filter on the current data. "Other" takes the unfiltered ranking.
+    The remaining domains still need their own search.
+    """
+    if (speculation is None or speculation["where"] != where
+            or speculation["generation"] != vectorstore.get_resources().generation):
+        return {}
+    rankings = speculation["rankings"]
+    named_domains = [domain for domain in domains if domain.lower() != "other"]
+    reused = {
+        domain: hits for domain, hits in split_by_domain(rankings, named_domains, n_results_per_domain).items()
+        if len(hits) >= n_results_per_domain
+    }
+    other_domains = [domain for domain in domains if domain.lower() == "other"]
+    if other_domains:
+        n_results = len(domains) * n_results_per_domain
+        hits = collapse_chunks(reciprocal_rank_fusion(rankings, None))[:n_results]
+        if len(hits) >= n_results:
+            for domain in other_domains:
+                reused[domain] = hits
+    return reused
+
+
+def retrieve_for_domains(retriever: Retriever, query_embedding, domains: List[str], n_results_per_domain: int,
+                         lexical_index: Optional[BM25Index] = None, lexical_query: Optional[str] = None,
+                         where: Optional[Dict] = None) -> Dict[str, List[Dict]]:
+    """
+    Retrieve the top hits for every requested domain, usually with at most two searches:
+    one filtered on all named domains at once, and one unfiltered search for "Other".
+    Named domains that the first search cut off get a filtered search of their own.
+    When a lexical index is given, its BM25 matches for `lexical_query` are fused with
+    the dense hits using reciprocal-rank fusion, with the same domain filters.
+    An extra `where` filter (e.g. the location filter) is applied to every search.
+    Chunks of the same offer are collapsed back to one hit per offer.
+    Returns {domain: [hit, ...]} with hits sorted by fused rank.
+    """
+    def search(n_results, domain_filter=None):
+        filters = [f for f in (domain_filter, where) if f]
+        search_filter = {"$and": filters} if len(filters) > 1 else (filters[0] if filters else None)
+        rankings = [retriever.search(query_embedding, n_results=n_results, where=search_filter)]
+        if lexical_index is not None and lexical_query:
+            rankings.append(lexical_index.search(lexical_query, n_results=n_results, where=search_filter))
+        return rankings
+
+    results_by_domain = {}
+    named_domains = {domain.lower(): domain for domain in domains if domain.lower() != "other"}
+
+    if named_domains:
+        # Over-fetch so that a domain with many close matches rarely crowds out the others
+        n_results = n_results_per_domain * len(named_domains) * DOMAIN_OVERFETCH
+        rankings = search(n_results=n_results, domain_filter={"domain": {"$in": list(named_domains)}})
+        results_by_domain.update(split_by_domain(rankings, named_domains.values(), n_results_per_domain))
+        if any(len(ranking) >= n_results for ranking in rankings):
+            # The search was cut off, so a domain that came up short may have been crowded out:
+            # top it up with its own filtered search
+            for key, domain in named_domains.items():
+                if len(results_by_domain.get(domain, [])) < n_results_per_domain:
+                    hits = split_by_domain(
+                        search(n_results=n_results_per_domain, domain_filter={"domain": key}),
+                        [domain],
+                        n_results_per_domain
+                    )
+                    if hits:
+                        results_by_domain[domain] = hits[domain]
+
+    other_domains = [domain for domain in domains if domain.lower() == "other"]
+    if other_domains:
+        # For "Other", try to get more results since we're searching broadly
+        n_results = len(domains) * n_results_per_domain
+        hits = collapse_chunks(reciprocal_rank_fusion(search(n_results=n_results), None))[:n_results]
+        for domain in other_domains:
+            results_by_domain[domain] = hits
+
+    return results_by_domain
+
+
+def _prepare_generation(query_context: Dict, speculation_token: Optional[str] = None):
+    """
+    Retrieval half of the RAG agent (CPU and I/O bound, no LLM call).
+    Reuses the speculative search started during query understanding when it covers a domain.
+    Returns a Command when no generation is needed (cached answer, nothing relevant found),
+    otherwise the generation plan: the LLM messages plus what _finish_generation needs.
+    """
+    retriever = vectorstore.get_retriever()
     print("Initialized vectorstore")
-    llm = ChatAnthropic(
-        model="claude-3-5-sonnet-20241022",
-        temperature=0
-    )
 
-    query_context = state["query_context"]
     print(f"Obtained query context: {query_context}")
 
     # Build enhanced query incorporating all domains
@@ -102,39 +284,96 @@ def rag_node(state: RAGState):
     """
     print("Defined enhanced query: {}".format(enhanced_query))
 
-    # Define target number of results we want
-    target_results_per_domain = 3 # k in the search
-    total_target_results = len(query_context["domains"]) * target_results_per_domain
+    # Fetch up to MAX_K hits per domain, adaptive k decides how many to keep
+    target_results_per_domain = MAX_K
 
-    # Collect results for all domains
-    all_documents = []
-    all_metadatas = []
-    all_distances = []
-    domains_covered = set()
-
-    # Query for each domain
-    for domain in query_context["domains"]:
-        if domain.lower() != "other":
-            # Query with domain filter
-            results = collection.query(
-                query_texts=[enhanced_query],
-                n_results=target_results_per_domain,
-                where={"domain": domain.lower()},
-                include=["documents", "metadatas", "distances"]
-            )
-        else:
-            # For "Other", try to get more results since we're searching broadly
-            results = collection.query(
-                query_texts=[enhanced_query],
-                n_results=total_target_results,  # Try to get more results for general queries
-                include=["documents", "metadatas", "distances"]
+    # Embed the query once and share the vector between all domain searches
+    query_embedding = vectorstore.embed_query(enhanced_query)
+
+    # Reuse a previous answer to (almost) the same question if we have one
+    cache_scope = answer_scope(
+        query_context["language"],
+        query_context["domains"],
+        query_context["entities"].get("location")
+    )
+    # Changes on rebuild and on re-ingestion, so answers built on old offers expire on their own
+    generation = vectorstore.data_generation()
+    if SEMANTIC_CACHE_ENABLED:
+        cached_output = answer_cache.lookup(query_embedding, cache_scope, generation=generation)
+        if cached_output is not None:
+            logger.debug("Answer served from semantic cache")
+            speculator.cancel(speculation_token)
+            return Command(
+                goto="response_quality",
+                update={
+                    "initial_response": cached_output,
+                    "query_context": None,
+                }
             )
 
-        if results['documents'][0]:  # If we got any results
-            all_documents.extend(results['documents'][0])
-            all_metadatas.extend(results['metadatas'][0])
-            all_distances.extend(results['distances'][0])
-            domains_covered.add(domain)
+    # Exact names, streets and Dutch terms are matched lexically on the raw query and entities
+    lexical_query = " ".join(
+        [query_context["original_query"]] + [str(v) for v in query_context["entities"].values()]
+    )
+    # Only search offers near the user when we know where they are
+    geo_filter = location_filter(query_context["entities"].get("location"))
+    # Domains the speculative search on the raw query already covers, the rest are topped up here
+    results_by_domain = reuse_speculative(
+        speculator.take(speculation_token), query_context["domains"], target_results_per_domain, geo_filter
+    )
+    missing_domains = [domain for domain in query_context["domains"] if domain not in results_by_domain]
+    if results_by_domain:
+        logger.debug(f"Speculative retrieval reused for {list(results_by_domain)}, searching {missing_domains}")
+    if missing_domains:
+        results_by_domain.update(retrieve_for_domains(
+            retriever,
+            query_embedding,
+            missing_domains,
+            target_results_per_domain,
+            lexical_index=vectorstore.get_lexical_index(),
+            lexical_query=lexical_query,
+            where=geo_filter
+        ))
+
+    # Drop hits that are too far from the query to be worth generating an answer from
+    results_by_domain = filter_relevant(results_by_domain)
+    if geo_filter and not results_by_domain:
+        # Nothing relevant nearby, widen the search to the whole country
+        logger.debug("No relevant offers found near the location, retrying without location filter")
+        results_by_domain = filter_relevant(retrieve_for_domains(
+            retriever,
+            query_embedding,
+            query_context["domains"],
+            target_results_per_domain,
+            lexical_index=vectorstore.get_lexical_index(),
+            lexical_query=lexical_query
+        ))
+
+    # Keep fewer hits when one offer clearly wins, more when the top is ambiguous
+    retrieval_info = {}
+    for domain, hits in results_by_domain.items():
+        k, reason = choose_k(
+            hits,
+            min_k=MIN_K,
+            default_k=DEFAULT_K,
+            max_k=len(query_context["domains"]) * MAX_K if domain.lower() == "other" else MAX_K,
+            gap=K_GAP,
+            dominance_gap=K_DOMINANCE_GAP,
+            close_margin=K_CLOSE_MARGIN
+        )
+        results_by_domain[domain] = hits[:k]
+        retrieval_info[domain] = {"k": k, "reason": reason}
+    logger.debug(f"Adaptive retrieval depth: {retrieval_info}")
+
+    # Deduplicate, diversify and fit the hits into the prompt budget, keeping every domain covered
+    ordered_results = {domain: results_by_domain[domain] for domain in query_context["domains"] if domain in results_by_domain}
+    packed_hits = pack_context(ordered_results, token_budget=CONTEXT_TOKEN_BUDGET, mmr_lambda=MMR_LAMBDA)
+
+    # Collect results for all domains
+    all_documents = [hit["document"] for hit in packed_hits]
+    all_metadatas = [hit["metadata"] for hit in packed_hits]
+    all_distances = [hit["distance"] for hit in packed_hits]
+    domains_covered = {domain for hit in packed_hits for domain in hit["domains"]}
 
     # Prepare consolidated results
     query_results = {
@@ -144,6 +383,30 @@ def rag_node(state: RAGState):
     }
     print(f"Consolidated query results: {query_results}")
 
+    if not packed_hits:
+        # Nothing relevant: skip generation and go straight to the web fallback
+        logger.debug("No relevant offers found, handing off to web agent without generating")
+        output = RAGOutput(
+            text="",
+            metadata=InformationMetadata(
+                source="",
+                last_updated=datetime.now(),
+                contact_info={},
+                completeness_score=0,
+                confidence_score=0,
+            ),
+            relevant_chunks=[],
+            domains_covered=[],
+            retrieval_info=retrieval_info,
+        )
+        return Command(
+            goto="web_agent",
+            update={
+                "initial_response": output.model_dump(),
+                "query_context": query_context
+            }
+        )
+
     # # Don't calculate if no results
     # if not all_distances:
     #     confidence_score = 0.0
@@ -221,10 +484,27 @@ def rag_node(state: RAGState):
     5. Structure your response to clearly separate information for different domains
     6. Give the answer in the same language you received it in"""
 
-    response = llm.invoke([
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": query_context["original_query"]}
-    ])
+    return {
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": query_context["original_query"]}
+        ],
+        "query_context": query_context,
+        "documents": all_documents,
+        "metadatas": all_metadatas,
+        "domains_covered": domains_covered,
+        "retrieval_info": retrieval_info,
+        "query_embedding": query_embedding,
+        "cache_scope": cache_scope,
+        "generation": generation,
+    }
+
+
+def _finish_generation(plan: Dict, response_text: str) -> Command:
+    """Build the RAGOutput from the generated text and route to the next node"""
+    query_context = plan["query_context"]
+    all_documents = plan["documents"]
+    all_metadatas = plan["metadatas"]
 
     # Get most recent metadata
     if not all_metadatas:
@@ -240,7 +520,7 @@ def rag_node(state: RAGState):
 
     # Prepare output
     output = RAGOutput(
-        text=response.content,
+        text=response_text,
         metadata=InformationMetadata(
             source=", ".join(set(m["source"] for m in all_metadatas)),
             last_updated=last_updated,
@@ -249,11 +529,14 @@ def rag_node(state: RAGState):
             confidence_score= 1,#confidence_score,
         ),
         relevant_chunks=all_documents,
-        domains_covered=list(domains_covered),
+        domains_covered=list(plan["domains_covered"]),
+        retrieval_info=plan["retrieval_info"],
     )
     print(f"Prepared output: {output.model_dump()}")
 
     if len(output.relevant_chunks) > 0:
+        if SEMANTIC_CACHE_ENABLED:
+            answer_cache.store(plan["query_embedding"], plan["cache_scope"], output.model_dump(), generation=plan["generation"])
         return Command(
             goto="response_quality",
             update={
@@ -268,4 +551,33 @@ def rag_node(state: RAGState):
                 "initial_response": output.model_dump(),
                 "query_context": query_context
             }
-        )
\ No newline at end of file
+        )
+
+
+def _get_llm():
+    return get_llm("sonnet")
+
+
+def rag_node(state: RAGState):
+    """
+    RAG agent that retrieves relevant information and generates a response with metadata.
+    """
+    plan = _prepare_generation(state["query_context"], state.get("speculation_token"))
+    if isinstance(plan, Command):
+        return plan
+
+    response = _get_llm().invoke(plan["messages"])
+    return _finish_generation(plan, response.content)
+
+
+async def arag_node(state: RAGState):
+    """
+    Async variant of rag_node. Embedding and retrieval run in a worker thread so they
+    don't block the event loop; generation uses the async LLM client.
+    """
+    plan = await asyncio.to_thread(_prepare_generation, state["query_context"], state.get("speculation_token"))
+    if isinstance(plan, Command):
+        return plan
+
+    response = await _get_llm().ainvoke(plan["messages"])
+    return _finish_generation(plan, response.content)
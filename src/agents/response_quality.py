@@ -2,9 +2,9 @@ from typing import List, Optional, Dict, Literal
 from pydantic import BaseModel, Field
 from langgraph.graph import StateGraph, END, START
 from langgraph.types import Command
-from langchain_anthropic import ChatAnthropic
 from src.agents.rag import InformationMetadata
-import json
+from src.utils.llm_utils import get_llm
+from src.utils.inclusive_language import GUIDELINES_PATH, GuidelineRule, InclusiveLanguageRewriter, Rewrite
 import os
 import logging
 
@@ -15,7 +15,8 @@ logger = logging.getLogger(__name__)
 CONFIDENCE_THRESHOLD = float(os.getenv("CONFIDENCE_THRESHOLD", "0.7"))
 COMPLETENESS_THRESHOLD = float(os.getenv("COMPLETENESS_THRESHOLD", "0.7"))
 
-COMM_GUIDELINES = json.load(open('data/comms.json', 'rb'))["comms"]
+# The guideline is compiled once into a local matcher; only context-dependent rules go to the LLM
+language_rewriter = InclusiveLanguageRewriter.from_file(GUIDELINES_PATH)
 
 class ConfigError(Exception):
     """An exception class for configuration errors."""
@@ -43,113 +44,210 @@ class ResponseQualityState(BaseModel):
     final_response: Optional[ResponseQualityOutput] = None
 
 
+def _apply_caveats(state: dict):
+    """Response text to review, with caveats added based on confidence/completeness"""
+    modifications = []
+    response_text = ""
+    if "initial_response" in state:
+
+        input_data = ResponseQualityInput(**state["initial_response"])
+
+        response_text = input_data.text
+
+        # Add caveats based on confidence/completeness
+        completeness_score = input_data.metadata.completeness_score
+        confidence_score = input_data.metadata.confidence_score
+
+        if completeness_score < COMPLETENESS_THRESHOLD:
+            response_text = (
+                f"Based on the currently available information:\n\n{response_text}\n\n"
+                "Note: There may be additional resources available. "
+                "Would you like more specific information about any particular aspect?"
+            )
+            modifications.append("Added completeness caveat")
+
+        if confidence_score < CONFIDENCE_THRESHOLD:
+            response_text += (
+                "\n\nFor the most up-to-date and complete information, "
+                "we recommend contacting your local Red Cross office directly."
+            )
+            modifications.append("Added confidence caveat")
+    elif "web_agent_response" in state:
+        response_text = state["web_agent_response"]
+    else:
+        print("No initial_response or web_agent_response in state!")
+    return response_text, modifications
+
+
+def _local_rewrite(response_text: str, modifications: List[str]) -> Optional[Rewrite]:
+    """
+    Replace avoid-terms that have a drop-in preferred term, without an LLM call.
+    None when the guideline exists but no rules could be read from it: the LLM reviews against all of it.
+    """
+    if not language_rewriter.rules:
+        if not language_rewriter.document:
+            raise ConfigError("There are no communication guidelines provided in the data folder.")
+        logger.warning("No rules could be extracted from the communication guidelines, reviewing with the LLM")
+        return None
+
+    rewrite = language_rewriter.rewrite(response_text)
+    if rewrite.replacements:
+        modifications.append(f"Replaced locally: {', '.join(rewrite.replacements)}")
+    return rewrite
+
+
+def _full_review_request(response_text: str):
+    """LLM client and messages for a review against the whole guideline, as stored"""
+    llm = get_llm("haiku")
+
+    system_prompt = f"""You are a response quality assistant for a Red Cross virtual assistant.
+        You need to check whether or not the assistant output follows the INCLUSIVE LANGUAGE GUIDELINE.
+        This means that you need to check if any 'Avoid' terms are present in the input you receive.
+        If you didn't find an 'Avoid' word, OUTPUT EXACTLY THE SAME TEXT YOU RECEIVED.
+        If you found 'Avoid' words, replace them with any one of the 'Preferred Terms' within the same paragraph.
+
+        INCLUSIVE LANGUAGE GUIDELINE:
+        {language_rewriter.document}
+        """
+
+    return llm, [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": response_text}
+    ]
+
+
+def _inclusive_language_review(response_text: str, modifications: List[str]):
+    """
+    Locally rewritten text and, when some of it needs the LLM, the client and messages for its review
+    (None, None when the local rewrite was enough)
+    """
+    rewrite = _local_rewrite(response_text, modifications)
+    if rewrite is None:
+        return (response_text,) + _full_review_request(response_text)
+    if rewrite.context_rules:
+        return (rewrite.text,) + _review_request(rewrite.text, rewrite.context_rules)
+    return rewrite.text, None, None
+
+
+def _review_request(response_text: str, rules: List[GuidelineRule]):
+    """LLM client and messages for rewriting the avoid-terms that depend on context"""
+    llm = get_llm("haiku")
+
+    guideline = "\n".join(f"- {rule.describe()}" for rule in rules)
+    system_prompt = f"""You are a response quality assistant for a Red Cross virtual assistant.
+        The assistant output contains 'Avoid' terms from the INCLUSIVE LANGUAGE GUIDELINE below.
+        Rewrite only the sentences with these terms, using one of the 'Preferred' terms or a rephrasing
+        that fits the sentence and follows the note. Keep everything else EXACTLY THE SAME.
+        Output only the resulting text.
+
+        INCLUSIVE LANGUAGE GUIDELINE:
+        {guideline}
+        """
+
+    return llm, [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": response_text}
+    ]
+
+
+def _final_command(response_text: str) -> Command:
+    # Prepare final output
+    output = ResponseQualityOutput(
+        text=response_text,
+        # original_text=input_data.text,
+        # metadata=input_data.metadata,
+        # modifications_made=modifications
+    )
+
+    # Return Command with state update
+    return Command(
+        goto=END,
+        update={
+            "final_response": output.model_dump()
+        }
+    )
+
+
+def _error_command(state: dict, e: Exception) -> Command:
+    print(f"Error in response quality node: {e}")
+    # Return original response with error caveat
+    if "initial_response" in state and isinstance(state["initial_response"], dict):
+        original_text = state["initial_response"].get("text", "")
+        original_metadata = state["initial_response"].get("metadata", {})
+    else:
+        original_text = ""
+        original_metadata = {}
+
+    error_output = ResponseQualityOutput(
+        text=f"{original_text}\n\nNote: Some of the information could not be completely verified. Please verify information with your local Red Cross office.",
+        # original_text=original_text,
+        # metadata=original_metadata,
+        # modifications_made=["Added error caveat"]
+    )
+
+    return Command(
+        goto=END,
+        update={
+            "final_response": error_output.model_dump(),
+            "error": str(e)
+        }
+    )
+
+
 def response_quality_node(state: dict) -> Command:
     """
     Evaluates response quality and returns improved version with quality context.
     Returns Command object with next node and state updates.
     """
     try:
-        if "initial_response" in state:
-
-            input_data = ResponseQualityInput(**state["initial_response"])
-    
-            modifications = []
-            response_text = input_data.text
-    
-            # Add caveats based on confidence/completeness
-            completeness_score = input_data.metadata.completeness_score
-            confidence_score = input_data.metadata.confidence_score
-    
-            if completeness_score < COMPLETENESS_THRESHOLD:
-                response_text = (
-                    f"Based on the currently available information:\n\n{response_text}\n\n"
-                    "Note: There may be additional resources available. "
-                    "Would you like more specific information about any particular aspect?"
-                )
-                modifications.append("Added completeness caveat")
-    
-            if confidence_score < CONFIDENCE_THRESHOLD:
-                response_text += (
-                    "\n\nFor the most up-to-date and complete information, "
-                    "we recommend contacting your local Red Cross office directly."
-                )
-                modifications.append("Added confidence caveat")
-        elif "web_agent_response" in state:
-            response_text = state["web_agent_response"]
-        else:
-            print("No initial_response or web_agent_response in state!")
-
-        # Review alignment with RedCross tone using Claude
+        response_text, modifications = _apply_caveats(state)
+
+        # Inclusive language: local replacements first, Claude only for context-dependent terms
+        # (or for the whole guideline when no rules could be read from it)
         try:
+            response_text, llm, messages = _inclusive_language_review(response_text, modifications)
 
-            llm = ChatAnthropic(
-                model="claude-3-5-haiku-20241022",
-                temperature=0,
-                api_key=os.getenv("ANTHROPIC_API_KEY"),
-            )
+            if llm is not None:
+                reviewed_text = llm.invoke(messages)
+                language_rewriter.record_llm_review()
+
+                if reviewed_text.content != response_text:
+                    response_text = reviewed_text.content
+                    modifications.append("Applied inclusive language guidelines")
+
+        except Exception as e:
+            print(f"Warning: Failed to check inclusive language: {e}")
 
-            if not COMM_GUIDELINES:
-                raise ConfigError("There are no communication guidelines provided in the data folder.")
+        return _final_command(response_text)
 
-            system_prompt = f"""You are a response quality assistant for a Red Cross virtual assistant.
-                You need to check whether or not the assistant output follows the INCLUSIVE LANGUAGE GUIDELINE.
-                This means that you need to check if any 'Avoid' terms are present in the input you receive.
-                If you didn't find an 'Avoid' word, OUTPUT EXACTLY THE SAME TEXT YOU RECEIVED.
-                If you found 'Avoid' words, replace them with any one of the 'Preferred Terms' within the same paragraph.
+    except Exception as e:
+        return _error_command(state, e)
 
-                INCLUSIVE LANGUAGE GUIDELINE:
-                {COMM_GUIDELINES}
-                """
 
-            reviewed_text = llm.invoke([
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": response_text}
-            ])
+async def aresponse_quality_node(state: dict) -> Command:
+    """
+    Async variant of response_quality_node, for graphs run with ainvoke.
+    """
+    try:
+        response_text, modifications = _apply_caveats(state)
+
+        # Inclusive language: local replacements first, Claude only for context-dependent terms
+        # (or for the whole guideline when no rules could be read from it)
+        try:
+            response_text, llm, messages = _inclusive_language_review(response_text, modifications)
+
+            if llm is not None:
+                reviewed_text = await llm.ainvoke(messages)
+                language_rewriter.record_llm_review()
 
-            if reviewed_text.content != response_text:
-                response_text = reviewed_text.content
-                modifications.append("Applied inclusive language guidelines")
+                if reviewed_text.content != response_text:
+                    response_text = reviewed_text.content
+                    modifications.append("Applied inclusive language guidelines")
 
         except Exception as e:
             print(f"Warning: Failed to check inclusive language: {e}")
 
-        # Prepare final output
-        output = ResponseQualityOutput(
-            text=response_text,
-            # original_text=input_data.text,
-            # metadata=input_data.metadata,
-            # modifications_made=modifications
-        )
-
-        # Return Command with state update
-        return Command(
-            goto=END,
-            update={
-                "final_response": output.model_dump()
-            }
-        )
+        return _final_command(response_text)
 
     except Exception as e:
-        print(f"Error in response quality node: {e}")
-        # Return original response with error caveat
-        if "initial_response" in state and isinstance(state["initial_response"], dict):
-            original_text = state["initial_response"].get("text", "")
-            original_metadata = state["initial_response"].get("metadata", {})
-        else:
-            original_text = ""
-            original_metadata = {}
-
-        error_output = ResponseQualityOutput(
-            text=f"{original_text}\n\nNote: Some of the information could not be completely verified. Please verify information with your local Red Cross office.",
-            # original_text=original_text,
-            # metadata=original_metadata,
-            # modifications_made=["Added error caveat"]
-        )
-
-        return Command(
-            goto=END,
-            update={
-                "final_response": error_output.model_dump(),
-                "error": str(e)
-            }
-        )
+        return _error_command(state, e)
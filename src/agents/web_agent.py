@@ -1,21 +1,62 @@
 from dotenv import load_dotenv
-from typing import List, Dict
+from typing import List, Dict, Optional
 import re
 from urllib.parse import urlparse
 from langchain_community.tools import DuckDuckGoSearchResults
 from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
-from langchain_anthropic import ChatAnthropic
 from langgraph.types import Command
 from langgraph.graph import END
-import time
+from src.utils.llm_utils import get_llm
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from src.utils.caching import SQLiteTTLCache, TTLCache
+from src.utils.search_cache import CachedSearch
+from src.utils.site_mirror import SITE_MIRROR_ENABLED, format_results, site_mirror, trusted_sites_for
+import asyncio
+import os
+import threading
 
 load_dotenv()
 
-llm = ChatAnthropic(
-    model="claude-3-5-haiku-20241022",
-    temperature=0
+# Contact lookups run concurrently, each bounded by a timeout, and are cached per domain
+# for a long time since an organisation's contact page rarely changes
+CONTACT_LOOKUP_WORKERS = int(os.getenv("CONTACT_LOOKUP_WORKERS", "4"))
+CONTACT_LOOKUP_TIMEOUT = float(os.getenv("CONTACT_LOOKUP_TIMEOUT", "5"))
+# Searches that may run at once, including those still running after their lookup timed out
+CONTACT_SEARCH_SLOTS = int(os.getenv("CONTACT_SEARCH_SLOTS", str(CONTACT_LOOKUP_WORKERS)))
+CONTACT_CACHE_SIZE = int(os.getenv("CONTACT_CACHE_SIZE", "2048"))
+CONTACT_CACHE_TTL = float(os.getenv("CONTACT_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Search tools are built once and shared
+search_tool = DuckDuckGoSearchResults(
+    api_wrapper=DuckDuckGoSearchAPIWrapper(region="nl-nl", max_results=2)  # time='y' limit to past year (m, d, w)
+)
+contact_search_tool = DuckDuckGoSearchResults(api_wrapper=DuckDuckGoSearchAPIWrapper(region="nl-nl", max_results=1))
+
+# Web search results keyed on the full query (with its site: restrictions), kept on disk
+# so repeated fallbacks don't hit DuckDuckGo again; set the path empty for an in-memory cache
+WEB_SEARCH_CACHE_PATH = os.getenv("WEB_SEARCH_CACHE_PATH", "./cache/web_search.sqlite")
+WEB_SEARCH_CACHE_SIZE = int(os.getenv("WEB_SEARCH_CACHE_SIZE", "5000"))
+WEB_SEARCH_CACHE_TTL = float(os.getenv("WEB_SEARCH_CACHE_TTL", str(24 * 3600)))
+# Older results are still served for this long while a background search refreshes them
+WEB_SEARCH_STALE_TTL = float(os.getenv("WEB_SEARCH_STALE_TTL", str(3 * 24 * 3600)))
+
+if WEB_SEARCH_CACHE_PATH:
+    web_search_cache = SQLiteTTLCache(
+        WEB_SEARCH_CACHE_PATH, maxsize=WEB_SEARCH_CACHE_SIZE, ttl=WEB_SEARCH_CACHE_TTL + WEB_SEARCH_STALE_TTL
+    )
+else:
+    web_search_cache = TTLCache(maxsize=WEB_SEARCH_CACHE_SIZE, ttl=WEB_SEARCH_CACHE_TTL + WEB_SEARCH_STALE_TTL)
+# search_tool.run can be swapped for another provider: any callable from query to results text
+cached_search = CachedSearch(
+    search_tool.run, web_search_cache, ttl=WEB_SEARCH_CACHE_TTL, stale_ttl=WEB_SEARCH_STALE_TTL
 )
 
+contact_cache = TTLCache(maxsize=CONTACT_CACHE_SIZE, ttl=CONTACT_CACHE_TTL)
+contact_pool = ThreadPoolExecutor(max_workers=CONTACT_LOOKUP_WORKERS, thread_name_prefix="contact_lookup")
+_search_slots = threading.BoundedSemaphore(CONTACT_SEARCH_SLOTS)
+_in_flight = {}
+_in_flight_lock = threading.RLock()  # re-entered when a lookup finishes before its callback is added
+
 
 def extract_urls_from_text(text: str) -> List[str]:
     """Extract all URLs from text using regex."""
@@ -35,72 +76,141 @@ def extract_urls_from_text(text: str) -> List[str]:
 
     return list(set([u.lower() for u in clean_urls]))
 
-def get_contact_info(initial_results: str) -> List[Dict]:
-    """Perform a second search to get the contact information."""
+def _lookup_contact(web_domain: str) -> str:
+    """
+    Contact search for one domain, given up after CONTACT_LOOKUP_TIMEOUT seconds.
+    The search tool has no timeout of its own, so it runs on a separate thread: a hung search
+    then gives the pool worker back instead of holding it; if it does finish, it still fills the cache.
+    Each search holds one of CONTACT_SEARCH_SLOTS until it returns, so hung searches can't pile up:
+    when every slot is taken the lookup is rejected right away.
+    """
+    slots = _search_slots
+    if not slots.acquire(blocking=False):
+        raise RuntimeError("all contact search slots are taken by running searches")
+    search = Future()
 
-    contact_results = []
-    contact_wrapper = DuckDuckGoSearchAPIWrapper(region="nl-nl", max_results=1)
-    contact_search_tool = DuckDuckGoSearchResults(api_wrapper=contact_wrapper)
+    def run_search():
+        try:
+            # Simple contact-specific search query
+            contact_info = contact_search_tool.run(f"{web_domain} contact")
+            contact_cache.set(web_domain, contact_info)
+            search.set_result(contact_info)
+        except Exception as e:
+            search.set_exception(e)
+        finally:
+            slots.release()
+
+    try:
+        threading.Thread(target=run_search, name=f"contact_search_{web_domain}", daemon=True).start()
+    except Exception:
+        slots.release()
+        raise
+    return search.result(timeout=CONTACT_LOOKUP_TIMEOUT)
+
+
+def _contact_future(web_domain: str) -> Future:
+    """Running lookup for the domain, shared by every request that needs it at the same time"""
+    with _in_flight_lock:
+        future = _in_flight.get(web_domain)
+        if future is None:
+            future = _in_flight[web_domain] = contact_pool.submit(_lookup_contact, web_domain)
+            future.add_done_callback(lambda _: _forget_in_flight(web_domain))
+        return future
+
+
+def _forget_in_flight(web_domain: str) -> None:
+    with _in_flight_lock:
+        _in_flight.pop(web_domain, None)
+
+
+def get_contact_info(initial_results: str) -> List[Dict]:
+    """Perform a second search per found domain to get the contact information."""
 
     web_domains = extract_urls_from_text(initial_results)
     pattern = re.compile(r'^(?!.*\d).*$')
     web_domains = [d for d in web_domains if pattern.match(d)]
 
+    contact_results = {}
+    futures = {}
     for web_domain in web_domains:
-        # Create simple contact-specific search query
-        contact_query = f"{web_domain} contact"
+        contact_info = contact_cache.get(web_domain)
+        if contact_info is not None:
+            contact_results[web_domain] = contact_info
+        else:
+            futures[_contact_future(web_domain)] = web_domain
 
-        try:
-            contact_info = contact_search_tool.run(contact_query)
-            contact_results.append({
-                "domain": web_domain,
-                "contact_info": contact_info
-            })
-            time.sleep(0.01)
-        except Exception as e:
-            print(f"Error getting contact info for {web_domain}: {e}")
+    if futures:
+        # Lookups run side by side and each gives up after CONTACT_LOOKUP_TIMEOUT, so that is all we wait
+        done, not_done = wait(futures, timeout=CONTACT_LOOKUP_TIMEOUT)
+        for future in done:
+            if future.cancelled():
+                continue
+            try:
+                contact_results[futures[future]] = future.result()
+            except TimeoutError:
+                print(f"Timed out getting contact info for {futures[future]}")
+            except Exception as e:
+                print(f"Error getting contact info for {futures[future]}: {e}")
+        for future in not_done:
+            # Still queued behind other lookups: drop it rather than run it after we stopped waiting
+            future.cancel()
+            print(f"Timed out getting contact info for {futures[future]}")
 
-    return contact_results
+    return [
+        {"domain": web_domain, "contact_info": contact_results[web_domain]}
+        for web_domain in web_domains if web_domain in contact_results
+    ]
 
 def web_search(query: str) -> dict:
-    wrapper = DuckDuckGoSearchAPIWrapper(region="nl-nl", max_results=2) # time='y' limit to past year (m, d, w)
-    search_tool = DuckDuckGoSearchResults(api_wrapper=wrapper)
-    results = search_tool.run(query)
+    results = cached_search(query)
     # Get contact information for found sources
     contact_info = get_contact_info(results)
     return {
         "web_response": {
             "results": results,
             "contact_details": contact_info,
-            "query_used": query
+            "query_used": query,
+            "source": "web"
         }
     }
 
-def prompt_search(query_context: dict) -> dict:
+def mirror_search(query_context: dict, relevant_sites: List[str]) -> Optional[dict]:
     """
-    Uses query understanding output to perform targeted web searches.
+    Search the local mirror of the trusted sites (see site_mirror) before going online.
+    Returns results shaped like web_search's, or None when the mirror has nothing relevant.
+    """
+    if not SITE_MIRROR_ENABLED:
+        return None
+    # Same query text as the RAG search: the question plus the extracted entities
+    query = " ".join([query_context["original_query"]] + [str(v) for v in query_context["entities"].values()])
+    hits = site_mirror.search(query, relevant_sites)
+    if not hits:
+        return None
+    return {
+        "web_response": {
+            "results": format_results(hits),
+            "contact_details": site_mirror.contacts(sorted({hit["site"] for hit in hits})),
+            "query_used": query,
+            "source": "mirror"
+        }
+    }
+
+def _search_query_request(query_context: dict):
+    """
+    Trusted sites and LLM messages used to build the targeted web search.
 
     Args:
         query_context: {
             "original_query": str,
-            "domains": list[str],  # e.g. ["food", "shelter"]
+            "domains": list[str],  # e.g. ["Food & Clothing", "Shelter"]
             "entities": dict,      # e.g. {"location": "Amsterdam", "date": "2024"}
             "language": str        # e.g. "english"
         }
     """
 
     # Map domains to relevant websites - otherwise could get things from newspapers "the red cross did this last year"
-    domain_sites = {
-        "food": ["voedselbank.nl", "voedselbankennederland.nl"],
-        "shelter": ["deregenboog.org", "opvang.nl"],
-        "healthcare": ["ggd.nl", "zorgverzekeringslijn.nl"],
-        "domestic_violence": ["veiligthuis.nl", "blijfgroep.nl"],
-        "education": ["amsterdam.nl/onderwijs"],
-        "refugees": ["vluchtelingenwerk.nl", "refugeehelp.nl"]
-    }
-
-    # Get relevant sites based on query domains
-    relevant_sites = ["rodekruis.nl"]  # Always include Red Cross
+    # Red Cross is always included, see site_mirror.trusted_sites_for
+    relevant_sites = trusted_sites_for(query_context["domains"])
     location = query_context["entities"].get("location", "Netherlands")
     # if location.lower() == "amsterdam":
     #     relevant_sites.append("amsterdam.nl")
@@ -115,18 +225,13 @@ def prompt_search(query_context: dict) -> dict:
     # elif location.lower() == "den haag":
     #     relevant_sites.append("denhaag.nl")
 
-    # Add domain-specific sites
-    for domain in query_context["domains"]:
-        if domain in domain_sites:
-            relevant_sites.extend(domain_sites[domain])
-
     # Create search query builder prompt
     system_prompt = """
     Create a simple search query (maximum 10 words) in English or Dutch that will find help information.
     Return ONLY the search query, no explanation or strategy.
     """
 
-    response = llm.invoke([
+    messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": f"""
             Original query: {query_context['original_query']}
@@ -134,20 +239,58 @@ def prompt_search(query_context: dict) -> dict:
             Domains: {query_context['domains']}
             Language: {query_context['language']}
         """}
-    ])
+    ]
+    return relevant_sites, messages
 
-    # Build final search query
-    search_query = response.content
+
+def _full_query(search_query: str, relevant_sites: List[str]) -> str:
+    """Restrict the generated search query to the trusted sites"""
     print(search_query)
     domain_priority = " OR ".join(f"site:{site}" for site in relevant_sites)
-    full_query = f"{search_query} {domain_priority}"
+    return f"{search_query} {domain_priority}"
+
+
+def prompt_search(query_context: dict) -> dict:
+    """
+    Uses query understanding output to perform targeted web searches.
+
+    Args:
+        query_context: {
+            "original_query": str,
+            "domains": list[str],  # e.g. ["food", "shelter"]
+            "entities": dict,      # e.g. {"location": "Amsterdam", "date": "2024"}
+            "language": str        # e.g. "english"
+        }
+    """
+    relevant_sites, messages = _search_query_request(query_context)
+    # The mirror needs neither the query-building LLM call nor a live search
+    mirrored = mirror_search(query_context, relevant_sites)
+    if mirrored is not None:
+        return mirrored
+    response = get_llm("haiku").invoke(messages)
+
+    # Build final search query
+    full_query = _full_query(response.content, relevant_sites)
 
     # Perform search
     results = web_search(full_query)
 
     return results
 
-def search_summary(query_context: dict, search_result: dict) -> dict:
+
+async def aprompt_search(query_context: dict) -> dict:
+    """Async variant of prompt_search; the blocking DuckDuckGo search runs in a worker thread"""
+    relevant_sites, messages = _search_query_request(query_context)
+    mirrored = await asyncio.to_thread(mirror_search, query_context, relevant_sites)
+    if mirrored is not None:
+        return mirrored
+    response = await get_llm("haiku").ainvoke(messages)
+
+    full_query = _full_query(response.content, relevant_sites)
+
+    return await asyncio.to_thread(web_search, full_query)
+
+def _summary_messages(query_context: dict, search_result: dict) -> list:
 
     summary_system_prompt = """
     You are a Red Cross assistant who helps people in need in the Netherlands.
@@ -169,7 +312,7 @@ def search_summary(query_context: dict, search_result: dict) -> dict:
     Don't provide statistics or non-practical information.
     """
 
-    llm_summary_response = llm.invoke([
+    return [
         {"role": "system", "content": summary_system_prompt},
         {"role": "user", "content": f"""
             Original query: {query_context['original_query']}
@@ -179,12 +322,22 @@ def search_summary(query_context: dict, search_result: dict) -> dict:
             Web Search Results: {search_result["web_response"]["results"]}
             Contact Information found: {search_result["web_response"]["contact_details"]}
         """}
-    ])
+    ]
+
+
+def search_summary(query_context: dict, search_result: dict) -> dict:
+    llm_summary_response = get_llm("haiku").invoke(_summary_messages(query_context, search_result))
 
     summary_response = llm_summary_response.content
 
     return {"web_agent_response": summary_response}
 
+
+async def asearch_summary(query_context: dict, search_result: dict) -> dict:
+    llm_summary_response = await get_llm("haiku").ainvoke(_summary_messages(query_context, search_result))
+
+    return {"web_agent_response": llm_summary_response.content}
+
 def web_agent_node(state: dict):
     query_context = state.get("query_context")
     search_result = prompt_search(query_context)
@@ -197,6 +350,20 @@ def web_agent_node(state: dict):
         }
     )
 
+
+async def aweb_agent_node(state: dict):
+    """Async variant of web_agent_node, for graphs run with ainvoke"""
+    query_context = state.get("query_context")
+    search_result = await aprompt_search(query_context)
+    web_agent_response = await asearch_summary(query_context, search_result)
+    print(web_agent_response)
+    return Command(
+        goto=END,
+        update={
+            "web_agent_response": web_agent_response
+        }
+    )
+
 if __name__ == "__main__":
     test_context = {
         "original_query": "Where can I get a doctor for my sick child?",
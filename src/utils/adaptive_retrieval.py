@@ -0,0 +1,36 @@
+from typing import Dict, List, Tuple
+
+
+def choose_k(hits: List[Dict], min_k: int = 1, default_k: int = 3, max_k: int = 6,
+             gap: float = 0.15, dominance_gap: float = 0.3, close_margin: float = 0.05) -> Tuple[int, str]:
+    """
+    Decide how many of the ranked hits to keep, from the shape of their distances.
+    - one hit far ahead of the rest (distance gap >= dominance_gap) -> keep it alone
+    - a jump of at least `gap` between consecutive hits -> cut there
+    - the first default_k hits within close_margin of each other -> ambiguous, widen to max_k
+    - otherwise default_k
+    Lexical-only hits have no distance and are treated as tied with the hit before them.
+    Returns (k, reason).
+    """
+    if not hits:
+        return 0, "no hits"
+    if len(hits) == 1:
+        return 1, "single hit"
+
+    distances = []
+    for hit in hits[:max_k]:
+        distance = hit.get("distance")
+        distances.append(distance if distance is not None else (distances[-1] if distances else 0.0))
+
+    if distances[1] - distances[0] >= dominance_gap:
+        return max(min_k, 1), f"top hit dominates (gap {distances[1] - distances[0]:.2f})"
+
+    for i in range(max(min_k, 1), len(distances)):
+        if distances[i] - distances[i - 1] >= gap:
+            return i, f"distance gap {distances[i] - distances[i - 1]:.2f} after hit {i}"
+
+    head = distances[:default_k]
+    if len(head) == default_k and head[-1] - head[0] <= close_margin:
+        return len(distances), f"top {default_k} hits within {close_margin}, widened"
+
+    return min(default_k, len(distances)), "default"
@@ -0,0 +1,71 @@
+from typing import Dict, List, Tuple
+import re
+
+WORD_PATTERN = re.compile(r"\S+")
+
+
+def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
+    """
+    Split text into windows of at most chunk_size words, consecutive windows sharing `overlap` words.
+    Texts that fit in one window are returned unchanged; anything that isn't a string
+    (a NaN from an empty CSV cell) counts as empty text.
+    """
+    if overlap >= chunk_size:
+        raise ValueError("Chunk overlap must be smaller than the chunk size")
+    if not isinstance(text, str):
+        text = ""
+    words = WORD_PATTERN.findall(text)
+    if len(words) <= chunk_size:
+        return [text]
+
+    chunks = []
+    step = chunk_size - overlap
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_size]))
+        if start + chunk_size >= len(words):
+            break
+    return chunks
+
+
+def chunk_documents(ids: List[str], documents: List[str], metadatas: List[Dict],
+                    chunk_size: int, overlap: int) -> Tuple[List[str], List[str], List[Dict]]:
+    """
+    Expand documents into chunks. Chunk ids are "<parent id>#<n>" and every chunk's metadata
+    is a copy of its parent's plus parent_id, chunk_index and chunk_count.
+    """
+    chunk_ids, chunk_documents_, chunk_metadatas = [], [], []
+    for parent_id, document, metadata in zip(ids, documents, metadatas):
+        chunks = chunk_text(document, chunk_size, overlap)
+        for index, chunk in enumerate(chunks):
+            chunk_ids.append(f"{parent_id}#{index}")
+            chunk_documents_.append(chunk)
+            chunk_metadatas.append({**metadata, "parent_id": parent_id, "chunk_index": index, "chunk_count": len(chunks)})
+    return chunk_ids, chunk_documents_, chunk_metadatas
+
+
+def collapse_chunks(hits: List[Dict], max_chunks_per_parent: int = 2) -> List[Dict]:
+    """
+    Collapse chunk hits back to their parent offer, keeping the parent's rank of its best chunk.
+    Up to max_chunks_per_parent matching chunks are joined in document order, so only the
+    relevant paragraphs of a long offer reach the prompt. Hits without parent_id pass through.
+    """
+    collapsed = {}
+    for hit in hits:
+        parent_id = (hit.get("metadata") or {}).get("parent_id")
+        if parent_id is None:
+            collapsed[hit["id"]] = {**hit, "chunks": [hit]}
+            continue
+        entry = collapsed.get(parent_id)
+        if entry is None:
+            collapsed[parent_id] = {**hit, "id": parent_id, "chunks": [hit]}
+        elif len(entry["chunks"]) < max_chunks_per_parent:
+            entry["chunks"].append(hit)
+
+    results = []
+    for entry in collapsed.values():
+        chunks = entry.pop("chunks")
+        if len(chunks) > 1:
+            chunks.sort(key=lambda chunk: chunk["metadata"].get("chunk_index", 0))
+            entry["document"] = "\n...\n".join(chunk["document"] for chunk in chunks)
+        results.append(entry)
+    return results
@@ -0,0 +1,99 @@
+from typing import Dict, List, Optional
+import numpy as np
+
+# Rough Claude tokenizer ratio for mixed Dutch/English text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _unit(vector) -> Optional[np.ndarray]:
+    if vector is None:
+        return None
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+
+def pack_context(results_by_domain: Dict[str, List[Dict]], token_budget: int, mmr_lambda: float = 0.7) -> List[Dict]:
+    """
+    Choose which retrieved hits go into the prompt.
+    1. Deduplicate by document id: an offer found under several domains is kept once.
+    2. Seed with the best hit of every domain so each requested domain stays covered; a seed
+       is truncated to its domain's share of the remaining budget if it doesn't fit.
+    3. Fill the rest with maximal marginal relevance (relevance minus similarity to what is
+       already selected), so near-identical offers don't take up the budget.
+    Stops at `token_budget` estimated tokens. Returns the selected hits, each with a "domains" list.
+    """
+    candidates = {}
+    for domain, hits in results_by_domain.items():
+        for rank, hit in enumerate(hits):
+            entry = candidates.get(hit["id"])
+            if entry is None:
+                entry = candidates[hit["id"]] = {
+                    **hit,
+                    "domains": [],
+                    "relevance": 0.0,
+                    "tokens": estimate_tokens(hit["document"] or ""),
+                    "unit_embedding": _unit(hit.get("embedding")),
+                }
+            entry["domains"].append(domain)
+            # Fused rank score when available, otherwise rank within the domain
+            entry["relevance"] = max(entry["relevance"], hit.get("rrf_score", 1.0 / (60 + rank + 1)))
+
+    if not candidates:
+        return []
+    top_relevance = max(entry["relevance"] for entry in candidates.values())
+    for entry in candidates.values():
+        entry["relevance"] /= top_relevance
+
+    selected = []
+    used_tokens = 0
+
+    def select(entry, truncate_to=None):
+        nonlocal used_tokens
+        limit = token_budget - used_tokens if truncate_to is None else min(truncate_to, token_budget - used_tokens)
+        if entry["tokens"] > limit:
+            if truncate_to is None or limit <= 0:
+                return False
+            # Keep at least part of the only hit we have for a domain
+            entry = {**entry, "document": entry["document"][:limit * CHARS_PER_TOKEN], "tokens": limit}
+        selected.append(entry)
+        used_tokens += entry["tokens"]
+        del candidates[entry["id"]]
+        return True
+
+    # Coverage first: best hit of each domain, each one cut to its share of what is left of the
+    # budget so that an oversized hit of the first domain can't leave nothing for the others
+    uncovered = [domain for domain, hits in results_by_domain.items() if hits]
+    while uncovered:
+        domain = uncovered.pop(0)
+        if any(domain in entry["domains"] for entry in selected):
+            continue
+        for hit in results_by_domain[domain]:
+            if hit["id"] in candidates:
+                select(candidates[hit["id"]], truncate_to=(token_budget - used_tokens) // (len(uncovered) + 1))
+                break
+
+    # Then maximal marginal relevance until the budget is used up
+    while candidates and used_tokens < token_budget:
+        def mmr_score(entry):
+            vector = entry["unit_embedding"]
+            redundancy = max(
+                (float(np.dot(vector, chosen["unit_embedding"]))
+                 for chosen in selected
+                 if vector is not None and chosen["unit_embedding"] is not None),
+                default=0.0
+            )
+            return mmr_lambda * entry["relevance"] - (1 - mmr_lambda) * redundancy
+
+        best = max(candidates.values(), key=mmr_score)
+        if not select(best):
+            # Doesn't fit; try smaller ones
+            del candidates[best["id"]]
+
+    for entry in selected:
+        entry.pop("unit_embedding", None)
+    return selected
@@ -1,54 +1,90 @@
-def process_csv_to_collection(csv_path, collection):
-    import pandas as pd
-    import json
-
-    # Read CSV file from wherever
-    df = pd.read_csv(csv_path)
-
-    # Validate required column - we need the list of columns and rename/normalize names
-    # there should only been 1 text column - all the text columns concatenated to become a document
-    column_list = []
-    for col in column_list:
-        if col not in df.columns:
-            raise ValueError(f"CSV must contain a {col} column")
-
-    # Initialize lists for documents and metadata
-    documents = []
-    metadatas = []
-
-    # Process each row
-    for _, row in df.iterrows():
-        # Add document text
-        documents.append(row['text'])
-
-        # Create metadata dictionary
-        metadata = {}
-
-        # Add standard metadata fields if they exist
-        for field in ['source', 'last_updated', 'domain']:
-            if field in row and pd.notna(row[field]):
-                metadata[field] = row[field]
-
-        # Process contact information - this can change based on the actual data
-        contact = {}
-        if 'email' in row and pd.notna(row['email']):
-            contact['email'] = row['email']
-        if 'phone' in row and pd.notna(row['phone']):
-            contact['phone'] = str(row['phone'])  # Convert to string in case it's numeric
-
-        if contact:
-            metadata['contact'] = json.dumps(contact)
-
-        metadatas.append(metadata)
-
-    # Generate IDs
-    ids = [f"doc_{i}" for i in range(len(documents))]
-
-    # Add to collection
-    collection.add(
-        documents=documents,
-        metadatas=metadatas,
-        ids=ids
+from typing import Dict, Iterator, List, Optional, Tuple
+import json
+import pandas as pd
+
+from src.utils.ingestion import DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, Throughput, embedding_pool, ingest
+
+# there should only be 1 text column - all the text columns concatenated to become a document
+TEXT_COLUMN = 'text'
+METADATA_FIELDS = ['source', 'last_updated', 'domain']
+CONTACT_FIELDS = ['email', 'phone']
+# Read everything as strings: no per-chunk type inference, and phone numbers keep their leading zeros
+CSV_DTYPES = {column: "string" for column in [TEXT_COLUMN] + METADATA_FIELDS + CONTACT_FIELDS}
+
+
+def _contact_json(chunk: pd.DataFrame) -> pd.Series:
+    """JSON contact object per row, built column-wise; rows without contact details get NA"""
+    pieces = [
+        (f'"{field}": ' + chunk[field].map(json.dumps, na_action='ignore')).rename(field)
+        for field in CONTACT_FIELDS if field in chunk.columns
+    ]
+    if not pieces:
+        return pd.Series(pd.NA, index=chunk.index, dtype="string")
+    # stack() drops missing values, so only the fields that are present end up in each object
+    joined = pd.concat(pieces, axis=1).stack().groupby(level=0).agg(", ".join)
+    return ("{" + joined + "}").reindex(chunk.index)
+
+
+def iter_csv_batches(csv_path, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[Tuple[List[str], List[str], List[Dict]]]:
+    """
+    Stream the CSV in chunks of batch_size rows and yield (ids, documents, metadatas) per chunk,
+    so memory stays flat whatever the size of the export.
+    """
+    wanted = set(CSV_DTYPES)
+    reader = pd.read_csv(
+        csv_path,
+        chunksize=batch_size,
+        dtype=CSV_DTYPES,
+        usecols=lambda column: column in wanted
     )
 
-    return collection
\ No newline at end of file
+    offset = 0
+    for chunk in reader:
+        # Validate required column
+        if TEXT_COLUMN not in chunk.columns:
+            raise ValueError(f"CSV must contain a {TEXT_COLUMN} column")
+
+        documents = chunk[TEXT_COLUMN].fillna("").tolist()
+
+        metadata_frame = chunk[[field for field in METADATA_FIELDS if field in chunk.columns]].copy()
+        metadata_frame['contact'] = _contact_json(chunk)
+        # Chroma doesn't accept missing values, drop them from each row's metadata
+        metadatas = [
+            {field: value for field, value in record.items() if not pd.isna(value)}
+            for record in metadata_frame.to_dict(orient='records')
+        ]
+
+        # Generate IDs
+        ids = [f"doc_{i}" for i in range(offset, offset + len(chunk))]
+        offset += len(chunk)
+
+        yield ids, documents, metadatas
+
+
+def process_csv_to_collection(csv_path, collection, batch_size: Optional[int] = None, workers: Optional[int] = None):
+    batch_size = batch_size or DEFAULT_BATCH_SIZE
+    workers = workers or DEFAULT_WORKERS
+
+    throughput = Throughput()
+    pool = embedding_pool(workers)
+    try:
+        # Read enough rows per chunk to give every worker one embedding batch
+        for ids, documents, metadatas in iter_csv_batches(csv_path, batch_size=batch_size * max(workers, 1)):
+            ingest(
+                collection,
+                ids=ids,
+                documents=documents,
+                metadatas=metadatas,
+                batch_size=batch_size,
+                workers=workers,
+                throughput=throughput,
+                pool=pool
+            )
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    stats = throughput.report()
+    print(f"Ingested {stats['docs']} documents at {stats['docs_per_second']} docs/sec, peak memory {stats['peak_memory_mb']} MB")
+
+    return collection
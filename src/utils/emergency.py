@@ -0,0 +1,261 @@
+from typing import Callable, Dict, List, Optional
+from pydantic import BaseModel, Field
+from src.utils.text_matching import compile_terms
+import numpy as np
+import json
+import os
+import re
+import threading
+import time
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Extra phrases as {"language": ["phrase", ...]}, merged with the built-in lists
+EMERGENCY_PHRASES_PATH = os.getenv("EMERGENCY_PHRASES_PATH", "data/emergency_phrases.json")
+EMERGENCY_EMBEDDING_CHECK = os.getenv("EMERGENCY_EMBEDDING_CHECK", "true").lower() == "true"
+# Squared L2 distance between unit vectors (2 - 2 * cosine); raise it to catch more paraphrases
+EMERGENCY_MAX_DISTANCE = float(os.getenv("EMERGENCY_MAX_DISTANCE", "0.55"))
+# How many words before or after a CONTEXT_PHRASES match a context marker may be
+EMERGENCY_CONTEXT_WINDOW = int(os.getenv("EMERGENCY_CONTEXT_WINDOW", "3"))
+
+# Phrases that on their own mean immediate danger, a medical emergency or a threat to life.
+# Generic words ("emergency shelter", "urgent food") are left out on purpose: those are regular requests.
+EMERGENCY_PHRASES = {
+    "english": [
+        "hitting me", "hits me", "beating me", "beats me", "hurting me", "attacking me", "attacked me",
+        "choking me", "strangling me", "raped", "sexually assaulted", "going to kill me", "wants to kill me",
+        "will kill me", "threatening to kill", "kill myself", "killing myself", "end my life", "suicidal",
+        "want to die", "overdosed", "not breathing", "can't breathe", "cannot breathe", "cant breathe",
+        "bleeding a lot", "bleeding heavily", "severe bleeding", "has a knife", "has a gun", "locked me in",
+        "not safe right now", "on fire", "drowning", "need an ambulance",
+    ],
+    "dutch": [
+        "slaat me", "slaat mij", "mishandelt me", "mishandelt mij", "wil me vermoorden",
+        "gaat me vermoorden", "vermoordt me", "mezelf van kant maken", "wil dood",
+        "kan niet ademen", "ademt niet", "bloedt hevig", "bloedt veel",
+        "heeft een mes", "heeft een pistool", "staat in brand", "verdrinkt", "ambulance nodig",
+    ],
+    "arabic": [
+        "يضربني", "اغتصبني", "سيقتلني", "يريد قتلي", "أريد أن أموت", "لا أستطيع التنفس", "معه سكين", "إسعاف",
+    ],
+    "ukrainian": [
+        "мене б'є", "б'є мене", "зґвалтував", "вб'є мене", "хоче мене вбити", "хочу померти", "не можу дихати",
+        "має ніж", "викличте швидку",
+    ],
+    "russian": [
+        "меня бьёт", "бьёт меня", "меня бьет", "бьет меня", "изнасиловали", "убьёт меня", "убьет меня",
+        "хочет меня убить", "хочу умереть", "не могу дышать", "у него нож", "вызовите скорую",
+    ],
+    "persian": [
+        "مرا می‌زند", "منو میزنه", "مرا می‌کشد", "می‌خواهم بمیرم", "نمی‌توانم نفس بکشم",
+    ],
+    "turkish": [
+        "beni dövüyor", "bana vuruyor", "beni öldürecek", "ölmek istiyorum", "nefes alamıyorum", "tehlikedeyim",
+        "ambulans çağırın",
+    ],
+    "french": [
+        "me frappe", "violée", "violé", "va me tuer", "me suicider", "veux mourir", "ne peux pas respirer",
+        "saigne beaucoup",
+    ],
+    "spanish": [
+        "me pega", "me está pegando", "me violaron", "me va a matar", "quiero morir", "no puedo respirar",
+        "sangrando mucho",
+    ],
+    "german": [
+        "schlägt mich", "bringt mich um", "will sterben", "kann nicht atmen", "blutet stark",
+    ],
+}
+
+# Phrases that just as often appear in information questions ("what is the suicide hotline number",
+# "en peligro de extinción"): they only count together with CONTEXT_MARKERS, otherwise the embedding
+# check (and after it the LLM) decides
+CONTEXT_PHRASES = {
+    "english": [
+        "rape", "suicide", "overdose", "in danger", "unconscious", "heart attack", "seizure", "poisoned",
+        "kidnapped", "trafficked", "call 112",
+    ],
+    "dutch": ["verkracht", "zelfmoord", "overdosis", "in gevaar", "bewusteloos", "hartaanval", "ontvoerd", "bel 112"],
+    "arabic": ["اغتصاب", "انتحار", "في خطر", "فاقد الوعي", "نوبة قلبية", "نزيف"],
+    "ukrainian": ["зґвалтування", "самогубство", "в небезпеці", "непритомний", "непритомна", "серцевий напад", "кровотеча"],
+    "russian": ["изнасилование", "самоубийство", "в опасности", "без сознания", "сердечный приступ", "кровотечение"],
+    "persian": ["تجاوز", "خودکشی", "در خطر", "بیهوش", "سکته قلبی", "خونریزی"],
+    "turkish": ["tecavüz", "intihar", "kanama", "bilinçsiz", "kalp krizi"],
+    "french": ["en danger", "inconscient", "crise cardiaque"],
+    "spanish": ["violación", "suicidio", "en peligro", "inconsciente", "ataque al corazón"],
+    "german": ["vergewaltigt", "selbstmord", "suizid", "in gefahr", "bewusstlos", "herzinfarkt"],
+}
+
+# First-person subjects and urgency words, per language, that make a CONTEXT_PHRASES match of that
+# language an emergency when they are within EMERGENCY_CONTEXT_WINDOW words of it.
+# Possessives ("my", "mijn") are left out: "for my brother" is as common in information questions.
+CONTEXT_MARKERS = {
+    "english": [
+        "i am", "i'm", "i was", "i've been", "i feel", "i want", "i think", "we are", "we're", "he is", "she is",
+        "now", "right now", "help me", "help us", "urgent", "urgently", "please hurry",
+    ],
+    "dutch": ["ik ben", "ik word", "ik wil", "ik heb", "we zijn", "hij is", "zij is", "nu", "help me", "dringend", "spoed"],
+    "arabic": ["أنا", "انا", "الآن", "ساعدني", "ساعدوني", "عاجل"],
+    "ukrainian": ["я", "зараз", "допоможіть", "терміново"],
+    "russian": ["я", "сейчас", "помогите", "срочно"],
+    "persian": ["من", "الان", "کمک کنید", "فوری"],
+    "turkish": ["ben", "istiyorum", "şimdi", "acil", "imdat", "yardım edin"],
+    "french": ["je suis", "je veux", "j'ai", "maintenant", "aidez-moi", "urgent", "urgence"],
+    "spanish": ["estoy", "yo", "quiero", "voy a", "ahora", "ayúdame", "socorro", "urgente"],
+    "german": ["ich bin", "ich will", "ich habe", "jetzt", "hilf mir", "helft mir", "dringend"],
+}
+
+# Paraphrases the phrase lists can't enumerate, compared by embedding similarity
+EMERGENCY_EXEMPLARS = [
+    "He is hitting me right now",
+    "My partner is beating me and I am scared",
+    "Someone is threatening to kill me",
+    "I am going to hurt myself",
+    "I don't want to live anymore",
+    "My child is not breathing",
+    "Someone collapsed and is not responding",
+    "There is a lot of blood and it won't stop",
+    "I was attacked and I am injured",
+    "Someone is following me and I am afraid for my life",
+    "I am locked in and can't get out",
+    "I took too many pills",
+    "Hij slaat me en ik ben bang",
+    "Ik wil niet meer leven",
+]
+
+
+class EmergencySignal(BaseModel):
+    """Why a query was classified as an emergency"""
+    method: str = Field(description="'phrase' or 'embedding'")
+    matched: str = Field(description="Matched phrase or closest exemplar")
+    language: Optional[str] = Field(default=None, description="Language of the matched phrase list")
+    distance: Optional[float] = Field(default=None, description="Embedding distance to the exemplar")
+
+
+def _normalize(text: str) -> str:
+    # Apostrophe variants (Ukrainian) and zero-width non-joiners (Persian) differ between keyboards
+    return text.replace("’", "'").replace("ʼ", "'").replace("‌", "").replace("‍", "")
+
+
+def load_phrases(path: str = EMERGENCY_PHRASES_PATH) -> Dict[str, List[str]]:
+    """Built-in phrase lists, extended with the phrases in `path` if that file exists"""
+    phrases = {language: list(terms) for language, terms in EMERGENCY_PHRASES.items()}
+    if path and os.path.exists(path):
+        with open(path, "rb") as f:
+            for language, terms in json.load(f).items():
+                phrases.setdefault(language, []).extend(terms)
+    return phrases
+
+
+class EmergencyClassifier:
+    """
+    Local check that runs before the query analysis LLM call: phrase lists per language compiled
+    into one regex, then (optionally) embedding similarity to curated emergency exemplars.
+    It only adds emergencies; queries it lets through still get the LLM's emergency check.
+    """
+
+    def __init__(self, phrases: Dict[str, List[str]], exemplars: List[str] = EMERGENCY_EXEMPLARS,
+                 embed: Optional[Callable[[str], List[float]]] = None, max_distance: float = EMERGENCY_MAX_DISTANCE,
+                 context_phrases: Dict[str, List[str]] = CONTEXT_PHRASES,
+                 context_markers: Dict[str, List[str]] = CONTEXT_MARKERS,
+                 context_window: int = EMERGENCY_CONTEXT_WINDOW):
+        self._language_by_phrase = {}
+        for language, terms in phrases.items():
+            for term in terms:
+                self._language_by_phrase.setdefault(_normalize(term).casefold(), language)
+        self._needs_context = set()
+        for language, terms in context_phrases.items():
+            for term in terms:
+                term = _normalize(term).casefold()
+                if term not in self._language_by_phrase:
+                    self._language_by_phrase[term] = language
+                    self._needs_context.add(term)
+        self._pattern = compile_terms(self._language_by_phrase)
+        self._context_patterns = {
+            language: compile_terms(_normalize(term).casefold() for term in terms)
+            for language, terms in context_markers.items()
+        }
+        self.context_window = context_window
+        self.exemplars = exemplars
+        self.embed = embed
+        self.max_distance = max_distance
+        self._exemplar_vectors = None
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.phrase_matches = 0
+        self.embedding_matches = 0
+        self.total_seconds = 0.0
+
+    def _exemplar_matrix(self) -> np.ndarray:
+        if self._exemplar_vectors is None:
+            vectors = np.asarray([self.embed(exemplar) for exemplar in self.exemplars], dtype=np.float32)
+            self._exemplar_vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        return self._exemplar_vectors
+
+    def _closest_exemplar(self, text: str):
+        vector = np.asarray(self.embed(text), dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        distances = 2 - 2 * self._exemplar_matrix() @ vector
+        best = int(np.argmin(distances))
+        return self.exemplars[best], float(distances[best])
+
+    def _has_context(self, text: str, match: re.Match, language: Optional[str]) -> bool:
+        """Whether a marker of the phrase's language is within context_window words of the match"""
+        pattern = self._context_patterns.get(language)
+        if pattern is None:
+            return False
+        before = text[:match.start()].split()[-self.context_window:] if self.context_window else []
+        after = text[match.end():].split()[:self.context_window]
+        return bool(pattern.search(" ".join(before + [match.group(0)] + after)))
+
+    def _matched_phrase(self, text: str) -> Optional[str]:
+        """First phrase in the text that signals an emergency, taking context into account"""
+        for match in self._pattern.finditer(text):
+            phrase = " ".join(match.group("term").split()).casefold()
+            if phrase not in self._needs_context or self._has_context(text, match, self._language_by_phrase.get(phrase)):
+                return phrase
+        return None
+
+    def classify(self, text: str) -> Optional[EmergencySignal]:
+        """An EmergencySignal if the query looks like an emergency, otherwise None"""
+        start = time.perf_counter()
+        signal = None
+        phrase = self._matched_phrase(_normalize(text)) if self._pattern and text else None
+        if phrase:
+            signal = EmergencySignal(method="phrase", matched=phrase, language=self._language_by_phrase.get(phrase))
+        elif self.embed is not None and text and self.exemplars:
+            try:
+                exemplar, distance = self._closest_exemplar(text)
+                if distance <= self.max_distance:
+                    signal = EmergencySignal(method="embedding", matched=exemplar, distance=round(distance, 4))
+            except Exception as e:
+                # The vectorstore may be unavailable; the LLM check still runs
+                logger.warning(f"Emergency embedding check skipped: {e}")
+
+        with self._lock:
+            self.checks += 1
+            self.phrase_matches += bool(signal and signal.method == "phrase")
+            self.embedding_matches += bool(signal and signal.method == "embedding")
+            self.total_seconds += time.perf_counter() - start
+        return signal
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "checks": self.checks,
+                "phrase_matches": self.phrase_matches,
+                "embedding_matches": self.embedding_matches,
+                "mean_latency_ms": round(self.total_seconds / self.checks * 1000, 3) if self.checks else 0.0,
+            }
+
+
+def _embed_query(text: str) -> List[float]:
+    from src.utils import vectorstore
+    return vectorstore.embed_query(text)
+
+
+emergency_classifier = EmergencyClassifier(
+    load_phrases(),
+    embed=_embed_query if EMERGENCY_EMBEDDING_CHECK else None,
+)
@@ -0,0 +1,172 @@
+from typing import Dict, List, Optional, Tuple
+import csv
+import math
+import os
+import re
+import logging
+
+from src.utils.caching import normalize_text
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Offline gazetteer: municipality -> (latitude, longitude) of its centre, plus common aliases.
+# Extend or replace it with a CSV (columns: municipality, lat, lon, aliases separated by "|") via GAZETTEER_PATH.
+GAZETTEER = {
+    "amsterdam": (52.3676, 4.9041),
+    "rotterdam": (51.9244, 4.4777),
+    "den haag": (52.0705, 4.3007),
+    "utrecht": (52.0907, 5.1214),
+    "eindhoven": (51.4416, 5.4697),
+    "groningen": (53.2194, 6.5665),
+    "tilburg": (51.5555, 5.0913),
+    "almere": (52.3508, 5.2647),
+    "breda": (51.5719, 4.7683),
+    "nijmegen": (51.8126, 5.8372),
+    "apeldoorn": (52.2112, 5.9699),
+    "haarlem": (52.3874, 4.6462),
+    "arnhem": (51.9851, 5.8987),
+    "enschede": (52.2215, 6.8937),
+    "amersfoort": (52.1561, 5.3878),
+    "zaanstad": (52.4420, 4.8292),
+    "'s-hertogenbosch": (51.6978, 5.3037),
+    "haarlemmermeer": (52.3030, 4.6890),
+    "zwolle": (52.5168, 6.0830),
+    "zoetermeer": (52.0575, 4.4931),
+    "leiden": (52.1601, 4.4970),
+    "maastricht": (50.8514, 5.6910),
+    "dordrecht": (51.8133, 4.6901),
+    "ede": (52.0402, 5.6649),
+    "alphen aan den rijn": (52.1290, 4.6557),
+    "leeuwarden": (53.2012, 5.7999),
+    "alkmaar": (52.6324, 4.7534),
+    "emmen": (52.7792, 6.9069),
+    "delft": (52.0116, 4.3571),
+    "venlo": (51.3704, 6.1724),
+    "deventer": (52.2661, 6.1552),
+    "helmond": (51.4793, 5.6570),
+    "oss": (51.7650, 5.5180),
+    "amstelveen": (52.3114, 4.8701),
+    "hilversum": (52.2292, 5.1669),
+    "heerlen": (50.8882, 5.9795),
+    "purmerend": (52.5050, 4.9597),
+    "schiedam": (51.9192, 4.3886),
+    "lelystad": (52.5185, 5.4714),
+    "assen": (52.9925, 6.5649),
+    "middelburg": (51.4988, 3.6136),
+    "vlissingen": (51.4425, 3.5736),
+    "roermond": (51.1942, 5.9870),
+    "gouda": (52.0115, 4.7105),
+    "den helder": (52.9563, 4.7601),
+    "hoorn": (52.6425, 5.0597),
+    "zeist": (52.0894, 5.2330),
+    "nieuwegein": (52.0290, 5.0815),
+    "kampen": (52.5550, 5.9110),
+    "wageningen": (51.9692, 5.6654),
+    "westerwolde": (52.8767, 7.0697),
+}
+
+ALIASES = {
+    "the hague": "den haag",
+    "'s-gravenhage": "den haag",
+    "s-gravenhage": "den haag",
+    "den bosch": "'s-hertogenbosch",
+    "s-hertogenbosch": "'s-hertogenbosch",
+    "zaandam": "zaanstad",
+    "hoofddorp": "haarlemmermeer",
+    "ter apel": "westerwolde",
+}
+
+
+def _load_gazetteer() -> Tuple[Dict[str, Tuple[float, float]], Dict[str, str]]:
+    gazetteer, aliases = dict(GAZETTEER), dict(ALIASES)
+    path = os.getenv("GAZETTEER_PATH")
+    if path and os.path.exists(path):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                name = normalize_text(row["municipality"])
+                gazetteer[name] = (float(row["lat"]), float(row["lon"]))
+                for alias in filter(None, (row.get("aliases") or "").split("|")):
+                    aliases[normalize_text(alias)] = name
+        logger.info(f"Loaded gazetteer from {path}")
+    return gazetteer, aliases
+
+
+gazetteer, aliases = _load_gazetteer()
+
+# Longest names first so "den haag" wins over a shorter name contained in it
+_place_pattern = re.compile(
+    r"(?<!\w)(" + "|".join(re.escape(name) for name in sorted(list(gazetteer) + list(aliases), key=len, reverse=True)) + r")(?!\w)"
+)
+
+
+def geocode(text: Optional[str]) -> Optional[Dict]:
+    """
+    Resolve an address or a free-text location to a municipality and its coordinates.
+    Returns {"municipality", "lat", "lon"} or None when no known place is mentioned.
+    """
+    if not text:
+        return None
+    # In Dutch addresses the town comes last ("Straat 1, 1234 AB Amsterdam"), so prefer the last match
+    matches = _place_pattern.findall(normalize_text(str(text)))
+    if not matches:
+        return None
+    municipality = aliases.get(matches[-1], matches[-1])
+    lat, lon = gazetteer[municipality]
+    return {"municipality": municipality, "lat": lat, "lon": lon}
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in kilometres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+class GridIndex:
+    """Uniform lat/lon grid over named points for fast radius queries"""
+
+    def __init__(self, points: Dict[str, Tuple[float, float]], cell_size_deg: float = 0.25):
+        self.cell_size = cell_size_deg
+        self.points = dict(points)
+        self.cells = {}
+        for name, (lat, lon) in self.points.items():
+            self.cells.setdefault(self._cell(lat, lon), []).append(name)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_size)), int(math.floor(lon / self.cell_size))
+
+    def within_radius(self, lat: float, lon: float, radius_km: float) -> List[str]:
+        """Names of the points within radius_km, closest first"""
+        # One degree of latitude is ~111 km, a degree of longitude shrinks with cos(lat)
+        lat_cells = int(math.ceil(radius_km / (111.0 * self.cell_size)))
+        lon_cells = int(math.ceil(radius_km / (111.0 * max(math.cos(math.radians(lat)), 0.01) * self.cell_size)))
+        row, col = self._cell(lat, lon)
+
+        found = []
+        for r in range(row - lat_cells, row + lat_cells + 1):
+            for c in range(col - lon_cells, col + lon_cells + 1):
+                for name in self.cells.get((r, c), []):
+                    distance = haversine_km(lat, lon, *self.points[name])
+                    if distance <= radius_km:
+                        found.append((distance, name))
+        return [name for _, name in sorted(found)]
+
+
+municipality_index = GridIndex(gazetteer)
+
+
+def municipalities_near(location: Optional[str], radius_km: float) -> Optional[List[str]]:
+    """Municipalities within radius_km of a free-text location, or None if the location can't be resolved"""
+    place = geocode(location)
+    if place is None:
+        return None
+    return municipality_index.within_radius(place["lat"], place["lon"], radius_km)
+
+
+def location_metadata(address: Optional[str]) -> Dict:
+    """Metadata fields added to an offer at ingestion; offers without a known place get an empty municipality"""
+    place = geocode(address)
+    if place is None:
+        return {"municipality": ""}
+    return place
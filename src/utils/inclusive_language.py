@@ -0,0 +1,231 @@
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
+from src.utils.text_matching import compile_terms
+import json
+import os
+import re
+import threading
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+GUIDELINES_PATH = os.getenv("COMMS_GUIDELINES_PATH", "data/comms.json")
+# Preferred terms longer than this are guidance on how to rephrase, not a drop-in replacement
+MAX_REPLACEMENT_WORDS = 4
+
+# Keys are matched loosely so the loader keeps working if the guideline export changes shape
+AVOID_KEY = re.compile(r"avoid", re.IGNORECASE)
+PREFERRED_KEY = re.compile(r"prefer|instead|recommended|use", re.IGNORECASE)
+NOTE_KEY = re.compile(r"note|context|explanation|comment|remark|why", re.IGNORECASE)
+TEXT_LINE = re.compile(r"^\W*(avoid\w*|prefer\w*(?:\s+terms?)?|use instead|note\w*)\s*[:\-]\s*(.+)$", re.IGNORECASE)
+TERM_SEPARATORS = re.compile(r"[,;\n]|\s+\|\s+|•")
+PARENTHETICAL = re.compile(r"\(([^)]*)\)")
+
+
+class GuidelineRule(BaseModel):
+    """One entry of the inclusive language guideline"""
+    avoid: List[str] = Field(description="Terms to avoid, lowercase")
+    preferred: List[str] = Field(default_factory=list, description="Preferred terms")
+    note: str = Field(default="", description="Guidance on when or how the rule applies")
+
+    @property
+    def replacement(self) -> Optional[str]:
+        """Drop-in replacement, or None when the rewrite depends on the context"""
+        if self.note:
+            return None
+        for term in self.preferred:
+            if len(term.split()) <= MAX_REPLACEMENT_WORDS:
+                return term
+        return None
+
+    def describe(self) -> str:
+        text = f"Avoid: {', '.join(self.avoid)} | Preferred: {', '.join(self.preferred) or 'rephrase'}"
+        return f"{text} | Note: {self.note}" if self.note else text
+
+
+class Rewrite(BaseModel):
+    """Outcome of the local rewrite of one answer"""
+    text: str
+    replacements: List[str] = Field(default_factory=list, description="'avoid -> preferred' substitutions made locally")
+    context_rules: List[GuidelineRule] = Field(default_factory=list, description="Matched rules that need a rewrite in context")
+
+
+def _terms(value) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [term for item in value for term in _terms(item)]
+    if isinstance(value, dict):
+        return [term for item in value.values() for term in _terms(item)]
+    terms = []
+    for term in TERM_SEPARATORS.split(str(value)):
+        term = term.strip().strip("\"'“”‘’-* ").strip()
+        if term:
+            terms.append(term)
+    return terms
+
+
+def _rule(avoid, preferred, notes: List[str]) -> Optional[GuidelineRule]:
+    avoid_terms = []
+    for term in _terms(avoid):
+        # "term (when talking about ...)" means the rule only applies in some contexts
+        notes.extend(PARENTHETICAL.findall(term))
+        term = " ".join(PARENTHETICAL.sub(" ", term).split()).casefold()
+        if term:
+            avoid_terms.append(term)
+    if not avoid_terms:
+        return None
+    preferred_terms = []
+    for term in _terms(preferred):
+        notes.extend(PARENTHETICAL.findall(term))
+        term = " ".join(PARENTHETICAL.sub(" ", term).split())
+        if term:
+            preferred_terms.append(term)
+    return GuidelineRule(avoid=avoid_terms, preferred=preferred_terms, note="; ".join(n.strip() for n in notes if n.strip()))
+
+
+def _rules_from_text(text: str) -> List[GuidelineRule]:
+    # Plain text guidelines: "Avoid: x, y" lines followed by "Preferred terms: a, b" and "Note: ..." lines
+    rules = []
+    current = None
+    for line in text.splitlines():
+        match = TEXT_LINE.match(line.strip())
+        if not match:
+            continue
+        label, value = match.group(1).casefold(), match.group(2)
+        if label.startswith("avoid"):
+            if current:
+                rules.append(current)
+            current = {"avoid": value, "preferred": [], "notes": []}
+        elif current is not None and label.startswith("note"):
+            current["notes"].append(value)
+        elif current is not None:
+            current["preferred"].append(value)
+    if current:
+        rules.append(current)
+    return [rule for rule in (_rule(r["avoid"], r["preferred"], r["notes"]) for r in rules) if rule]
+
+
+def extract_rules(node) -> List[GuidelineRule]:
+    """
+    Collect avoid/preferred rules from a guideline document of unknown shape: any object with an
+    "avoid"-like key (and optionally "preferred"/"note"-like keys) is a rule, strings are parsed line by line,
+    and everything else is searched recursively.
+    """
+    if isinstance(node, str):
+        return _rules_from_text(node)
+    if isinstance(node, list):
+        return [rule for item in node for rule in extract_rules(item)]
+    if not isinstance(node, dict):
+        return []
+
+    avoid_keys = [key for key in node if AVOID_KEY.search(str(key))]
+    if avoid_keys:
+        preferred_keys = [key for key in node if key not in avoid_keys and PREFERRED_KEY.search(str(key))]
+        notes = [str(node[key]) for key in node
+                 if key not in avoid_keys and key not in preferred_keys and NOTE_KEY.search(str(key)) and node[key]]
+        rule = _rule([node[key] for key in avoid_keys], [node[key] for key in preferred_keys], notes)
+        return [rule] if rule else []
+    return [rule for value in node.values() for rule in extract_rules(value)]
+
+
+def load_guideline_document(path: str = GUIDELINES_PATH):
+    """The guideline as stored (the "comms" entry if there is one), None if the file is missing"""
+    try:
+        with open(path, "rb") as f:
+            document = json.load(f)
+    except FileNotFoundError:
+        logger.warning(f"No communication guidelines at {path}")
+        return None
+    if isinstance(document, dict) and "comms" in document:
+        document = document["comms"]
+    return document
+
+
+def load_guidelines(path: str = GUIDELINES_PATH) -> List[GuidelineRule]:
+    """Rules from the guideline file; empty if the file is missing"""
+    document = load_guideline_document(path)
+    return extract_rules(document) if document else []
+
+
+def _is_plural(text: str) -> bool:
+    # Rough English plural check on the last word: "illegals" yes, "homeless", "status", "crisis" no
+    words = text.split()
+    return bool(words) and words[-1].casefold().endswith("s") and not words[-1].casefold().endswith(("ss", "us", "is"))
+
+
+def _match_case(original: str, replacement: str) -> str:
+    if len(original) > 1 and original.isupper():
+        return replacement.upper()
+    if original[:1].isupper():
+        return replacement[:1].upper() + replacement[1:]
+    return replacement
+
+
+class InclusiveLanguageRewriter:
+    """
+    Finds avoid-terms of the guideline in an answer. Terms with a drop-in preferred term are
+    replaced locally; rules that depend on context are returned for a review by the LLM.
+    Counts how often each path is taken.
+    """
+
+    def __init__(self, rules: List[GuidelineRule], document=None):
+        self.rules = rules
+        # The guideline as stored, for a full LLM review when no rules could be extracted from it
+        self.document = document
+        self._rule_by_term = {}
+        for rule in rules:
+            for term in rule.avoid:
+                self._rule_by_term.setdefault(term, rule)
+        self._pattern = compile_terms(self._rule_by_term)
+        self._lock = threading.Lock()
+        self.answers = 0
+        self.answers_with_matches = 0
+        self.local_replacements = 0
+        self.context_matches = 0
+        self.llm_reviews = 0
+
+    @classmethod
+    def from_file(cls, path: str = GUIDELINES_PATH) -> "InclusiveLanguageRewriter":
+        document = load_guideline_document(path)
+        return cls(extract_rules(document) if document else [], document=document)
+
+    def rewrite(self, text: str) -> Rewrite:
+        replacements, context_rules = [], []
+
+        def substitute(match):
+            original = match.group(0)
+            rule = self._rule_by_term[" ".join(match.group("term").split()).casefold()]
+            replacement = rule.replacement
+            if replacement is None or match.group("suffix") or (_is_plural(original) and not _is_plural(replacement)):
+                # Also plurals ("illegals" -> "undocumented migrant"): inflecting the preferred term is left to the LLM
+                if rule not in context_rules:
+                    context_rules.append(rule)
+                return original
+            replacements.append(f"{original} -> {replacement}")
+            return _match_case(original, replacement)
+
+        rewritten = self._pattern.sub(substitute, text) if self._pattern and text else text
+        with self._lock:
+            self.answers += 1
+            self.answers_with_matches += bool(replacements or context_rules)
+            self.local_replacements += len(replacements)
+            self.context_matches += len(context_rules)
+        return Rewrite(text=rewritten, replacements=replacements, context_rules=context_rules)
+
+    def record_llm_review(self) -> None:
+        with self._lock:
+            self.llm_reviews += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "rules": len(self.rules),
+                "answers": self.answers,
+                "answers_with_matches": self.answers_with_matches,
+                "local_replacements": self.local_replacements,
+                "context_matches": self.context_matches,
+                "llm_reviews": self.llm_reviews,
+                "llm_review_rate": round(self.llm_reviews / self.answers, 3) if self.answers else 0.0,
+            }
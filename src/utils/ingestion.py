@@ -0,0 +1,154 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import os
+import sys
+import time
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+try:
+    import resource
+except ImportError:  # Windows, no peak memory figures there
+    resource = None
+
+DEFAULT_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+DEFAULT_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+
+# One embedding model per worker process, loaded by the pool initializer
+_embedding_function = None
+
+
+def _init_worker():
+    global _embedding_function
+    # Each process gets its own core, don't let ONNX spread over all of them too
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    from chromadb.utils import embedding_functions
+    _embedding_function = embedding_functions.DefaultEmbeddingFunction()
+
+
+def _embed_batch(documents: List[str]) -> List[List[float]]:
+    if _embedding_function is None:
+        _init_worker()
+    return [[float(x) for x in embedding] for embedding in _embedding_function(documents)]
+
+
+def _max_rss() -> int:
+    """Peak resident memory of the calling process, in ru_maxrss units (0 without the resource module)"""
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _embed_batch_in_worker(documents: List[str]) -> Tuple[List[List[float]], int, int]:
+    """_embed_batch for pool workers, also reporting the worker's pid and its own peak memory"""
+    return _embed_batch(documents), os.getpid(), _max_rss()
+
+
+def batches(items: List, batch_size: int):
+    """Yield consecutive slices of at most batch_size items"""
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def embedding_pool(workers: int = DEFAULT_WORKERS) -> Optional[ProcessPoolExecutor]:
+    """Process pool to reuse across several embed_documents calls, None to embed in-process"""
+    if workers <= 1:
+        return None
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+
+def embed_documents(documents: List[str], batch_size: int = DEFAULT_BATCH_SIZE, workers: int = DEFAULT_WORKERS,
+                    pool: Optional[ProcessPoolExecutor] = None,
+                    throughput: Optional["Throughput"] = None) -> List[List[float]]:
+    """
+    Embed documents in batches, spread over a pool of worker processes (a new one unless `pool` is given).
+    The workers' peak memory is recorded on `throughput`, if given.
+    """
+    if not documents:
+        return []
+    document_batches = list(batches(documents, batch_size))
+    if pool is None and (workers <= 1 or len(document_batches) == 1):
+        results = map(_embed_batch, document_batches)
+        return [embedding for batch in results for embedding in batch]
+
+    if pool is not None:
+        return _embed_in_pool(pool, document_batches, throughput)
+    with embedding_pool(min(workers, len(document_batches))) as pool:
+        return _embed_in_pool(pool, document_batches, throughput)
+
+
+def _embed_in_pool(pool: ProcessPoolExecutor, document_batches: List[List[str]],
+                   throughput: Optional["Throughput"]) -> List[List[float]]:
+    embeddings = []
+    # map keeps the input order, so embeddings line up with the documents
+    for batch, pid, max_rss in pool.map(_embed_batch_in_worker, document_batches):
+        embeddings.extend(batch)
+        if throughput is not None:
+            throughput.add_worker_peak(pid, max_rss)
+    return embeddings
+
+
+def write_batches(method, batch_size: int = DEFAULT_BATCH_SIZE, **columns) -> None:
+    """
+    Call a collection write method (add, upsert, update) in batches of batch_size rows.
+    `columns` are the keyword arguments (ids, documents, metadatas, embeddings) as parallel lists.
+    """
+    columns = {name: values for name, values in columns.items() if values is not None}
+    n_rows = len(columns["ids"])
+    for start in range(0, n_rows, batch_size):
+        method(**{name: values[start:start + batch_size] for name, values in columns.items()})
+
+
+def peak_memory_mb(worker_peaks: Optional[Dict[int, int]] = None) -> float:
+    """
+    Peak resident memory in MB: this process plus each worker's own peak (ru_maxrss by pid).
+    The workers run side by side, so their peaks add up rather than the largest one counting.
+    """
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KB on Linux
+    total = _max_rss() + sum((worker_peaks or {}).values())
+    return round(total / scale, 1)
+
+
+class Throughput:
+    """Times an ingestion step and reports docs/sec"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.docs = 0
+        self.worker_peaks = {}
+
+    def add(self, n_docs: int) -> None:
+        self.docs += n_docs
+
+    def add_worker_peak(self, pid: int, max_rss: int) -> None:
+        # ru_maxrss only grows, keep the latest (largest) figure per worker
+        self.worker_peaks[pid] = max(max_rss, self.worker_peaks.get(pid, 0))
+
+    def report(self) -> Dict:
+        seconds = time.perf_counter() - self.start
+        return {
+            "docs": self.docs,
+            "seconds": round(seconds, 3),
+            "docs_per_second": round(self.docs / seconds, 1) if seconds > 0 else 0.0,
+            "peak_memory_mb": peak_memory_mb(self.worker_peaks),
+        }
+
+
+def ingest(collection, ids: List[str], documents: List[str], metadatas: List[Dict], method: str = "add",
+           batch_size: int = DEFAULT_BATCH_SIZE, workers: int = DEFAULT_WORKERS,
+           throughput: Optional[Throughput] = None, pool: Optional[ProcessPoolExecutor] = None) -> Dict:
+    """Embed documents in parallel and write them with precomputed embeddings in batches"""
+    throughput = throughput or Throughput()
+    embeddings = embed_documents(documents, batch_size=batch_size, workers=workers, pool=pool, throughput=throughput)
+    write_batches(
+        getattr(collection, method),
+        batch_size=batch_size,
+        ids=ids,
+        documents=documents,
+        metadatas=metadatas,
+        embeddings=embeddings
+    )
+    throughput.add(len(ids))
+    return throughput.report()
@@ -1,33 +1,64 @@
+from src.utils.chunking import chunk_documents
+from src.utils.geo import location_metadata
+from src.utils.ingestion import DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, Throughput, ingest, write_batches
+from src.utils.lexical_index import BM25Index
+from src.utils.retrievers import NumpyRetriever
+from typing import Dict, List, Tuple
+from pydantic import BaseModel, Field
+import argparse
 import chromadb
-from chromadb.errors import InvalidCollectionException
 from chromadb.utils import embedding_functions
 
 import pandas as pd
 import numpy as np
+import hashlib
 import json
+import os
+import time
+import logging
 
-offers = pd.read_csv("data/Offers Clean.csv")
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
-def initialize_vectorstore():
-    """Initialize and return Chroma vectorstore with embeddings"""
-    # Initialize persistent Chroma client
-    client = chromadb.PersistentClient(path="./chroma_db")
+OFFERS_CSV = "data/Offers Clean.csv"
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+COLLECTION_NAME = os.getenv("CHROMA_COLLECTION", "test_collection")
+# Long offers are indexed as overlapping chunks of this many words
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "120"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "30"))
 
-    client.delete_collection("test_collection")
+# Fields that identify an offer and give it a stable id; the text is tracked with a content hash
+KEY_FIELDS = ['subdomain', 'link', 'address', 'email', 'phone_number']
 
-    # Create or get existing collection
-    try:
-        collection = client.get_collection(
-            name="test_collection",
-            embedding_function=embedding_functions.DefaultEmbeddingFunction()
-        )
-        print("Collection obtained.")
-    except (ValueError, InvalidCollectionException):  # Collection doesn't exist
-        collection = client.create_collection(
-            name="test_collection",
-            embedding_function=embedding_functions.DefaultEmbeddingFunction()
-        )
-        print("Collection created.")
+
+class SyncReport(BaseModel):
+    """Outcome of an incremental sync of the offers into the collection"""
+    added: int = Field(description="New offers embedded and added")
+    updated: int = Field(description="Offers whose text changed and were re-embedded")
+    metadata_updated: int = Field(description="Offers with only metadata changes, not re-embedded")
+    unchanged: int = Field(description="Offers left untouched")
+    deleted: int = Field(description="Offers no longer in the export, removed")
+    duration_seconds: float = Field(description="Wall-clock time of the sync")
+    docs_per_second: float = Field(description="Embedding and write throughput for added and updated offers")
+    peak_memory_mb: float = Field(description="Peak resident memory of the ingestion, including worker processes")
+
+
+def _hash(value) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def offer_id(key: Dict) -> str:
+    """Stable id of an offer derived from its key fields, so edits to its text keep the same id"""
+    return "offer_" + _hash(key)[:16]
+
+
+def load_offers(csv_path: str = OFFERS_CSV, chunk_size: int = CHUNK_SIZE,
+                chunk_overlap: int = CHUNK_OVERLAP) -> Tuple[List[str], List[str], List[Dict]]:
+    """
+    Read the offers export and return ids, documents and metadata ready for the collection,
+    one entry per chunk (see chunking.chunk_documents; short offers are a single chunk).
+    """
+    offers = pd.read_csv(csv_path)
 
     documents = offers['offer_edited'].to_list()
 
@@ -35,19 +66,186 @@ def initialize_vectorstore():
     meta_cols = ['subdomain', 'icon_url', 'link', 'address', 'date_added']
     metadatas = offers[meta_cols].to_dict(orient='records')
     comp_metadatas = offers[["email", "phone_number", "opening_hours_weekday", "opening_hours_weekend"]].to_dict(orient='records')
-    for metadata, comp_metadata in zip(metadatas, comp_metadatas):
+    keys = offers[KEY_FIELDS].astype(str).to_dict(orient='records')
+
+    ids = []
+    seen = {}
+    unknown_places = []
+    for document, metadata, comp_metadata, key in zip(documents, metadatas, comp_metadatas, keys):
         metadata['contact'] = json.dumps({"weekday": comp_metadata["opening_hours_weekday"], "weekend": comp_metadata["opening_hours_weekend"]})
         metadata['opening_hours'] = json.dumps({"email": comp_metadata["email"], "phone": comp_metadata["phone_number"]})
         metadata['source'] = np.nan
         metadata['category'] = "TBD"
+        # Municipality and coordinates from the offline gazetteer, used to pre-filter by location
+        metadata.update(location_metadata(metadata['address']))
+        if not metadata['municipality'] and isinstance(metadata['address'], str) and metadata['address'].strip():
+            unknown_places.append(metadata['address'])
+
+        # Offers sharing all key fields get a counter so that ids stay unique
+        base_id = offer_id(key)
+        seen[base_id] = seen.get(base_id, 0) + 1
+        ids.append(base_id if seen[base_id] == 1 else f"{base_id}_{seen[base_id]}")
+
+    if unknown_places:
+        # These offers match no location filter but the national one, i.e. they are shown everywhere
+        logger.warning(
+            f"{len(unknown_places)} offers have an address in no known municipality and will be served as national; "
+            f"add their towns to the gazetteer (GAZETTEER_PATH). Examples: {unknown_places[:5]}"
+        )
+
+    ids, documents, metadatas = chunk_documents(ids, documents, metadatas, chunk_size, chunk_overlap)
+    for document, metadata in zip(documents, metadatas):
+        # Hashes let the next sync skip unchanged chunks and avoid re-embedding unchanged text
+        metadata['content_hash'] = _hash(document)
+        metadata['metadata_hash'] = _hash(metadata)
+
+    return ids, documents, metadatas
+
+
+def data_version(ids: List[str], metadatas: List[Dict]) -> str:
+    """Hash of every chunk's id and content/metadata hashes: changes whenever a sync changes anything"""
+    return _hash(sorted(
+        (doc_id, metadata.get("content_hash"), metadata.get("metadata_hash"))
+        for doc_id, metadata in zip(ids, metadatas)
+    ))
+
+
+def write_data_version(collection, version: str) -> None:
+    """Store the data version in the collection metadata, where running API processes pick it up"""
+    metadata = {key: value for key, value in (collection.metadata or {}).items() if not key.startswith("hnsw:")}
+    if metadata.get("data_version") != version:
+        collection.modify(metadata={**metadata, "data_version": version})
+
+
+def sync_collection(collection, ids: List[str], documents: List[str], metadatas: List[Dict],
+                    batch_size: int = DEFAULT_BATCH_SIZE, workers: int = DEFAULT_WORKERS) -> SyncReport:
+    """
+    Bring the collection in line with the given offers without rebuilding it:
+    new offers are added, offers with changed text are re-embedded, offers with only
+    metadata changes are updated in place and offers that disappeared are deleted.
+    Readers keep working on the existing data while this runs.
+    Embedding runs in `workers` processes and writes go in batches of `batch_size`.
+    """
+    start = time.perf_counter()
+
+    existing = collection.get(include=["metadatas"])
+    existing_metadatas = dict(zip(existing["ids"], existing["metadatas"]))
+
+    to_add, to_update, to_update_metadata = [], [], []
+    unchanged = 0
+    for i, doc_id in enumerate(ids):
+        current = existing_metadatas.get(doc_id)
+        if current is None:
+            to_add.append(i)
+        elif current.get("content_hash") != metadatas[i]["content_hash"]:
+            to_update.append(i)
+        elif current.get("metadata_hash") != metadatas[i]["metadata_hash"]:
+            to_update_metadata.append(i)
+        else:
+            unchanged += 1
+
+    new_ids = set(ids)
+    to_delete = [doc_id for doc_id in existing_metadatas if doc_id not in new_ids]
+
+    throughput = Throughput()
+    for rows, method in ((to_add, "add"), (to_update, "upsert")):
+        if rows:
+            ingest(
+                collection,
+                ids=[ids[i] for i in rows],
+                documents=[documents[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows],
+                method=method,
+                batch_size=batch_size,
+                workers=workers,
+                throughput=throughput
+            )
+    if to_update_metadata:
+        # No documents passed, so Chroma keeps the stored embeddings
+        write_batches(
+            collection.update,
+            batch_size=batch_size,
+            ids=[ids[i] for i in to_update_metadata],
+            metadatas=[metadatas[i] for i in to_update_metadata]
+        )
+    for batch_start in range(0, len(to_delete), batch_size):
+        collection.delete(ids=to_delete[batch_start:batch_start + batch_size])
+    # Lets the answer cache of running processes drop answers built on the old data, see vectorstore.data_version
+    write_data_version(collection, data_version(ids, metadatas))
+    stats = throughput.report()
+
+    return SyncReport(
+        added=len(to_add),
+        updated=len(to_update),
+        metadata_updated=len(to_update_metadata),
+        unchanged=unchanged,
+        deleted=len(to_delete),
+        duration_seconds=round(time.perf_counter() - start, 3),
+        docs_per_second=stats["docs_per_second"],
+        peak_memory_mb=stats["peak_memory_mb"]
+    )
+
+
+def build_indexes(collection) -> None:
+    """Rebuild the NumPy and BM25 indexes from the collection; both are cheap compared to embedding"""
+    # Keep the NumPy retrieval backend in sync with the collection
+    NumpyRetriever.build_from_collection(collection, os.getenv("NUMPY_INDEX_PATH", "./numpy_index"))
+    print("NumPy index written.")
+
+    # Lexical index for hybrid retrieval, stored next to the collection
+    data = collection.get(include=["documents", "metadatas"])
+    BM25Index(data["ids"], data["documents"], data["metadatas"]).save(
+        os.getenv("BM25_INDEX_PATH", os.path.join(CHROMA_PATH, "bm25_index.json"))
+    )
+    print("BM25 index written.")
+
+
+def initialize_vectorstore(csv_path: str = OFFERS_CSV, batch_size: int = DEFAULT_BATCH_SIZE, workers: int = DEFAULT_WORKERS,
+                           chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+    """Create the collection if needed and sync the offers export into it"""
+    # Initialize persistent Chroma client
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+
+    collection = client.get_or_create_collection(
+        name=COLLECTION_NAME,
+        embedding_function=embedding_functions.DefaultEmbeddingFunction()
+    )
+    print("Collection obtained.")
+
+    ids, documents, metadatas = load_offers(csv_path, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    report = sync_collection(collection, ids, documents, metadatas, batch_size=batch_size, workers=workers)
+    print(
+        f"Synced {len(ids)} offer chunks in {report.duration_seconds}s: "
+        f"{report.added} added, {report.updated} updated, {report.metadata_updated} metadata only, "
+        f"{report.deleted} deleted, {report.unchanged} unchanged. "
+        f"Throughput {report.docs_per_second} docs/sec, peak memory {report.peak_memory_mb} MB."
+    )
+
+    if report.added or report.updated or report.metadata_updated or report.deleted:
+        build_indexes(collection)
+        # Running API processes see the new data version within DATA_VERSION_CHECK_SECONDS and drop their
+        # cached answers; the NumPy and BM25 indexes are reloaded on POST /vectorstore/rebuild
+
+    return collection, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the Red Cross offers export into the vectorstore")
+    parser.add_argument("--csv", default=OFFERS_CSV, help="Path to the offers CSV export")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Documents per embedding/write batch")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Embedding processes (1 to embed in-process)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Words per offer chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP, help="Words shared by consecutive chunks")
+    args = parser.parse_args()
 
-    # Add documents to collection
-    collection.add(
-        documents=documents,
-        metadatas=metadatas,
-        ids=[f"doc_{i}" for i in range(len(documents))]
+    initialize_vectorstore(
+        args.csv,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap
     )
 
-    return collection
 
-initialize_vectorstore()
+if __name__ == "__main__":
+    main()
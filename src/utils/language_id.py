@@ -0,0 +1,223 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+import math
+import os
+import re
+
+# Below this confidence the text is too short or too mixed to tell, callers keep their own guess
+LANGUAGE_MIN_CONFIDENCE = float(os.getenv("LANGUAGE_MIN_CONFIDENCE", "0.6"))
+NGRAM_RANGE = (1, 3)
+
+# Small seed texts per language, written around the requests the assistant gets.
+# The character n-gram profiles built from them are enough to separate these languages.
+SEED_TEXTS = {
+    "english": """
+        Where can I get food for my family? I need a place to sleep tonight. Is there a doctor who can help
+        my child? How do I find work and learn the language? Can you help me with my asylum application?
+        I am looking for clothes and a shelter near the station. What are the opening hours of the food bank?
+        My husband and I do not have any money and we have nowhere to go. Thank you for your help.
+    """,
+    "dutch": """
+        Waar kan ik eten halen voor mijn gezin? Ik heb vannacht een slaapplaats nodig. Is er een huisarts die
+        mijn kind kan helpen? Hoe vind ik werk en kan ik de taal leren? Kunt u mij helpen met mijn asielaanvraag?
+        Ik zoek kleding en opvang in de buurt van het station. Wat zijn de openingstijden van de voedselbank?
+        Mijn man en ik hebben geen geld en we kunnen nergens heen. Bedankt voor uw hulp, het is dringend.
+    """,
+    "german": """
+        Wo kann ich Essen für meine Familie bekommen? Ich brauche heute Nacht einen Schlafplatz. Gibt es einen
+        Arzt, der meinem Kind helfen kann? Wie finde ich Arbeit und wo kann ich die Sprache lernen? Können Sie mir
+        bei meinem Asylantrag helfen? Ich suche Kleidung und eine Unterkunft in der Nähe vom Bahnhof. Wann hat
+        die Tafel geöffnet? Mein Mann und ich haben kein Geld und wir wissen nicht wohin. Danke für Ihre Hilfe.
+    """,
+    "french": """
+        Où puis-je trouver de la nourriture pour ma famille? J'ai besoin d'un endroit pour dormir ce soir. Y a-t-il
+        un médecin qui peut aider mon enfant? Comment trouver du travail et apprendre la langue? Pouvez-vous m'aider
+        avec ma demande d'asile? Je cherche des vêtements et un hébergement près de la gare. Quelles sont les heures
+        d'ouverture de la banque alimentaire? Mon mari et moi n'avons pas d'argent. Merci pour votre aide.
+    """,
+    "spanish": """
+        ¿Dónde puedo conseguir comida para mi familia? Necesito un lugar para dormir esta noche. ¿Hay un médico que
+        pueda ayudar a mi hijo? ¿Cómo encuentro trabajo y dónde puedo aprender el idioma? ¿Puede ayudarme con mi
+        solicitud de asilo? Busco ropa y un albergue cerca de la estación. ¿Cuál es el horario del banco de
+        alimentos? Mi marido y yo no tenemos dinero y no tenemos adónde ir. Gracias por su ayuda.
+    """,
+    "portuguese": """
+        Onde posso conseguir comida para a minha família? Preciso de um lugar para dormir esta noite. Há um médico
+        que possa ajudar o meu filho? Como encontro trabalho e onde posso aprender a língua? Pode ajudar-me com o
+        meu pedido de asilo? Procuro roupa e um abrigo perto da estação. Qual é o horário do banco alimentar?
+        O meu marido e eu não temos dinheiro e não temos para onde ir. Obrigado pela sua ajuda.
+    """,
+    "turkish": """
+        Ailem için nereden yiyecek alabilirim? Bu gece kalacak bir yere ihtiyacım var. Çocuğuma yardım edebilecek
+        bir doktor var mı? Nasıl iş bulabilirim ve dili nerede öğrenebilirim? Sığınma başvurumda bana yardım
+        edebilir misiniz? İstasyonun yakınında kıyafet ve barınak arıyorum. Gıda bankasının çalışma saatleri
+        nedir? Kocamla hiç paramız yok ve gidecek yerimiz yok. Yardımınız için teşekkür ederim.
+    """,
+    "polish": """
+        Gdzie mogę dostać jedzenie dla mojej rodziny? Potrzebuję miejsca do spania na dzisiejszą noc. Czy jest
+        lekarz, który może pomóc mojemu dziecku? Jak znaleźć pracę i gdzie mogę uczyć się języka? Czy może mi pan
+        pomóc z wnioskiem o azyl? Szukam ubrań i schroniska w pobliżu dworca. W jakich godzinach jest otwarty bank
+        żywności? Mój mąż i ja nie mamy pieniędzy i nie mamy dokąd pójść. Dziękuję za pomoc.
+    """,
+    "ukrainian": """
+        Де я можу отримати їжу для своєї сім'ї? Мені потрібне місце для ночівлі сьогодні. Чи є лікар, який може
+        допомогти моїй дитині? Як знайти роботу і де можна вивчати мову? Чи можете ви допомогти мені з заявою
+        про притулок? Я шукаю одяг і житло біля вокзалу. Які години роботи продуктового банку? У нас з чоловіком
+        немає грошей і нам нікуди йти. Дякую за вашу допомогу.
+    """,
+    "russian": """
+        Где я могу получить еду для своей семьи? Мне нужно место для ночлега сегодня. Есть ли врач, который может
+        помочь моему ребёнку? Как найти работу и где можно изучать язык? Вы можете помочь мне с заявлением на
+        убежище? Я ищу одежду и жильё рядом с вокзалом. Какие часы работы продуктового банка? У нас с мужем нет
+        денег и нам некуда идти. Спасибо за вашу помощь.
+    """,
+    "arabic": """
+        أين يمكنني الحصول على طعام لعائلتي؟ أحتاج إلى مكان للنوم الليلة. هل يوجد طبيب يمكنه مساعدة طفلي؟ كيف أجد
+        عملا وأين يمكنني تعلم اللغة؟ هل يمكنك مساعدتي في طلب اللجوء؟ أبحث عن ملابس ومأوى بالقرب من المحطة. ما هي
+        مواعيد عمل بنك الطعام؟ ليس لدينا أنا وزوجي أي مال وليس لدينا مكان نذهب إليه. شكرا على مساعدتك.
+    """,
+    "persian": """
+        کجا می‌توانم برای خانواده‌ام غذا بگیرم؟ امشب به جایی برای خوابیدن نیاز دارم. آیا پزشکی هست که بتواند به
+        فرزندم کمک کند؟ چطور کار پیدا کنم و کجا می‌توانم زبان یاد بگیرم؟ می‌توانید در درخواست پناهندگی به من کمک
+        کنید؟ دنبال لباس و سرپناه نزدیک ایستگاه هستم. ساعت کاری بانک غذا چیست؟ من و شوهرم هیچ پولی نداریم و جایی
+        برای رفتن نداریم. از کمک شما متشکرم.
+    """,
+}
+
+# Scripts that identify a single language among the ones we support, or narrow the candidates
+SCRIPT_LANGUAGES = [
+    (re.compile(r"[ሀ-፿]"), ["tigrinya"]),
+    (re.compile(r"[Ѐ-ӿ]"), ["ukrainian", "russian"]),
+    (re.compile(r"[؀-ۿ]"), ["arabic", "persian"]),
+]
+# Letters that only one language of a script uses
+DISTINCTIVE_LETTERS = {
+    "ukrainian": set("іїєґ"),
+    "russian": set("ыэъё"),
+    "persian": set("پچژگ"),
+    "arabic": set("ةى"),
+}
+NON_WORD = re.compile(r"[^\w']+")
+SENTENCE_END = re.compile(r"[.!?:]$")
+
+
+def _without_names(text: str) -> str:
+    """Drop capitalized words inside sentences: place and organisation names say nothing about the language"""
+    words = text.split()
+    kept = [
+        word for i, word in enumerate(words)
+        if i == 0 or SENTENCE_END.search(words[i - 1]) or len(word) == 1 or not word[0].isupper()
+    ]
+    return " ".join(kept) if kept else text
+
+
+def _ngrams(text: str) -> Iterable[str]:
+    for word in NON_WORD.sub(" ", text.replace("‌", "").casefold()).split():
+        padded = f" {word} "
+        for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+            for i in range(len(padded) - n + 1):
+                gram = padded[i:i + n]
+                if gram.strip():
+                    yield gram
+
+
+class NgramLanguageModel:
+    """Naive Bayes over character 1-3 grams, with add-one smoothing"""
+
+    def __init__(self, texts: Dict[str, str]):
+        self.counts = {language: Counter(_ngrams(text)) for language, text in texts.items()}
+        self.totals = {language: sum(counts.values()) for language, counts in self.counts.items()}
+        self.vocabulary = len(set().union(*self.counts.values()))
+
+    def scores(self, text: str, candidates: Optional[List[str]] = None) -> Dict[str, float]:
+        """Average log-probability per n-gram of `text` under each language"""
+        grams = Counter(_ngrams(text))
+        n_grams = sum(grams.values())
+        if not n_grams:
+            return {}
+        scores = {}
+        for language in candidates or self.counts:
+            if language not in self.counts:
+                continue
+            counts, denominator = self.counts[language], self.totals[language] + self.vocabulary
+            scores[language] = sum(
+                count * math.log((counts.get(gram, 0) + 1) / denominator) for gram, count in grams.items()
+            ) / n_grams
+        return scores
+
+
+language_model = NgramLanguageModel(SEED_TEXTS)
+
+
+def identify_language(text: str) -> Tuple[Optional[str], float]:
+    """Most likely language of `text` and a confidence between 0 and 1"""
+    if not text or not text.strip():
+        return None, 0.0
+
+    candidates = None
+    for script, languages in SCRIPT_LANGUAGES:
+        if script.search(text):
+            if len(languages) == 1:
+                return languages[0], 1.0
+            letters = set(text.casefold())
+            marked = [language for language in languages if letters & DISTINCTIVE_LETTERS.get(language, set())]
+            if len(marked) == 1:
+                return marked[0], 1.0
+            candidates = languages
+            break
+
+    text = _without_names(text)
+    scores = language_model.scores(text, candidates)
+    if not scores:
+        return None, 0.0
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    if len(ranked) == 1:
+        return ranked[0][0], 1.0
+    # Softmax over the per-n-gram scores, sharpened with the text length: longer text, surer answer
+    n_grams = sum(1 for _ in _ngrams(text))
+    weights = [math.exp((score - ranked[0][1]) * n_grams / 3) for _, score in ranked]
+    return ranked[0][0], round(weights[0] / sum(weights), 3)
+
+
+def detect_language(text: str, default: Optional[str] = None,
+                    min_confidence: float = LANGUAGE_MIN_CONFIDENCE) -> Optional[str]:
+    """Language of `text`, or `default` when the text is too short or ambiguous to tell"""
+    language, confidence = identify_language(text)
+    return language if language and confidence >= min_confidence else default
+
+
+def conversation_language(query: str, messages: Optional[List] = None, default: Optional[str] = None) -> Optional[str]:
+    """
+    Language to reply in: the query's when it is clear, otherwise that of the user's earlier
+    turns, so short follow-ups ("ok", "and in Utrecht?") keep the conversation's language.
+    """
+    language = detect_language(query)
+    if language:
+        return language
+    earlier = " ".join(
+        _message_text(message) for message in (messages or []) if _message_role(message) in ("user", "human")
+    )
+    return detect_language(earlier, default=default)
+
+
+def reply_language(detected: Optional[str], query: str, messages: Optional[List] = None,
+                   default: Optional[str] = None) -> Optional[str]:
+    """
+    Language to reply in given the query analysis' `detected` language. The LLM also knows the
+    languages the local model doesn't (it reads Italian as Portuguese), so its answer is kept
+    whenever it gives one; the local model only fills in when it didn't.
+    """
+    if detected and detected.strip().lower() not in ("unknown", "none", ""):
+        return detected
+    return conversation_language(query, messages, default=default)
+
+
+def _message_role(message) -> str:
+    if isinstance(message, dict):
+        return message.get("role", "")
+    return getattr(message, "type", "")
+
+
+def _message_text(message) -> str:
+    content = message.get("content", "") if isinstance(message, dict) else getattr(message, "content", "")
+    return content if isinstance(content, str) else ""
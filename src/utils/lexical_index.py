@@ -0,0 +1,127 @@
+from collections import Counter
+from typing import Dict, List, Optional
+import json
+import math
+import os
+import re
+import logging
+
+from src.utils.retrievers import matches_where
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# English and Dutch function words. Lexical queries are the user's full sentence, and without this
+# list "where is the voedselbank" ranks any offer with "is" and "the" above the voedselbank
+STOPWORDS = frozenset("""
+    a about after all also am an and any are as at be been but by can could do does for from get had has
+    have he her here his how i if in into is it its me my need no not of on or our please she so some than
+    that the their them there they this to up us was we were what when where which who why will with would
+    you your
+    aan al alle als ben bij dan dat de deze die dit doen door een en er geen had heb hebben heeft hem het hier
+    hij hoe hun ik in is je jij kan kun kunnen maar me meer met mij mijn na naar niet nog nu of om ons ook op
+    over te tot u uit uw van veel voor waar wanneer wat we welke wie wij wil worden zal ze zij zijn zo zou
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords, so "Veilig Thuis" and "veilig thuis" match"""
+    return [
+        token for token in TOKEN_PATTERN.findall(text.casefold())
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+
+class BM25Index:
+    """
+    Inverted index over the offers scored with Okapi BM25.
+    Catches exact organisation names, street names and Dutch terms that dense retrieval misses.
+    Built at ingestion time and stored as JSON next to the Chroma collection.
+    """
+
+    def __init__(self, ids: List[str], documents: List[str], metadatas: List[Dict], k1: float = 1.5, b: float = 0.75):
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = list(metadatas)
+        self.k1 = k1
+        self.b = b
+
+        self.postings = {}  # term -> [(doc index, term frequency), ...]
+        self.doc_lengths = []
+        for index, document in enumerate(self.documents):
+            tokens = tokenize(document or "")
+            self.doc_lengths.append(len(tokens))
+            for term, frequency in Counter(tokens).items():
+                self.postings.setdefault(term, []).append((index, frequency))
+
+        self.avg_doc_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+        n_docs = len(self.documents)
+        self.idf = {
+            term: math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def save(self, path: str) -> None:
+        """Write the index source data; the postings are cheap to rebuild on load"""
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "ids": self.ids,
+                "documents": self.documents,
+                "metadatas": self.metadatas,
+                "k1": self.k1,
+                "b": self.b,
+            }, f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(data["ids"], data["documents"], data["metadatas"], k1=data["k1"], b=data["b"])
+        logger.info(f"Loaded BM25 index with {len(index.ids)} documents from {path}")
+        return index
+
+    def search(self, query: str, n_results: int, where: Optional[Dict] = None) -> List[Dict]:
+        """Return the best BM25 matches as hits sorted by score (no distance, lexical scores aren't comparable)"""
+        scores = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for index, frequency in self.postings[term]:
+                length_norm = 1 - self.b + self.b * self.doc_lengths[index] / (self.avg_doc_length or 1)
+                scores[index] = scores.get(index, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        hits = []
+        for index, score in ranked:
+            if not matches_where(self.metadatas[index], where):
+                continue
+            hits.append({
+                "id": self.ids[index],
+                "document": self.documents[index],
+                "metadata": self.metadatas[index],
+                "distance": None,
+                "bm25_score": score,
+            })
+            if len(hits) >= n_results:
+                break
+        return hits
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict]], n_results: Optional[int], k: int = 60) -> List[Dict]:
+    """
+    Merge several ranked hit lists with reciprocal-rank fusion (score = sum of 1 / (k + rank)).
+    A document found by several rankers keeps the hit from the first ranking it appears in.
+    n_results=None keeps every fused hit.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            entry = fused.setdefault(hit["id"], {"hit": hit, "score": 0.0})
+            entry["score"] += 1.0 / (k + rank)
+
+    ranked = sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)[:n_results]
+    return [{**entry["hit"], "rrf_score": entry["score"]} for entry in ranked]
@@ -1,7 +1,165 @@
 from dotenv import load_dotenv
+from functools import cached_property
+from typing import Any, Dict, Optional
+import httpx
 import os
+import threading
 
 def get_api_key():
     load_dotenv()
     api_key = os.getenv('CLAUDE_API_KEY')
-    return api_key
\ No newline at end of file
+    return api_key
+
+
+# Per-model configuration, referred to by name from the agents
+LLM_MODELS = {
+    "haiku": {"model": os.getenv("HAIKU_MODEL", "claude-3-5-haiku-20241022"), "temperature": 0},
+    "sonnet": {"model": os.getenv("SONNET_MODEL", "claude-3-5-sonnet-20241022"), "temperature": 0},
+}
+# Point the clients at a proxy or a mock server instead of api.anthropic.com
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "120"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+
+class ConnectionStats:
+    """
+    Counts requests and new connections through httpcore's trace extension;
+    every request that didn't open a connection reused a pooled one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+
+    def on_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def on_trace(self, event: str) -> None:
+        with self._lock:
+            if event == "connection.connect_tcp.complete":
+                self.connections_opened += 1
+            elif event == "connection.start_tls.complete":
+                self.tls_handshakes += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            reused = max(0, self.requests - self.connections_opened)
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "tls_handshakes": self.tls_handshakes,
+                "connections_reused": reused,
+                "reuse_rate": round(reused / self.requests, 3) if self.requests else 0.0,
+            }
+
+
+class LLMClientRegistry:
+    """
+    One chat model per (model name, settings) for the whole process, all sending their requests
+    through a shared pair of keep-alive HTTP clients (sync and async), so turns don't pay client
+    construction or a new TLS handshake per node.
+    """
+
+    def __init__(self, models: Dict[str, Dict] = LLM_MODELS, base_url: Optional[str] = LLM_BASE_URL,
+                 max_connections: int = LLM_MAX_CONNECTIONS,
+                 max_keepalive_connections: int = LLM_MAX_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry: float = LLM_KEEPALIVE_EXPIRY, timeout: float = LLM_TIMEOUT):
+        self.models = models
+        self.base_url = base_url
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = timeout
+        self.stats = ConnectionStats()
+        self._chat_models = {}
+        self._lock = threading.Lock()
+
+    def _trace(self, event: str, info: Dict) -> None:
+        self.stats.on_trace(event)
+
+    async def _atrace(self, event: str, info: Dict) -> None:
+        self.stats.on_trace(event)
+
+    def _on_request(self, request: httpx.Request) -> None:
+        self.stats.on_request()
+        request.extensions["trace"] = self._trace
+
+    async def _aon_request(self, request: httpx.Request) -> None:
+        self.stats.on_request()
+        request.extensions["trace"] = self._atrace
+
+    @cached_property
+    def api_key(self) -> Optional[str]:
+        # Looked up once: get_api_key reads the .env file, which get() shouldn't do on every call
+        return os.getenv("ANTHROPIC_API_KEY") or get_api_key()
+
+    @cached_property
+    def http_client(self) -> httpx.Client:
+        return httpx.Client(limits=self.limits, timeout=self.timeout, event_hooks={"request": [self._on_request]})
+
+    @cached_property
+    def async_http_client(self) -> httpx.AsyncClient:
+        # Bound to the event loop of the first request, i.e. the API server's
+        return httpx.AsyncClient(limits=self.limits, timeout=self.timeout, event_hooks={"request": [self._aon_request]})
+
+    @cached_property
+    def _chat_model_class(self):
+        import anthropic
+        from langchain_anthropic import ChatAnthropic
+        registry = self
+
+        class PooledChatAnthropic(ChatAnthropic):
+            """ChatAnthropic that sends its requests through the registry's shared HTTP clients"""
+
+            @cached_property
+            def _client(self) -> anthropic.Client:
+                return anthropic.Client(**self._client_params, http_client=registry.http_client)
+
+            @cached_property
+            def _async_client(self) -> anthropic.AsyncClient:
+                return anthropic.AsyncClient(**self._client_params, http_client=registry.async_http_client)
+
+        return PooledChatAnthropic
+
+    def get(self, name: str, **overrides):
+        """Shared chat model for a configured model name ("haiku", "sonnet") or a full model id"""
+        settings = {**self.models.get(name, {"model": name}), **overrides}
+        if self.api_key:
+            settings.setdefault("api_key", self.api_key)
+        if self.base_url:
+            settings.setdefault("base_url", self.base_url)
+
+        key = tuple(sorted((k, repr(v)) for k, v in settings.items()))
+        with self._lock:
+            chat_model = self._chat_models.get(key)
+            if chat_model is None:
+                chat_model = self._chat_models[key] = self._chat_model_class(**settings)
+            return chat_model
+
+    def connection_stats(self) -> Dict[str, Any]:
+        return {**self.stats.snapshot(), "chat_models": len(self._chat_models), "base_url": self.base_url}
+
+    def close(self) -> None:
+        if "http_client" in self.__dict__:
+            self.http_client.close()
+
+    async def aclose(self) -> None:
+        self.close()
+        if "async_http_client" in self.__dict__:
+            await self.async_http_client.aclose()
+
+
+llm_registry = LLMClientRegistry()
+
+
+def get_llm(name: str, **overrides):
+    """Chat model from the process-wide registry, e.g. get_llm("haiku")"""
+    return llm_registry.get(name, **overrides)
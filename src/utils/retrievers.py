@@ -0,0 +1,210 @@
+from typing import Dict, List, Optional
+import json
+import os
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+METADATA_FILE = "metadata.json"
+
+
+def matches_where(metadata: Dict, where: Optional[Dict]) -> bool:
+    """Evaluate a Chroma-style where filter against a single metadata dict"""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, c) for c in condition):
+                return False
+        else:
+            value = metadata.get(key)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, expected in condition.items():
+                if operator == "$eq":
+                    ok = value == expected
+                elif operator == "$ne":
+                    ok = value != expected
+                elif operator == "$in":
+                    ok = value in expected
+                elif operator == "$nin":
+                    ok = value not in expected
+                else:
+                    raise ValueError(f"Unsupported filter operator: {operator}")
+                if not ok:
+                    return False
+    return True
+
+
+class Retriever:
+    """
+    Interface shared by the retrieval backends.
+    `search` returns a list of hits {"id", "document", "metadata", "distance", "embedding"} sorted by distance,
+    where `where` is a Chroma-style metadata filter.
+    """
+
+    def search(self, query_embedding, n_results: int, where: Optional[Dict] = None) -> List[Dict]:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+
+class ChromaRetriever(Retriever):
+    """Retriever backed by a Chroma collection (HNSW index)"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def search(self, query_embedding, n_results: int, where: Optional[Dict] = None) -> List[Dict]:
+        n_results = min(n_results, self.count())
+        if n_results <= 0:
+            return []
+        results = self.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            where=where,
+            include=["documents", "metadatas", "distances", "embeddings"]
+        )
+        return [
+            {"id": doc_id, "document": document, "metadata": metadata, "distance": distance, "embedding": embedding}
+            for doc_id, document, metadata, distance, embedding in zip(
+                results["ids"][0],
+                results["documents"][0],
+                results["metadatas"][0],
+                results["distances"][0],
+                results["embeddings"][0],
+            )
+        ]
+
+    def count(self) -> int:
+        return self.collection.count()
+
+
+class NumpyRetriever(Retriever):
+    """
+    Exhaustive retriever over L2-normalized embeddings stored in a memory-mapped .npy file,
+    with ids, documents and metadata in a JSON sidecar. The catalogue is small enough that
+    one matrix-vector product beats an approximate index, and because the matrix is mapped
+    read-only every worker process shares the same pages from the OS page cache.
+    Distances are squared L2 (2 - 2 * cosine) so they are on the same scale as Chroma's default.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        with open(os.path.join(path, METADATA_FILE), "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+        self.ids = sidecar["ids"]
+        self.documents = sidecar["documents"]
+        self.metadatas = sidecar["metadatas"]
+
+        # Column view of the metadata so that filters are evaluated with vectorized comparisons
+        fields = {field for metadata in self.metadatas for field in metadata}
+        self._columns = {}
+        for field in fields:
+            column = np.empty(len(self.metadatas), dtype=object)
+            column[:] = [metadata.get(field) for metadata in self.metadatas]
+            self._columns[field] = column
+
+        logger.info(f"Loaded NumPy index with {len(self.ids)} documents from {path}")
+
+    @staticmethod
+    def build(path: str, ids: List[str], documents: List[str], metadatas: List[Dict], embeddings) -> None:
+        """Write an index that NumpyRetriever can load; files are replaced atomically so readers never see half an index"""
+        os.makedirs(path, exist_ok=True)
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+
+        embeddings_path = os.path.join(path, EMBEDDINGS_FILE)
+        metadata_path = os.path.join(path, METADATA_FILE)
+        with open(embeddings_path + ".tmp", "wb") as f:
+            np.save(f, matrix)
+        with open(metadata_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"ids": list(ids), "documents": list(documents), "metadatas": list(metadatas)}, f)
+        os.replace(embeddings_path + ".tmp", embeddings_path)
+        os.replace(metadata_path + ".tmp", metadata_path)
+
+    @classmethod
+    def build_from_collection(cls, collection, path: str) -> None:
+        """Export a Chroma collection (documents, metadata and stored embeddings) to a NumPy index"""
+        data = collection.get(include=["documents", "metadatas", "embeddings"])
+        cls.build(path, data["ids"], data["documents"], data["metadatas"], data["embeddings"])
+
+    @staticmethod
+    def _isin(column: np.ndarray, values) -> np.ndarray:
+        # np.isin sorts object arrays, which fails on mixed types (e.g. None next to str)
+        mask = np.zeros(len(column), dtype=bool)
+        for value in values:
+            mask |= column == value
+        return mask
+
+    def _mask(self, where: Optional[Dict]) -> np.ndarray:
+        """Boolean row mask for a Chroma-style where filter ($and, $or, $eq, $ne, $in, $nin)"""
+        if not where:
+            return np.ones(len(self.ids), dtype=bool)
+        masks = []
+        for key, condition in where.items():
+            if key == "$and":
+                masks.append(np.logical_and.reduce([self._mask(c) for c in condition]))
+            elif key == "$or":
+                masks.append(np.logical_or.reduce([self._mask(c) for c in condition]))
+            else:
+                column = self._columns.get(key)
+                if column is None:
+                    column = np.full(len(self.ids), None, dtype=object)
+                if not isinstance(condition, dict):
+                    condition = {"$eq": condition}
+                for operator, value in condition.items():
+                    if operator == "$eq":
+                        masks.append(column == value)
+                    elif operator == "$ne":
+                        masks.append(column != value)
+                    elif operator == "$in":
+                        masks.append(self._isin(column, value))
+                    elif operator == "$nin":
+                        masks.append(~self._isin(column, value))
+                    else:
+                        raise ValueError(f"Unsupported filter operator: {operator}")
+        return np.logical_and.reduce(masks)
+
+    def search(self, query_embedding, n_results: int, where: Optional[Dict] = None) -> List[Dict]:
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        candidates = np.flatnonzero(self._mask(where))
+        n_results = min(n_results, len(candidates))
+        if n_results <= 0:
+            return []
+
+        # Avoid copying the mapped matrix when no filter applies
+        matrix = self.embeddings if len(candidates) == len(self.ids) else self.embeddings[candidates]
+        similarities = matrix @ query
+        if n_results < len(candidates):
+            top = np.argpartition(-similarities, n_results - 1)[:n_results]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-similarities[top])]
+
+        return [
+            {
+                "id": self.ids[row],
+                "document": self.documents[row],
+                "metadata": self.metadatas[row],
+                "distance": float(2.0 - 2.0 * similarities[i]),
+                "embedding": self.embeddings[row],
+            }
+            for i, row in zip(top, candidates[top])
+        ]
+
+    def count(self) -> int:
+        return len(self.ids)
@@ -0,0 +1,88 @@
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import threading
+import time
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class CachedSearch:
+    """
+    Search provider (any callable query -> results) behind a cache with stale-while-revalidate:
+    results younger than `ttl` are served as is; results up to `stale_ttl` older are still served
+    right away while a background refresh fetches new ones; anything older is fetched again.
+    The cache (TTLCache or SQLiteTTLCache) should keep entries for ttl + stale_ttl.
+    """
+
+    def __init__(self, provider: Callable[[str], Any], cache, ttl: float, stale_ttl: float = 0,
+                 clock: Callable[[], float] = time.time, executor: Optional[Executor] = None):
+        self.provider = provider
+        self.cache = cache
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._clock = clock
+        self._executor = executor or ThreadPoolExecutor(max_workers=2, thread_name_prefix="search_refresh")
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def _fetch(self, query: str) -> Any:
+        results = self.provider(query)
+        self.cache.set(query, {"results": results, "fetched_at": self._clock()})
+        return results
+
+    def _refresh(self, query: str) -> None:
+        try:
+            self._fetch(query)
+            with self._lock:
+                self.refreshes += 1
+        except Exception as e:
+            # Keep serving the stale results until the provider answers again
+            logger.warning(f"Background refresh of search results failed: {e}")
+            with self._lock:
+                self.refresh_failures += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(query)
+
+    def search(self, query: str) -> Any:
+        entry = self.cache.get(query)
+        if entry is not None:
+            age = self._clock() - entry["fetched_at"]
+            if age <= self.ttl:
+                with self._lock:
+                    self.fresh_hits += 1
+                return entry["results"]
+            if age <= self.ttl + self.stale_ttl:
+                with self._lock:
+                    self.stale_hits += 1
+                    refresh = query not in self._refreshing
+                    self._refreshing.add(query)
+                if refresh:
+                    self._executor.submit(self._refresh, query)
+                return entry["results"]
+
+        with self._lock:
+            self.misses += 1
+        return self._fetch(query)
+
+    __call__ = search
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.fresh_hits + self.stale_hits + self.misses
+            counters = {
+                "fresh_hits": self.fresh_hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_rate": (self.fresh_hits + self.stale_hits) / lookups if lookups else 0.0,
+                "refreshes": self.refreshes,
+                "refresh_failures": self.refresh_failures,
+            }
+        return {**counters, "ttl": self.ttl, "stale_ttl": self.stale_ttl, "cache": self.cache.stats()}
@@ -0,0 +1,113 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+import itertools
+import threading
+import time
+import numpy as np
+
+from src.utils.caching import normalize_text
+
+
+def answer_scope(language: str, domains: List[str], location: Optional[str]) -> Tuple:
+    """Cache scope of an answer: only answers in the same language, for the same domains and place are reused"""
+    return (
+        normalize_text(language or ""),
+        tuple(sorted(normalize_text(domain) for domain in domains)),
+        normalize_text(location or ""),
+    )
+
+
+class SemanticCache:
+    """
+    Bounded cache of generated answers looked up by query-embedding similarity.
+    An entry is returned when its cosine similarity to the query is at least `threshold`
+    and it was stored under the same scope. Entries expire after `ttl` seconds, the least
+    recently used ones are evicted beyond `maxsize`, and everything is dropped when the
+    collection generation changes (i.e. after re-ingestion).
+    """
+
+    def __init__(self, threshold: float = 0.95, maxsize: int = 512, ttl: Optional[float] = 3600,
+                 clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # entry id -> (scope, unit vector, expires_at, value)
+        self._ids = itertools.count()
+        self._generation = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _sync_generation(self, generation: Optional[Hashable]) -> None:
+        # Called with the lock held
+        if generation is not None and generation != self._generation:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._generation = generation
+
+    def lookup(self, embedding, scope: Hashable, generation: Optional[Hashable] = None) -> Optional[Any]:
+        """Return the value of the most similar live entry in scope, or None"""
+        query = self._unit(embedding)
+        with self._lock:
+            self._sync_generation(generation)
+            now = self._clock()
+            best_id, best_similarity = None, self.threshold
+            for entry_id, (entry_scope, vector, expires_at, _) in list(self._entries.items()):
+                if expires_at is not None and expires_at <= now:
+                    del self._entries[entry_id]
+                    continue
+                if entry_scope != scope:
+                    continue
+                similarity = float(np.dot(vector, query))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id][3]
+
+    def store(self, embedding, scope: Hashable, value: Any, generation: Optional[Hashable] = None) -> None:
+        """Add an answer to the cache"""
+        expires_at = self._clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._sync_generation(generation)
+            self._entries[next(self._ids)] = (scope, self._unit(embedding), expires_at, value)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        """Drop every cached answer"""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,396 @@
+from src.utils.chunking import chunk_documents
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field
+import argparse
+import hashlib
+import json
+import os
+import threading
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Snapshots are laid out as <root>/<host>/<path>, e.g. what
+# `wget --mirror --adjust-extension -P data/site_snapshots https://www.rodekruis.nl` writes
+SITE_SNAPSHOTS_PATH = os.getenv("SITE_SNAPSHOTS_PATH", "data/site_snapshots")
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+# Kept apart from the offers collection so the two can be rebuilt and searched independently
+SITE_MIRROR_COLLECTION = os.getenv("SITE_MIRROR_COLLECTION", "trusted_sites")
+SITE_MIRROR_ENABLED = os.getenv("SITE_MIRROR_ENABLED", "true").lower() == "true"
+SITE_MIRROR_N_RESULTS = int(os.getenv("SITE_MIRROR_N_RESULTS", "4"))
+# Squared L2 distance between unit vectors (2 - 2 * cosine); pages further away don't count as an answer
+SITE_MIRROR_MAX_DISTANCE = float(os.getenv("SITE_MIRROR_MAX_DISTANCE", "1.2"))
+SITE_MIRROR_CHUNK_SIZE = int(os.getenv("SITE_MIRROR_CHUNK_SIZE", "150"))
+SITE_MIRROR_CHUNK_OVERLAP = int(os.getenv("SITE_MIRROR_CHUNK_OVERLAP", "30"))
+SNAPSHOT_EXTENSIONS = (".html", ".htm", ".txt", ".md")
+
+# Trusted sites per domain, the only ones the web fallback searches (live or mirrored);
+# anything wider brings in newspapers ("the red cross did this last year")
+RED_CROSS_SITE = "rodekruis.nl"
+TRUSTED_SITES = {
+    "food": ["voedselbank.nl", "voedselbankennederland.nl"],
+    "shelter": ["deregenboog.org", "opvang.nl"],
+    "healthcare": ["ggd.nl", "zorgverzekeringslijn.nl"],
+    "domestic_violence": ["veiligthuis.nl", "blijfgroep.nl"],
+    "education": ["amsterdam.nl/onderwijs"],
+    "refugees": ["vluchtelingenwerk.nl", "refugeehelp.nl"]
+}
+
+# Query analysis domains (query_understanding.Domains) to the TRUSTED_SITES groups they search;
+# domains without a group of their own only search the Red Cross site
+DOMAIN_SITE_GROUPS = {
+    "where to go first": ["refugees"],
+    "shelter": ["shelter"],
+    "health & wellbeing": ["healthcare"],
+    "dentist": ["healthcare"],
+    "safety & protection": ["domestic_violence"],
+    "food & clothing": ["food"],
+    "asylum & return": ["refugees"],
+    "legal advice": ["refugees"],
+    "women": ["domestic_violence"],
+    "children & youth": ["education"],
+    "courses & activities": ["education"],
+}
+
+
+def trusted_sites_for(domains: List[str]) -> List[str]:
+    """Trusted sites to search for the query's domains, the Red Cross site first and always included"""
+    sites = [RED_CROSS_SITE]
+    for domain in domains:
+        key = str(domain).strip().lower()
+        # The group names themselves ("food") are accepted as well
+        for group in DOMAIN_SITE_GROUPS.get(key, [key]):
+            for site in TRUSTED_SITES.get(group, []):
+                if site not in sites:
+                    sites.append(site)
+    return sites
+
+
+# Tags whose text is page chrome or code rather than content
+SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg", "nav", "footer", "form"}
+BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "li", "ul", "ol", "br", "tr", "td", "th", "dd", "dt",
+    "h1", "h2", "h3", "h4", "h5", "h6", "table", "address", "blockquote",
+}
+CONTACT_PATH_WORDS = ("contact", "over-ons", "about")
+
+
+class SitePage(BaseModel):
+    """A page of a trusted site, as read from its snapshot"""
+    url: str = Field(description="URL the page was saved from")
+    site: str = Field(description="Trusted site the page belongs to, e.g. 'voedselbank.nl'")
+    domain: str = Field(description="Domain the site is trusted for, e.g. 'food'")
+    title: str = Field(description="Page title")
+    text: str = Field(description="Visible text of the page")
+    page_type: str = Field(description="'contact' for contact and about pages, otherwise 'content'")
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.lines = [""]
+        self._skipping = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skipping += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag in BLOCK_TAGS:
+            self.lines.append("")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self.lines.append("")
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag == "title":
+            self._in_title = False
+        elif tag in BLOCK_TAGS:
+            self.lines.append("")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skipping:
+            self.lines[-1] += data
+
+
+def html_to_text(html: str) -> Tuple[str, str]:
+    """Title and visible text of an HTML page, one line per block element, without scripts and navigation"""
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    lines = (" ".join(line.split()) for line in extractor.lines)
+    return " ".join(extractor.title.split()), "\n".join(line for line in lines if line)
+
+
+def site_domains(trusted_sites: Dict[str, List[str]] = TRUSTED_SITES) -> Dict[str, str]:
+    """Domain of every trusted site, the Red Cross site included"""
+    domains = {RED_CROSS_SITE: "red_cross"}
+    for domain, sites in trusted_sites.items():
+        for site in sites:
+            domains.setdefault(site, domain)
+    return domains
+
+
+def site_for(location: str, sites) -> Optional[str]:
+    """Trusted site a host/path belongs to, the most specific one if several match"""
+    location = location.lower()
+    if location.startswith("www."):
+        location = location[len("www."):]
+    matches = [site for site in sites if location == site or location.startswith(site.rstrip("/") + "/")]
+    return max(matches, key=len) if matches else None
+
+
+def _snapshot_location(root: str, path: str) -> str:
+    location = os.path.relpath(path, root).replace(os.sep, "/")
+    if location.endswith("/index.html") or location.endswith("/index.htm"):
+        location = location.rsplit("/", 1)[0] + "/"
+    return location
+
+
+def load_site_pages(root: str = SITE_SNAPSHOTS_PATH,
+                    trusted_sites: Dict[str, List[str]] = TRUSTED_SITES) -> List[SitePage]:
+    """Pages of the trusted sites found under `root`; files of other sites and empty pages are skipped"""
+    domains = site_domains(trusted_sites)
+    pages = []
+    for directory, _, files in os.walk(root):
+        for name in sorted(files):
+            if not name.lower().endswith(SNAPSHOT_EXTENSIONS):
+                continue
+            path = os.path.join(directory, name)
+            location = _snapshot_location(root, path)
+            site = site_for(location, domains)
+            if site is None:
+                continue
+            with open(path, encoding="utf-8", errors="replace") as f:
+                content = f.read()
+            if name.lower().endswith((".html", ".htm")):
+                title, text = html_to_text(content)
+            else:
+                title, text = os.path.splitext(name)[0], content.strip()
+            if not text:
+                continue
+            page_path = location.lower()
+            pages.append(SitePage(
+                url="https://" + location,
+                site=site,
+                domain=domains[site],
+                title=title or site,
+                text=text,
+                page_type="contact" if any(word in page_path for word in CONTACT_PATH_WORDS) else "content"
+            ))
+    pages.sort(key=lambda page: page.url)
+    return pages
+
+
+def _hash(value) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def page_chunks(pages: List[SitePage], chunk_size: int = SITE_MIRROR_CHUNK_SIZE,
+                chunk_overlap: int = SITE_MIRROR_CHUNK_OVERLAP) -> Tuple[List[str], List[str], List[Dict]]:
+    """Ids, documents and metadata of the pages' chunks, with the hashes initialize_db.sync_collection expects"""
+    ids = ["page_" + _hash(page.url)[:16] for page in pages]
+    # The title goes in front of the text so every first chunk says what the page is about
+    documents = [f"{page.title}\n{page.text}" for page in pages]
+    metadatas = [page.model_dump(exclude={"text"}) for page in pages]
+    ids, documents, metadatas = chunk_documents(ids, documents, metadatas, chunk_size, chunk_overlap)
+    for document, metadata in zip(documents, metadatas):
+        metadata["content_hash"] = _hash(document)
+        metadata["metadata_hash"] = _hash(metadata)
+    return ids, documents, metadatas
+
+
+def build_site_mirror(snapshots_path: str = SITE_SNAPSHOTS_PATH, batch_size: Optional[int] = None,
+                      workers: Optional[int] = None, chunk_size: int = SITE_MIRROR_CHUNK_SIZE,
+                      chunk_overlap: int = SITE_MIRROR_CHUNK_OVERLAP):
+    """Sync the snapshots into the mirror collection; only pages whose text changed are re-embedded"""
+    import chromadb
+    from chromadb.utils import embedding_functions
+    from src.utils.ingestion import DEFAULT_BATCH_SIZE, DEFAULT_WORKERS
+    from src.utils.initialize_db import sync_collection
+
+    pages = load_site_pages(snapshots_path)
+    if not pages:
+        # An empty sync would delete the whole mirror, e.g. when the path is wrong
+        print(f"No trusted site pages found under {snapshots_path}, mirror left as is.")
+        return None, None
+
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    collection = client.get_or_create_collection(
+        name=SITE_MIRROR_COLLECTION,
+        embedding_function=embedding_functions.DefaultEmbeddingFunction()
+    )
+    ids, documents, metadatas = page_chunks(pages, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    report = sync_collection(
+        collection, ids, documents, metadatas,
+        batch_size=batch_size or DEFAULT_BATCH_SIZE, workers=workers or DEFAULT_WORKERS
+    )
+    sites = sorted({page.site for page in pages})
+    print(
+        f"Mirrored {len(pages)} pages ({len(ids)} chunks) of {len(sites)} sites in {report.duration_seconds}s: "
+        f"{report.added} added, {report.updated} updated, {report.metadata_updated} metadata only, "
+        f"{report.deleted} deleted, {report.unchanged} unchanged."
+    )
+    return collection, report
+
+
+class SiteMirror:
+    """
+    Search over the mirrored trusted sites, used by the web fallback before any live search.
+    The collection is opened on first use; without it (mirror never built) every search misses.
+    """
+
+    def __init__(self, collection_name: str = SITE_MIRROR_COLLECTION, path: str = CHROMA_PATH,
+                 embed: Optional[Callable[[str], List[float]]] = None, n_results: int = SITE_MIRROR_N_RESULTS,
+                 max_distance: float = SITE_MIRROR_MAX_DISTANCE, collection=None):
+        self.collection_name = collection_name
+        self.path = path
+        self.embed = embed
+        self.n_results = n_results
+        self.max_distance = max_distance
+        self._collection = collection
+        self._opened = collection is not None
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _open(self):
+        import chromadb
+        from src.utils import vectorstore
+        client = chromadb.PersistentClient(path=self.path)
+        return client.get_collection(name=self.collection_name, embedding_function=vectorstore.get_embedding_function())
+
+    def collection(self):
+        with self._lock:
+            if not self._opened:
+                self._opened = True
+                try:
+                    self._collection = self._open()
+                except Exception as e:
+                    logger.info(f"No site mirror collection '{self.collection_name}', using live search only: {e}")
+            return self._collection
+
+    def reload(self) -> None:
+        """Open the collection again on next use, e.g. after build_site_mirror ran"""
+        with self._lock:
+            self._collection = None
+            self._opened = False
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def search(self, query: str, sites: List[str]) -> List[Dict]:
+        """Best chunk of the closest pages of `sites` within max_distance, at most n_results pages"""
+        self._count("searches")
+        collection = self.collection()
+        if collection is None or not sites:
+            self._count("misses")
+            return []
+        try:
+            query_input = {"query_embeddings": [self.embed(query)]} if self.embed else {"query_texts": [query]}
+            results = collection.query(
+                **query_input,
+                n_results=self.n_results * 3,  # several chunks of one page can rank high
+                where={"site": {"$in": list(sites)}},
+                include=["documents", "metadatas", "distances"]
+            )
+        except Exception as e:
+            logger.warning(f"Site mirror search failed, falling back to live search: {e}")
+            self._count("errors")
+            return []
+
+        hits, seen = [], set()
+        for document, metadata, distance in zip(
+                results["documents"][0], results["metadatas"][0], results["distances"][0]):
+            if distance > self.max_distance or metadata["url"] in seen:
+                continue
+            seen.add(metadata["url"])
+            hits.append({
+                "url": metadata["url"],
+                "site": metadata["site"],
+                "title": metadata.get("title", ""),
+                "document": document,
+                "distance": round(float(distance), 4),
+            })
+            if len(hits) == self.n_results:
+                break
+        self._count("hits" if hits else "misses")
+        return hits
+
+    def contacts(self, sites: List[str], max_chars: int = 1000) -> List[Dict]:
+        """Text of the mirrored contact pages of `sites`, in the shape of web_agent.get_contact_info"""
+        collection = self.collection()
+        if collection is None or not sites:
+            return []
+        try:
+            results = collection.get(
+                where={"$and": [{"site": {"$in": list(sites)}}, {"page_type": "contact"}]},
+                include=["documents", "metadatas"]
+            )
+        except Exception as e:
+            logger.warning(f"Site mirror contact lookup failed: {e}")
+            return []
+        contact_info = {}
+        for document, metadata in zip(results["documents"], results["metadatas"]):
+            text = contact_info.get(metadata["site"], "")
+            if len(text) < max_chars:
+                contact_info[metadata["site"]] = (text + "\n" + document).strip()[:max_chars]
+        return [{"domain": site, "contact_info": info} for site, info in contact_info.items()]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "available": self._collection is not None,
+                "searches": self.searches,
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "hit_rate": self.hits / self.searches if self.searches else 0.0,
+            }
+
+
+def format_results(hits: List[Dict]) -> str:
+    """Mirror hits as text in the shape of the DuckDuckGo results the summary prompt gets"""
+    return "\n".join(f"snippet: {hit['document']}, title: {hit['title']}, link: {hit['url']}" for hit in hits)
+
+
+def _embed_query(text: str) -> List[float]:
+    from src.utils import vectorstore
+    return vectorstore.embed_query(text)
+
+
+site_mirror = SiteMirror(embed=_embed_query)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index local snapshots of the trusted sites for the web fallback")
+    parser.add_argument("--snapshots", default=SITE_SNAPSHOTS_PATH, help="Directory with one folder per site host")
+    parser.add_argument("--batch-size", type=int, default=None, help="Documents per embedding/write batch")
+    parser.add_argument("--workers", type=int, default=None, help="Embedding processes (1 to embed in-process)")
+    parser.add_argument("--chunk-size", type=int, default=SITE_MIRROR_CHUNK_SIZE, help="Words per page chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=SITE_MIRROR_CHUNK_OVERLAP, help="Words shared by consecutive chunks")
+    args = parser.parse_args()
+
+    build_site_mirror(
+        args.snapshots,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Any, Callable, Dict, Optional
+from src.utils.caching import TTLCache
+import os
+import threading
+import uuid
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() == "true"
+SPECULATION_WORKERS = int(os.getenv("SPECULATION_WORKERS", "4"))
+# How long the consumer waits for speculative work that hasn't finished yet before doing it itself
+SPECULATION_WAIT_SECONDS = float(os.getenv("SPECULATION_WAIT_SECONDS", "0.5"))
+# Speculations nobody claimed are dropped after this many seconds
+SPECULATION_TTL = float(os.getenv("SPECULATION_TTL", "120"))
+
+
+class Speculator:
+    """
+    Runs work that will probably be needed later in a thread pool, identified by a token that
+    travels in the graph state. The consumer `take`s the result, or the producer `cancel`s it
+    once the route makes it useless. A running thread can't be interrupted, so cancelling a started
+    job only discards its result; jobs still queued don't run at all.
+    """
+
+    def __init__(self, workers: int = SPECULATION_WORKERS, ttl: float = SPECULATION_TTL):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="speculation")
+        self._futures = TTLCache(maxsize=1024, ttl=ttl)
+        self._lock = threading.Lock()
+        self.started = 0
+        self.taken = 0
+        self.timed_out = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def start(self, fn: Callable, *args, **kwargs) -> str:
+        """Submit fn(*args, **kwargs) and return the token to claim its result with"""
+        token = uuid.uuid4().hex
+        self._futures.set(token, self._executor.submit(fn, *args, **kwargs))
+        with self._lock:
+            self.started += 1
+        return token
+
+    def take(self, token: Optional[str], timeout: float = SPECULATION_WAIT_SECONDS) -> Optional[Any]:
+        """Result of the speculation, or None if it is unknown, failed or not done within `timeout`"""
+        future = self._futures.pop(token) if token else None
+        if future is None:
+            return None
+        try:
+            result = future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timed_out += 1
+            return None
+        except Exception as e:
+            logger.warning(f"Speculative work failed: {e}")
+            with self._lock:
+                self.failed += 1
+            return None
+        with self._lock:
+            self.taken += 1
+        return result
+
+    def cancel(self, token: Optional[str]) -> None:
+        """Drop a speculation whose result won't be needed"""
+        future = self._futures.pop(token) if token else None
+        if future is not None:
+            future.cancel()
+            with self._lock:
+                self.cancelled += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "started": self.started,
+                "taken": self.taken,
+                "timed_out": self.timed_out,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+            }
+
+
+speculator = Speculator()
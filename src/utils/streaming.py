@@ -0,0 +1,125 @@
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import threading
+import time
+
+# Nodes whose LLM tokens are the answer shown to the user; the query analysis and the
+# review calls also run through chat models but their tokens are not user-facing
+ANSWER_NODES = ("rag",)
+# Nodes whose last message is the complete reply
+MESSAGE_NODES = ("emergency", "await_clarification")
+
+
+def sse_event(event: str, data: Dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _content_text(content) -> str:
+    # Anthropic chunks carry either a string or a list of content blocks
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block.get("text", "") for block in content
+        if isinstance(block, dict) and block.get("type", "text") == "text"
+    )
+
+
+def _message_content(message) -> str:
+    if isinstance(message, dict):
+        return message.get("content", "")
+    return getattr(message, "content", "")
+
+
+def graph_events(mode: str, chunk, answer_nodes: Iterable[str] = ANSWER_NODES) -> List[Tuple[str, Dict]]:
+    """
+    Translate one chunk of `graph.stream(..., stream_mode=["updates", "messages"])` into
+    (event, data) pairs for the client:
+    - "route": a node finished, with the query type once query understanding has run
+    - "message": the complete emergency or clarification reply
+    - "token": a piece of the generated answer
+    - "final": the complete answer after review or from the web search fallback
+    """
+    events = []
+    if mode == "messages":
+        message_chunk, metadata = chunk
+        if metadata.get("langgraph_node") in answer_nodes:
+            text = _content_text(message_chunk.content)
+            if text:
+                events.append(("token", {"text": text}))
+        return events
+
+    if mode != "updates":
+        return events
+    for node, update in chunk.items():
+        update = update or {}
+        route = {"node": node}
+        analysis = update.get("analysis")
+        if analysis:
+            route["query_type"] = analysis.get("query_type")
+            route["domains"] = analysis.get("domains")
+        events.append(("route", route))
+
+        if node in MESSAGE_NODES and update.get("messages"):
+            events.append(("message", {"text": _message_content(update["messages"][-1])}))
+        elif update.get("final_response"):
+            events.append(("final", {"text": update["final_response"]["text"]}))
+        elif update.get("web_agent_response"):
+            events.append(("final", {"text": update["web_agent_response"]["web_agent_response"]}))
+    return events
+
+
+class TimeToFirstToken:
+    """
+    Time between receiving a chat request and sending the first piece of the reply
+    (a token, or the full message on routes that don't generate), over the last `window` requests.
+    """
+
+    def __init__(self, window: int = 500):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def start(self) -> "FirstTokenTimer":
+        return FirstTokenTimer(self)
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self.requests += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            samples = sorted(self._samples)
+            requests = self.requests
+
+        def percentile(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 1)
+
+        return {
+            "requests": requests,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(samples[-1] * 1000, 1) if samples else None,
+        }
+
+
+class FirstTokenTimer:
+    """Per-request timer; `first_output()` records once and returns the elapsed seconds"""
+
+    def __init__(self, tracker: TimeToFirstToken):
+        self.tracker = tracker
+        self.start = time.perf_counter()
+        self.elapsed = None
+
+    def first_output(self) -> Optional[float]:
+        if self.elapsed is None:
+            self.elapsed = time.perf_counter() - self.start
+            self.tracker.record(self.elapsed)
+        return self.elapsed
+
+
+time_to_first_token = TimeToFirstToken()
@@ -0,0 +1,31 @@
+from typing import Dict, Iterable, Optional
+import re
+
+
+def _char_pattern(char: str) -> str:
+    return r"\s+" if char == " " else re.escape(char)
+
+
+def _trie_pattern(node: Dict) -> str:
+    branches = [_char_pattern(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char != ""]
+    if not branches:
+        return ""
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if "" in node:
+        # A term ends here but a longer one continues: the greedy optional group prefers the longest
+        pattern = "(?:" + pattern + ")?"
+    return pattern
+
+
+def compile_terms(terms: Iterable[str]) -> Optional[re.Pattern]:
+    """One case-insensitive regex for all terms, built from a character trie so matching is a single pass"""
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    if not trie:
+        return None
+    # Plural forms are matched too, in the "suffix" group
+    return re.compile(r"(?<!\w)(?P<term>" + _trie_pattern(trie) + r")(?P<suffix>e?s)?(?!\w)", re.IGNORECASE)
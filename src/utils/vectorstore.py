@@ -0,0 +1,157 @@
+from src.utils.caching import TTLCache, normalize_text
+from src.utils.lexical_index import BM25Index
+from src.utils.retrievers import ChromaRetriever, NumpyRetriever, Retriever
+import chromadb
+from chromadb.errors import InvalidCollectionException
+from chromadb.utils import embedding_functions
+import threading
+import os
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configuration
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+COLLECTION_NAME = os.getenv("CHROMA_COLLECTION", "test_collection")
+# "chroma" (HNSW index) or "numpy" (memory-mapped exhaustive search, see retrievers.NumpyRetriever)
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "chroma")
+NUMPY_INDEX_PATH = os.getenv("NUMPY_INDEX_PATH", "./numpy_index")
+# Lexical (BM25) index written at ingestion time next to the Chroma collection
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", os.path.join(CHROMA_PATH, "bm25_index.json"))
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "86400"))
+# How often the data version written by initialize_db.sync_collection is re-read from the collection
+DATA_VERSION_CHECK_SECONDS = float(os.getenv("DATA_VERSION_CHECK_SECONDS", "30"))
+
+
+class RetrievalResources:
+    """Chroma client, embedding model, collection and retriever shared by every request in the process"""
+
+    def __init__(self, path: str = CHROMA_PATH, collection_name: str = COLLECTION_NAME, generation: int = 0,
+                 backend: str = RETRIEVER_BACKEND):
+        self.path = path
+        self.collection_name = collection_name
+        self.backend = backend
+        # Bumped on every rebuild so caches built on top of the collection can tell they are stale
+        self.generation = generation
+
+        # The ONNX MiniLM model is the expensive part, build it once and reuse it everywhere
+        self.embedding_function = embedding_functions.DefaultEmbeddingFunction()
+
+        if backend == "numpy":
+            # The NumPy index is self-contained, Chroma is only needed to ingest
+            self.client = None
+            self.collection = None
+            self.retriever = NumpyRetriever(NUMPY_INDEX_PATH)
+        elif backend == "chroma":
+            self.client = chromadb.PersistentClient(path=path)
+            try:
+                self.collection = self.client.get_collection(
+                    name=collection_name,
+                    embedding_function=self.embedding_function
+                )
+            except (ValueError, InvalidCollectionException):  # Collection doesn't exist
+                raise ValueError("Collection doesn't exist")
+            self.retriever = ChromaRetriever(self.collection)
+        else:
+            raise ValueError(f"Unknown retriever backend: {backend}")
+
+        self.lexical_index = None
+        if HYBRID_RETRIEVAL:
+            if os.path.exists(BM25_INDEX_PATH):
+                self.lexical_index = BM25Index.load(BM25_INDEX_PATH)
+            else:
+                logger.warning(f"No BM25 index at {BM25_INDEX_PATH}, falling back to dense retrieval only")
+
+        logger.info(f"Retrieval resources ready (backend={backend}, collection={collection_name}, generation={generation})")
+
+
+_resources = None
+_lock = threading.Lock()
+
+# Query embeddings keyed on the normalized query text, shared by all requests in the process
+query_embedding_cache = TTLCache(maxsize=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL)
+_data_version_cache = TTLCache(maxsize=1, ttl=DATA_VERSION_CHECK_SECONDS)
+
+
+def get_resources() -> RetrievalResources:
+    """Return the process-wide retrieval resources, creating them on first use"""
+    global _resources
+    resources = _resources
+    if resources is None:
+        with _lock:
+            # Another thread may have built them while we were waiting for the lock
+            if _resources is None:
+                _resources = RetrievalResources()
+            resources = _resources
+    return resources
+
+
+def rebuild_resources() -> RetrievalResources:
+    """Drop the current resources and open the collection again, e.g. after re-ingestion"""
+    global _resources
+    with _lock:
+        generation = _resources.generation + 1 if _resources is not None else 0
+        _resources = RetrievalResources(generation=generation)
+        # A rebuild may come with a different embedding model, so cached vectors can't be trusted
+        query_embedding_cache.clear()
+        _data_version_cache.clear()
+        return _resources
+
+
+def get_collection():
+    """Shortcut for the shared Chroma collection"""
+    return get_resources().collection
+
+
+def get_retriever() -> Retriever:
+    """Shortcut for the configured retrieval backend"""
+    return get_resources().retriever
+
+
+def get_lexical_index():
+    """Shortcut for the BM25 index, None when hybrid retrieval is off or the index wasn't built"""
+    return get_resources().lexical_index
+
+
+def get_embedding_function():
+    """Shortcut for the shared embedding model"""
+    return get_resources().embedding_function
+
+
+def embed_query(text: str) -> list:
+    """Embed a single query with the shared embedding model, reusing cached vectors for repeated queries"""
+    return query_embedding_cache.get_or_set(
+        normalize_text(text),
+        lambda: [float(x) for x in get_embedding_function()([text])[0]]
+    )
+
+
+def _read_data_version(resources: RetrievalResources):
+    if resources.client is None:
+        # The NumPy backend serves what it loaded until the next rebuild, the generation covers it
+        return None
+    try:
+        collection = resources.client.get_collection(
+            name=resources.collection_name, embedding_function=resources.embedding_function
+        )
+    except Exception as e:
+        logger.warning(f"Could not read the data version of {resources.collection_name}: {e}")
+        return None
+    return (collection.metadata or {}).get("data_version")
+
+
+def data_version():
+    """
+    Version of the ingested data (see initialize_db.sync_collection), re-read from the collection at
+    most every DATA_VERSION_CHECK_SECONDS since another process may have re-ingested in the meantime
+    """
+    resources = get_resources()
+    return _data_version_cache.get_or_set(resources.generation, lambda: _read_data_version(resources))
+
+
+def data_generation():
+    """What answers built on the retrieved data depend on: the loaded resources and the data they see"""
+    return get_resources().generation, data_version()
@@ -22,6 +22,8 @@ from src.agents import (
     response_quality,
     web_agent
 )
+from src.utils import vectorstore
+from src.utils.streaming import graph_events, time_to_first_token
 
 st.title("Helpful Information as Aid")
 
@@ -32,6 +34,7 @@ class ConversationState(TypedDict):
     query: str  # Current user query
     location: Optional[str]  # Optional location context
     analysis: Optional[query_understanding.QueryAnalysis]
+    speculation_token: Optional[str]  # Retrieval started on the raw query during query understanding
     # Analysis from query understanding, which has all the context we need
     # To keep consistency in conversation (language, emotional state, extracted_entities,
     # domains, query_type, etc.)
@@ -168,6 +171,19 @@ class ChatResponse(BaseModel):
 # Initialize conversation graph
 conversation_graph = build_conversation_graph()
 
+
+@st.cache_resource
+def load_retrieval_resources():
+    """Open the vectorstore and load the embedding model once per Streamlit server process"""
+    return vectorstore.get_resources()
+
+
+try:
+    load_retrieval_resources()
+except ValueError as e:
+    # Not cached on failure, so the next rerun tries again
+    print(f"Vectorstore not available at startup: {e}")
+
 def chat(chat_input: ChatInput) -> ChatResponse:
     """Handle chat requests"""
 
@@ -209,11 +225,49 @@ def chat(chat_input: ChatInput) -> ChatResponse:
         print(f"Error processing request: {e}")
         raise HTTPException(status_code=500, detail=repr(e))
 
+
+def chat_stream(chat_input: ChatInput):
+    """Handle chat requests, yielding the reply piece by piece for st.write_stream"""
+
+    initial_state = {
+        "messages": chat_input.history,  # Conversation history
+        "query": chat_input.message,
+        "location": chat_input.location,
+        "analysis": None,  # For query understanding output
+        "initial_response": None,  # For RAG output
+        "query_context": None,  # For RAG output
+        "final_response": None  # For response quality output
+    }
+
+    timer = time_to_first_token.start()
+    streamed_tokens = False
+    for mode, chunk in conversation_graph.stream(initial_state, stream_mode=["updates", "messages"]):
+        for event, data in graph_events(mode, chunk):
+            if event == "token":
+                timer.first_output()
+                streamed_tokens = True
+                yield data["text"]
+            elif event in ("message", "final") and not streamed_tokens:
+                # Routes without token generation arrive as one complete message
+                timer.first_output()
+                yield data["text"]
+    print(f"Time to first token: {timer.elapsed:.2f}s" if timer.elapsed is not None else "No reply produced")
+
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
 location = st.text_input("Your location (optional):", key="location_input")
 
+# Function to display messages in the chat
+def display_chat_messages() -> None:
+    """Display the conversation history."""
+    for message in st.session_state.messages:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+
+# Display chat messages from history
+display_chat_messages()
+
 
 if prompt := st.chat_input("How can I help you today?"):
 
@@ -223,15 +277,10 @@ if prompt := st.chat_input("How can I help you today?"):
         location=location if location else None
     )
     st.session_state.messages.append({"role": "user", "content": prompt})
-    result = chat(chat_input=current_input)
-    st.session_state.messages.append({"role": "assistant", "content": result.response})
+    with st.chat_message("user"):
+        st.markdown(prompt)
 
-# Function to display messages in the chat
-def display_chat_messages() -> None:
-    """Display the conversation history."""
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
-
-# Display chat messages from history
-display_chat_messages()
+    # Render the answer as it is generated
+    with st.chat_message("assistant"):
+        response = st.write_stream(chat_stream(chat_input=current_input))
+    st.session_state.messages.append({"role": "assistant", "content": response})
@@ -0,0 +1,36 @@
+import pytest
+
+from src.utils.adaptive_retrieval import choose_k
+
+
+def hits(*distances):
+    return [{"id": f"doc_{i}", "distance": distance} for i, distance in enumerate(distances)]
+
+
+@pytest.mark.parametrize("distances, kwargs, expected_k, reason", [
+    ((), {}, 0, "no hits"),
+    ((0.5,), {}, 1, "single hit"),
+    # One hit far ahead of the rest
+    ((0.2, 0.6, 0.65), {}, 1, "top hit dominates"),
+    ((0.2, 0.6, 0.65), {"min_k": 2}, 2, "top hit dominates"),
+    # Cut at the first jump of at least `gap`
+    ((0.5, 0.55, 0.6, 0.8, 0.85), {}, 3, "distance gap 0.20 after hit 3"),
+    ((0.5, 0.7, 0.72, 0.74), {}, 1, "distance gap 0.20 after hit 1"),
+    # min_k skips jumps before it
+    ((0.5, 0.7, 0.72, 0.74), {"min_k": 2}, 3, "default"),
+    # Top default_k hits nearly tied: widen up to max_k
+    ((0.5, 0.51, 0.52, 0.53, 0.54, 0.55, 0.56), {}, 6, "widened"),
+    ((0.5, 0.51, 0.52, 0.53), {}, 4, "widened"),
+    ((0.5, 0.51, 0.52, 0.53, 0.54), {"max_k": 4}, 4, "widened"),
+    # Evenly spread hits keep default_k, or all of them when there are fewer
+    ((0.5, 0.55, 0.6, 0.65, 0.7), {}, 3, "default"),
+    ((0.5, 0.6), {}, 2, "default"),
+    ((0.5, 0.55, 0.6, 0.65, 0.7), {"default_k": 4}, 4, "default"),
+    # Lexical-only hits (no distance) tie with the hit before them
+    ((0.5, None, None, 0.9), {}, 3, "distance gap 0.40 after hit 3"),
+    ((None, 0.4), {}, 1, "top hit dominates"),
+])
+def test_choose_k(distances, kwargs, expected_k, reason):
+    k, why = choose_k(hits(*distances), **kwargs)
+    assert k == expected_k
+    assert reason in why
@@ -0,0 +1,219 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from src.agents import query_understanding, rag, response_quality, web_agent
+from src.agents.query_understanding import QueryAnalysis
+from src.utils import vectorstore
+from src.utils.caching import TTLCache
+from src.utils.emergency import EmergencyClassifier, load_phrases
+from src.utils.inclusive_language import InclusiveLanguageRewriter, extract_rules
+from src.utils.retrievers import Retriever, matches_where
+from src.utils.semantic_cache import SemanticCache
+
+ANALYSIS = {
+    "query_type": "clear",
+    "domains": ["Food & Clothing"],
+    "emotional_state": "calm",
+    "language": "english",
+    "confidence": 0.9,
+    "extracted_entities": {"location": "Utrecht"},
+}
+
+
+class FakeLLM:
+    """Chat model stand-in: returns the given replies in order and records the messages it got"""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    def with_structured_output(self, schema):
+        return self
+
+    def invoke(self, messages):
+        raise AssertionError("the async nodes must not call invoke")
+
+    async def ainvoke(self, messages):
+        self.calls.append(messages)
+        return self.replies.pop(0)
+
+
+def reply(text):
+    return SimpleNamespace(content=text)
+
+
+class FakeRetriever(Retriever):
+    def __init__(self, hits):
+        self.hits = sorted(hits, key=lambda hit: hit["distance"])
+
+    def search(self, query_embedding, n_results, where=None):
+        return [hit for hit in self.hits if matches_where(hit["metadata"], where)][:n_results]
+
+
+def offer(doc_id, text, distance, domain="food & clothing", municipality="utrecht"):
+    return {
+        "id": doc_id,
+        "document": text,
+        "distance": distance,
+        "embedding": [1.0, 0.0],
+        "metadata": {
+            "domain": domain, "municipality": municipality, "source": "voedselbank.nl",
+            "last_updated": "2024-05-01", "contact": '{"phone": "030 123 4567"}',
+        },
+    }
+
+
+@pytest.fixture
+def retrieval(monkeypatch):
+    """Fake vectorstore: fixed offers, no lexical index, a fresh answer cache"""
+    retriever = FakeRetriever([offer("food_utrecht", "Voedselbank Utrecht, elke dinsdag open", 0.3)])
+    resources = SimpleNamespace(generation=0)
+    monkeypatch.setattr(vectorstore, "get_retriever", lambda: retriever)
+    monkeypatch.setattr(vectorstore, "get_lexical_index", lambda: None)
+    monkeypatch.setattr(vectorstore, "embed_query", lambda text: [1.0, 0.0])
+    monkeypatch.setattr(vectorstore, "get_resources", lambda: resources)
+    monkeypatch.setattr(vectorstore, "data_generation", lambda: (0, None))
+    monkeypatch.setattr(rag, "answer_cache", SemanticCache(threshold=0.95, maxsize=8, ttl=None))
+    return retriever
+
+
+@pytest.fixture
+def llms(monkeypatch):
+    """One fake chat model per agent module"""
+    fakes = {name: FakeLLM() for name in ("query_understanding", "rag", "response_quality", "web_agent")}
+    for name, module in (("query_understanding", query_understanding), ("rag", rag),
+                         ("response_quality", response_quality), ("web_agent", web_agent)):
+        monkeypatch.setattr(module, "get_llm", lambda model, fake=fakes[name]: fake)
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    return fakes
+
+
+@pytest.fixture
+def analysis_cache(monkeypatch):
+    """Analysis cache that records which thread reads and writes it"""
+
+    class RecordingCache(TTLCache):
+        def __init__(self):
+            super().__init__(maxsize=8, ttl=None)
+            self.threads = []
+
+        def get(self, key, default=None):
+            self.threads.append(threading.current_thread())
+            return super().get(key, default)
+
+        def set(self, key, value):
+            self.threads.append(threading.current_thread())
+            super().set(key, value)
+
+    cache = RecordingCache()
+    monkeypatch.setattr(query_understanding, "analysis_cache", cache)
+    monkeypatch.setattr(query_understanding, "emergency_classifier", EmergencyClassifier(load_phrases(path=None)))
+    return cache
+
+
+@pytest.fixture
+def guideline(monkeypatch):
+    rules = extract_rules({"comms": [{"Avoid": "the disabled", "Preferred": "people with disabilities"},
+                                     {"Avoid": "victim", "Preferred": "survivor", "Note": "Ask how they describe it"}]})
+    monkeypatch.setattr(response_quality, "language_rewriter", InclusiveLanguageRewriter(rules))
+
+
+def test_async_query_understanding_routes_and_caches_off_the_event_loop(llms, analysis_cache, monkeypatch):
+    monkeypatch.setattr(query_understanding, "SPECULATIVE_RETRIEVAL", False)
+    llms["query_understanding"].replies = [QueryAnalysis(**ANALYSIS)]
+    state = {"query": "Where can I get food?", "location": "Utrecht", "messages": []}
+
+    command = asyncio.run(query_understanding.aquery_understanding_node(state))
+    assert command.goto == "rag"
+    assert command.update["query_context"]["domains"] == ["Food & Clothing"]
+
+    # Asked again: served from the cache without the LLM
+    command = asyncio.run(query_understanding.aquery_understanding_node(state))
+    assert command.goto == "rag"
+    assert len(llms["query_understanding"].calls) == 1
+    assert analysis_cache.threads and threading.main_thread() not in analysis_cache.threads
+
+
+def test_async_query_understanding_emergency_skips_the_llm(llms, analysis_cache):
+    state = {"query": "He is hitting me right now", "location": None, "messages": []}
+    command = asyncio.run(query_understanding.aquery_understanding_node(state))
+    assert command.goto == "emergency"
+    assert llms["query_understanding"].calls == []
+
+
+def test_async_rag_generates_from_the_retrieved_offers(retrieval, llms):
+    llms["rag"].replies = [reply("The food bank in Utrecht is open on Tuesdays.")]
+    query_context = {"original_query": "Where can I get food?", "domains": ["Food & Clothing"],
+                     "entities": {"location": "Utrecht"}, "language": "english"}
+
+    command = asyncio.run(rag.arag_node({"query_context": query_context, "speculation_token": None}))
+    assert command.goto == "response_quality"
+    response = command.update["initial_response"]
+    assert response["text"] == "The food bank in Utrecht is open on Tuesdays."
+    assert response["relevant_chunks"] == ["Voedselbank Utrecht, elke dinsdag open"]
+    assert "Voedselbank Utrecht" in llms["rag"].calls[0][0]["content"]
+
+
+def test_async_rag_without_relevant_offers_goes_to_the_web_agent(retrieval, llms):
+    retrieval.hits = [offer("far", "Kledingbank", 1.9)]
+    query_context = {"original_query": "Where can I get food?", "domains": ["Food & Clothing"],
+                     "entities": {}, "language": "english"}
+    command = asyncio.run(rag.arag_node({"query_context": query_context, "speculation_token": None}))
+    assert command.goto == "web_agent"
+    assert llms["rag"].calls == []
+
+
+def test_async_response_quality_rewrites_locally_and_reviews_the_rest(llms, guideline):
+    llms["response_quality"].replies = [reply("Support for every survivor, also for people with disabilities.")]
+    initial_response = {
+        "text": "Support for every victim, also for the disabled.",
+        "metadata": {"source": "", "last_updated": "2024-05-01T00:00:00", "contact_info": {},
+                     "completeness_score": 1, "confidence_score": 1},
+        "relevant_chunks": [], "domains_covered": [],
+    }
+    command = asyncio.run(response_quality.aresponse_quality_node({"initial_response": initial_response}))
+    assert command.update["final_response"]["text"] == "Support for every survivor, also for people with disabilities."
+    # Only the context-dependent term went to the LLM, after the local replacement
+    assert llms["response_quality"].calls[0][1]["content"] == "Support for every victim, also for people with disabilities."
+
+
+def test_async_web_agent_searches_and_summarises(llms, monkeypatch):
+    searches = []
+    monkeypatch.setattr(web_agent, "SITE_MIRROR_ENABLED", False)
+    monkeypatch.setattr(web_agent, "cached_search", lambda query: searches.append(query) or "no links here")
+    llms["web_agent"].replies = [reply("voedselbank utrecht"), reply("Go to the food bank.")]
+    query_context = {"original_query": "Where can I get food?", "domains": ["Food & Clothing"],
+                     "entities": {"location": "Utrecht"}, "language": "english"}
+
+    command = asyncio.run(web_agent.aweb_agent_node({"query_context": query_context}))
+    assert command.update["web_agent_response"] == {"web_agent_response": "Go to the food bank."}
+    assert searches[0].startswith("voedselbank utrecht")
+    assert "site:voedselbank.nl" in searches[0]
+
+
+def test_graph_answers_from_the_offers_with_ainvoke(retrieval, llms, analysis_cache, guideline):
+    llms["query_understanding"].replies = [QueryAnalysis(**ANALYSIS)]
+    llms["rag"].replies = [reply("The food bank helps the disabled too.")]
+    graph = main.build_conversation_graph()
+
+    result = asyncio.run(graph.ainvoke({"query": "Where can I get food?", "location": "Utrecht", "messages": []}))
+    assert result["final_response"]["text"] == "The food bank helps people with disabilities too."
+    assert result.get("web_agent_response") is None
+    assert llms["response_quality"].calls == []
+
+
+def test_graph_falls_back_to_the_web_with_ainvoke(retrieval, llms, analysis_cache, monkeypatch):
+    retrieval.hits = []
+    monkeypatch.setattr(web_agent, "SITE_MIRROR_ENABLED", False)
+    monkeypatch.setattr(web_agent, "cached_search", lambda query: "no links here")
+    llms["query_understanding"].replies = [QueryAnalysis(**ANALYSIS)]
+    llms["web_agent"].replies = [reply("voedselbank utrecht"), reply("Go to the food bank.")]
+    graph = main.build_conversation_graph()
+
+    result = asyncio.run(graph.ainvoke({"query": "Where can I get food?", "location": "Utrecht", "messages": []}))
+    assert result["web_agent_response"] == {"web_agent_response": "Go to the food bank."}
+    assert llms["rag"].calls == []
@@ -0,0 +1,114 @@
+import pytest
+from src.utils.caching import SQLiteTTLCache, TTLCache, normalize_text
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_normalize_text_ignores_case_and_whitespace():
+    assert normalize_text("  Where can I get FOOD\n in   Amsterdam ") == "where can i get food in amsterdam"
+
+
+def test_hit_and_miss_counters(clock):
+    cache = TTLCache(maxsize=2, ttl=10, clock=clock)
+    assert cache.get("food") is None
+    cache.set("food", [0.1, 0.2])
+    assert cache.get("food") == [0.1, 0.2]
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = TTLCache(maxsize=2, ttl=10, clock=clock)
+    cache.set("food", 1)
+    cache.set("shelter", 2)
+    cache.get("food")  # food is now the most recently used entry
+    cache.set("health", 3)
+
+    assert cache.get("shelter") is None
+    assert cache.get("food") == 1
+    assert cache.get("health") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = TTLCache(maxsize=2, ttl=10, clock=clock)
+    cache.set("food", 1)
+    clock.now = 11
+    assert cache.get("food") is None
+    assert cache.stats()["expirations"] == 1
+    assert len(cache) == 0
+
+
+def test_get_or_set_only_computes_on_miss(clock):
+    cache = TTLCache(maxsize=2, ttl=10, clock=clock)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "embedding"
+
+    assert cache.get_or_set("food", compute) == "embedding"
+    assert cache.get_or_set("food", compute) == "embedding"
+    assert len(calls) == 1
+
+
+def test_sqlite_cache_survives_reopening(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite")
+    cache = SQLiteTTLCache(path, maxsize=10, ttl=60, clock=clock)
+    cache.set(("i need food", ""), {"query_type": "clear", "domains": ["Food & Clothing"]})
+
+    reopened = SQLiteTTLCache(path, maxsize=10, ttl=60, clock=clock)
+    assert reopened.get(("i need food", "")) == {"query_type": "clear", "domains": ["Food & Clothing"]}
+    assert reopened.get(("i need food", "utrecht")) is None
+    assert reopened.stats()["hit_rate"] == 0.5
+
+
+def test_sqlite_cache_file_is_created_on_first_use(tmp_path, clock):
+    path = tmp_path / "cache" / "web_search.sqlite"
+    cache = SQLiteTTLCache(str(path), maxsize=10, ttl=60, clock=clock)
+    assert not path.parent.exists()
+    assert cache.stats()["size"] == 0
+    assert not path.parent.exists()
+
+    cache.set("voedselbank", "results")
+    assert path.exists()
+
+
+def test_sqlite_cache_expires_and_evicts_least_recently_used(tmp_path, clock):
+    cache = SQLiteTTLCache(str(tmp_path / "cache.sqlite"), maxsize=2, ttl=10, clock=clock)
+    cache.set("a", 1)
+    clock.now = 1
+    cache.set("b", 2)
+    clock.now = 2
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    clock.now = 3
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+
+    clock.now = 20
+    assert cache.get("c") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_pop_removes_the_entry(clock):
+    cache = TTLCache(maxsize=2, ttl=10, clock=clock)
+    cache.set("token", "future")
+    assert cache.pop("token") == "future"
+    assert cache.pop("token") is None
+    assert len(cache) == 0
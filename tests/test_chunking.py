@@ -0,0 +1,59 @@
+import math
+
+import pytest
+
+from src.utils.chunking import chunk_documents, chunk_text, collapse_chunks
+
+TEN_WORDS = "w0 w1 w2 w3 w4 w5 w6 w7 w8 w9"
+
+
+def test_short_texts_are_kept_as_one_chunk():
+    assert chunk_text("Voedselbank  Amsterdam", chunk_size=4, overlap=1) == ["Voedselbank  Amsterdam"]
+    assert chunk_text("w0 w1 w2 w3", chunk_size=4, overlap=1) == ["w0 w1 w2 w3"]
+
+
+def test_consecutive_chunks_share_overlap_words():
+    assert chunk_text(TEN_WORDS, chunk_size=4, overlap=1) == ["w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7 w8 w9"]
+    # The last window may be shorter, and no window is made of overlap alone
+    assert chunk_text("w0 w1 w2 w3 w4", chunk_size=4, overlap=2) == ["w0 w1 w2 w3", "w2 w3 w4"]
+    assert chunk_text(TEN_WORDS, chunk_size=5, overlap=0) == ["w0 w1 w2 w3 w4", "w5 w6 w7 w8 w9"]
+
+
+def test_overlap_must_be_smaller_than_the_chunk():
+    with pytest.raises(ValueError):
+        chunk_text(TEN_WORDS, chunk_size=4, overlap=4)
+
+
+def test_missing_text_from_the_csv_is_empty():
+    assert chunk_text(math.nan, chunk_size=4, overlap=1) == [""]
+    assert chunk_text(None, chunk_size=4, overlap=1) == [""]
+    ids, documents, _ = chunk_documents(["offer_0"], [math.nan], [{}], chunk_size=4, overlap=1)
+    assert (ids, documents) == (["offer_0#0"], [""])
+
+
+def test_chunk_documents_tags_chunks_with_their_parent():
+    ids, documents, metadatas = chunk_documents(["offer_0"], [TEN_WORDS], [{"domain": "Shelter"}], chunk_size=4, overlap=1)
+    assert ids == ["offer_0#0", "offer_0#1", "offer_0#2"]
+    assert metadatas[1] == {"domain": "Shelter", "parent_id": "offer_0", "chunk_index": 1, "chunk_count": 3}
+
+
+def chunk_hit(parent_id, index, distance):
+    return {
+        "id": f"{parent_id}#{index}",
+        "document": f"{parent_id} part {index}",
+        "metadata": {"parent_id": parent_id, "chunk_index": index},
+        "distance": distance,
+    }
+
+
+def test_chunks_collapse_to_their_parent_in_document_order():
+    hits = [chunk_hit("offer_a", 2, 0.3), chunk_hit("offer_b", 0, 0.4), chunk_hit("offer_a", 0, 0.5),
+            chunk_hit("offer_a", 1, 0.6), {"id": "plain", "document": "no chunks", "metadata": {}, "distance": 0.7}]
+    collapsed = collapse_chunks(hits)
+    # Parents keep the rank and distance of their best chunk
+    assert [(hit["id"], hit["distance"]) for hit in collapsed] == [("offer_a", 0.3), ("offer_b", 0.4), ("plain", 0.7)]
+    # At most two chunks per parent, joined in document order
+    assert collapsed[0]["document"] == "offer_a part 0\n...\noffer_a part 2"
+    assert collapsed[1]["document"] == "offer_b part 0"
+
+    assert collapse_chunks(hits, max_chunks_per_parent=3)[0]["document"].count("part") == 3
@@ -0,0 +1,61 @@
+from src.utils.context_packing import pack_context
+
+
+def hit(doc_id, embedding, rrf_score, length=400):
+    return {
+        "id": doc_id,
+        "document": doc_id * length,
+        "metadata": {},
+        "distance": 0.1,
+        "embedding": embedding,
+        "rrf_score": rrf_score,
+    }
+
+
+def test_duplicate_offers_are_kept_once():
+    shared = hit("a", [1.0, 0.0], 0.03)
+    packed = pack_context({"Food": [shared], "Shelter": [shared]}, token_budget=1000)
+    assert [h["id"] for h in packed] == ["a"]
+    assert packed[0]["domains"] == ["Food", "Shelter"]
+
+
+def test_every_domain_is_covered_before_filling_up():
+    results = {
+        "Food": [hit("a", [1.0, 0.0], 0.03), hit("b", [0.9, 0.1], 0.025)],
+        "Shelter": [hit("s", [0.0, 1.0], 0.01)],
+    }
+    packed = pack_context(results, token_budget=200)
+    assert {h["id"] for h in packed} == {"a", "s"}
+
+
+def test_mmr_prefers_diverse_offers():
+    results = {
+        "Food": [
+            hit("a", [1.0, 0.0], 0.030),
+            hit("b", [1.0, 0.01], 0.029),  # near duplicate of a
+            hit("c", [0.0, 1.0], 0.028),
+        ],
+    }
+    packed = pack_context(results, token_budget=200, mmr_lambda=0.5)
+    assert [h["id"] for h in packed] == ["a", "c"]
+
+
+def test_token_budget_is_respected():
+    results = {"Food": [hit("a", [1.0, 0.0], 0.03, length=4000), hit("b", [0.0, 1.0], 0.02)]}
+    packed = pack_context(results, token_budget=500)
+    # The only hit of a domain is truncated to fit rather than dropped
+    assert [h["id"] for h in packed] == ["a"]
+    assert sum(h["tokens"] for h in packed) <= 500
+
+
+def test_an_oversized_hit_does_not_push_out_the_other_domains():
+    results = {
+        "Shelter": [hit("a", [1.0, 0.0], 0.03, length=8000)],
+        "Food": [hit("f", [0.0, 1.0], 0.02, length=400)],
+        "Health": [hit("h", [0.5, 0.5], 0.01, length=4000)],
+    }
+    packed = pack_context(results, token_budget=1500)
+    assert [(h["id"], h["domains"]) for h in packed] == [("a", ["Shelter"]), ("f", ["Food"]), ("h", ["Health"])]
+    tokens = {h["id"]: h["tokens"] for h in packed}
+    # Shelter gets a third of the budget, Food what it needs, Health the rest
+    assert tokens == {"a": 500, "f": 100, "h": 900}
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from src.utils.csv_to_chroma import iter_csv_batches
+
+CSV = """text,source,last_updated,domain,email,phone,ignored
+Voedselbank Utrecht,voedselbank.nl,2024-01-01,food,info@voedselbank.nl,0301234567,x
+Nachtopvang,,2024-02-01,shelter,,020 765 4321,x
+"Taalles, gratis",amsterdam.nl,,education,les@amsterdam.nl,,x
+,rodekruis.nl,2024-03-01,,,,x
+Juridisch spreekuur,juridischloket.nl,2024-04-01,legal,,,x
+"""
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "offers.csv"
+    path.write_text(CSV, encoding="utf-8")
+    return path
+
+
+def test_batches_cover_every_row_with_consecutive_ids(csv_path):
+    batches = list(iter_csv_batches(csv_path, batch_size=2))
+    assert [len(ids) for ids, _, _ in batches] == [2, 2, 1]
+    assert [doc_id for ids, _, _ in batches for doc_id in ids] == [f"doc_{i}" for i in range(5)]
+    documents = [document for _, documents, _ in batches for document in documents]
+    assert documents == ["Voedselbank Utrecht", "Nachtopvang", "Taalles, gratis", "", "Juridisch spreekuur"]
+
+
+def test_metadata_is_built_column_wise_without_missing_values(csv_path):
+    metadatas = [metadata for _, _, batch in iter_csv_batches(csv_path, batch_size=2) for metadata in batch]
+    assert metadatas[0] == {
+        "source": "voedselbank.nl", "last_updated": "2024-01-01", "domain": "food",
+        "contact": '{"email": "info@voedselbank.nl", "phone": "0301234567"}',
+    }
+    # Missing fields are left out, phone numbers are kept as text
+    assert metadatas[1] == {"last_updated": "2024-02-01", "domain": "shelter", "contact": '{"phone": "020 765 4321"}'}
+    assert json.loads(metadatas[2]["contact"]) == {"email": "les@amsterdam.nl"}
+    assert "last_updated" not in metadatas[2]
+    # Rows without any contact details get no contact field, in the next batch too
+    assert metadatas[3] == {"source": "rodekruis.nl", "last_updated": "2024-03-01"}
+    assert metadatas[4] == {"source": "juridischloket.nl", "last_updated": "2024-04-01", "domain": "legal"}
+    assert all("ignored" not in metadata for metadata in metadatas)
+
+
+def test_missing_text_column_is_rejected(tmp_path):
+    path = tmp_path / "no_text.csv"
+    path.write_text("source,domain\nvoedselbank.nl,food\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="text column"):
+        list(iter_csv_batches(path, batch_size=2))
@@ -0,0 +1,90 @@
+import json
+
+from src.utils.emergency import EmergencyClassifier, load_phrases
+
+
+def make_classifier(**kwargs):
+    return EmergencyClassifier(load_phrases(path=None), **kwargs)
+
+
+def test_phrases_in_several_languages_are_caught():
+    classifier = make_classifier()
+    assert classifier.classify("he is hitting me right now").language == "english"
+    assert classifier.classify("Mijn man slaat me, help").language == "dutch"
+    assert classifier.classify("Чоловік мене б’є").language == "ukrainian"
+    assert classifier.classify("زوجي يضربني").language == "arabic"
+
+
+def test_regular_requests_are_not_emergencies():
+    classifier = make_classifier()
+    assert classifier.classify("Where can I find an emergency shelter in Utrecht?") is None
+    assert classifier.classify("I urgently need food for my children") is None
+    assert classifier.stats()["checks"] == 2
+
+
+def test_information_questions_with_generic_words_are_not_emergencies():
+    classifier = make_classifier()
+    for query in [
+        "What is the suicide prevention hotline number?",
+        "How do I report a rape to the police?",
+        "Are women in danger in the shelters in Utrecht?",
+        "¿Qué animales están en peligro de extinción?",
+        "Diş eti kanama için dişçi",
+        "suicide",
+        "What is the number of the suicide prevention hotline for my brother?",
+        "My friend was a victim of rape last year, where can she get counselling?",
+        "I am looking for a course on suicide prevention",
+        "Mijn moeder had vorig jaar een hartaanval, waar vind ik een huisarts?",
+        "Where can I call 112 from if I have no phone credit?",
+    ]:
+        assert classifier.classify(query) is None, query
+
+
+def test_generic_words_with_first_person_or_urgency_context_are_emergencies():
+    classifier = make_classifier()
+    assert classifier.classify("I am in danger").matched == "in danger"
+    assert classifier.classify("My brother is talking about suicide right now").matched == "suicide"
+    assert classifier.classify("Ik ben in gevaar").language == "dutch"
+    assert classifier.classify("Call 112 now, he collapsed").matched == "call 112"
+    assert classifier.classify("Estoy en peligro, ayúdame").language == "spanish"
+    assert classifier.classify("Çok kanama var, acil!").language == "turkish"
+    # Unambiguous phrases need no context
+    assert classifier.classify("how to stop someone who is hitting me").matched == "hitting me"
+
+
+def test_context_markers_only_count_in_the_phrase_language():
+    classifier = make_classifier()
+    # "ahora" is a Spanish marker, "in danger" an English phrase
+    assert classifier.classify("in danger ahora") is None
+    assert classifier.classify("Estoy en peligro") is not None
+
+
+def test_generic_words_without_context_go_to_the_embedding_check():
+    vocabulary = ["suicide", "food"]
+
+    def embed(text):
+        return [float(word in text.lower()) + 0.01 for word in vocabulary]
+
+    classifier = make_classifier(exemplars=["suicide"], embed=embed, max_distance=0.1)
+    assert classifier.classify("suicide").method == "embedding"
+
+
+def test_extra_phrases_file_is_merged(tmp_path):
+    path = tmp_path / "emergency_phrases.json"
+    path.write_text(json.dumps({"polish": ["on mnie bije"]}))
+    classifier = EmergencyClassifier(load_phrases(str(path)))
+    assert classifier.classify("On mnie bije!").language == "polish"
+
+
+def test_embedding_similarity_catches_paraphrases():
+    # Toy embedding: one dimension per keyword
+    vocabulary = ["scared", "pills", "food"]
+
+    def embed(text):
+        return [float(word in text.lower()) + 0.01 for word in vocabulary]
+
+    classifier = make_classifier(exemplars=["I am scared", "I took too many pills"], embed=embed, max_distance=0.1)
+    signal = classifier.classify("swallowed all the pills")
+    assert signal.method == "embedding"
+    assert signal.matched == "I took too many pills"
+    assert classifier.classify("where to get food") is None
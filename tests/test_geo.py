@@ -0,0 +1,47 @@
+import pytest
+
+from src.utils.geo import GridIndex, gazetteer, geocode, haversine_km, location_metadata, municipalities_near
+
+
+@pytest.mark.parametrize("address, municipality", [
+    ("Damrak 1, 1012 LG Amsterdam", "amsterdam"),
+    ("Amsterdamseweg 10, 3812 RS Amersfoort", "amersfoort"),  # the town comes last, street names don't count
+    ("Utrechtsestraat 5, Amsterdam", "amsterdam"),
+    ("Spui 70, 2511 BT Den Haag", "den haag"),
+    ("The Hague", "den haag"),
+    ("Hoofddorp", "haarlemmermeer"),
+    ("  ROTTERDAM ", "rotterdam"),
+])
+def test_addresses_resolve_to_their_municipality(address, municipality):
+    assert geocode(address)["municipality"] == municipality
+
+
+def test_unknown_places_get_an_empty_municipality():
+    assert geocode("Dorpsstraat 1, 9999 ZZ Nergenshuizen") is None
+    assert geocode(None) is None
+    assert location_metadata("Dorpsstraat 1, 9999 ZZ Nergenshuizen") == {"municipality": ""}
+    assert location_metadata(float("nan")) == {"municipality": ""}
+    assert location_metadata("Vredenburg 40, Utrecht")["lat"] == pytest.approx(52.09, abs=0.01)
+
+
+def test_haversine_amsterdam_rotterdam():
+    assert haversine_km(*gazetteer["amsterdam"], *gazetteer["rotterdam"]) == pytest.approx(57, abs=2)
+
+
+@pytest.mark.parametrize("centre", ["amsterdam", "groningen", "maastricht"])
+@pytest.mark.parametrize("radius_km", [0, 10, 25, 60])
+def test_grid_radius_lookup_matches_brute_force(centre, radius_km):
+    lat, lon = gazetteer[centre]
+    expected = sorted(
+        (haversine_km(lat, lon, *point), name) for name, point in gazetteer.items()
+        if haversine_km(lat, lon, *point) <= radius_km
+    )
+    assert GridIndex(gazetteer, cell_size_deg=0.1).within_radius(lat, lon, radius_km) == [name for _, name in expected]
+
+
+def test_municipalities_near_a_free_text_location():
+    near = municipalities_near("Amsterdam Centraal", 15)
+    assert near[0] == "amsterdam"
+    assert {"amstelveen", "zaanstad"} <= set(near)
+    assert "rotterdam" not in near
+    assert municipalities_near("somewhere unknown", 15) is None
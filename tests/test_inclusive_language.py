@@ -0,0 +1,73 @@
+import json
+
+from src.utils.inclusive_language import InclusiveLanguageRewriter, extract_rules, load_guidelines
+from src.utils.text_matching import compile_terms
+
+GUIDELINE = {
+    "comms": [
+        {"Avoid": "illegal immigrant, illegals", "Preferred Terms": "undocumented migrant"},
+        {"avoid": ["the disabled"], "preferred": ["people with disabilities"]},
+        {"Avoid": "victim", "Preferred": "survivor", "Note": "Depends on how the person describes themselves"},
+        "Avoid: homeless\nPreferred terms: people experiencing homelessness (as a group), unhoused",
+    ]
+}
+
+
+def make_rewriter():
+    return InclusiveLanguageRewriter(extract_rules(GUIDELINE))
+
+
+def test_rules_are_found_in_any_shape():
+    rules = extract_rules(GUIDELINE)
+    assert [rule.avoid for rule in rules] == [["illegal immigrant", "illegals"], ["the disabled"], ["victim"], ["homeless"]]
+    assert rules[3].preferred == ["people experiencing homelessness", "unhoused"]
+    assert rules[3].note == "as a group"
+
+
+def test_missing_guideline_file_gives_no_rules(tmp_path):
+    assert load_guidelines(str(tmp_path / "comms.json")) == []
+    assert InclusiveLanguageRewriter.from_file(str(tmp_path / "comms.json")).document is None
+
+    path = tmp_path / "comms.json"
+    path.write_text(json.dumps(GUIDELINE))
+    assert len(load_guidelines(str(path))) == 4
+
+
+def test_longest_term_wins():
+    pattern = compile_terms(["illegal", "illegal immigrant"])
+    assert pattern.search("an illegal  immigrant here").group("term") == "illegal  immigrant"
+    assert pattern.search("illegally") is None
+
+
+def test_drop_in_terms_are_replaced_locally_keeping_case():
+    rewrite = make_rewriter().rewrite("The disabled can get food here. An ILLEGAL IMMIGRANT too.")
+    assert rewrite.text == "People with disabilities can get food here. An UNDOCUMENTED MIGRANT too."
+    assert rewrite.context_rules == []
+
+
+def test_plural_terms_with_a_singular_replacement_are_left_for_review():
+    rewrite = make_rewriter().rewrite("The disabled and illegals can get food here.")
+    assert rewrite.text == "People with disabilities and illegals can get food here."
+    assert [rule.avoid[0] for rule in rewrite.context_rules] == ["illegal immigrant"]
+
+
+def test_context_dependent_terms_are_left_for_review():
+    rewriter = make_rewriter()
+    rewrite = rewriter.rewrite("Support for every victim, and for illegal immigrants.")
+    assert rewrite.text == "Support for every victim, and for illegal immigrants."
+    # A note makes a rule context-dependent, and so does a plural that needs inflecting
+    assert [rule.avoid[0] for rule in rewrite.context_rules] == ["victim", "illegal immigrant"]
+
+    rewriter.rewrite("Nothing to change here.")
+    stats = rewriter.stats()
+    assert stats["answers"] == 2
+    assert stats["answers_with_matches"] == 1
+    assert stats["context_matches"] == 2
+
+
+def test_unparseable_guideline_is_kept_for_a_full_review(tmp_path):
+    path = tmp_path / "comms.json"
+    path.write_text(json.dumps({"comms": [{"term": "illegals", "better": "undocumented migrants"}]}))
+    rewriter = InclusiveLanguageRewriter.from_file(str(path))
+    assert rewriter.rules == []
+    assert rewriter.document == [{"term": "illegals", "better": "undocumented migrants"}]
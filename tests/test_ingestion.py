@@ -0,0 +1,56 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from src.utils import ingestion
+from src.utils.ingestion import Throughput, embed_documents, peak_memory_mb
+
+
+class FakeEmbeddingFunction:
+    """One-dimensional embedding: the document length"""
+
+    def __call__(self, documents):
+        return [[len(document)] for document in documents]
+
+
+@pytest.fixture
+def fake_embeddings(monkeypatch):
+    monkeypatch.setattr(ingestion, "_embedding_function", FakeEmbeddingFunction())
+
+
+def test_peak_memory_adds_up_parent_and_workers(monkeypatch):
+    monkeypatch.setattr(ingestion, "_max_rss", lambda: 300 * 1024)
+    monkeypatch.setattr(ingestion.sys, "platform", "linux")
+    assert peak_memory_mb() == 300.0
+    assert peak_memory_mb({101: 200 * 1024, 102: 250 * 1024}) == 750.0
+
+
+def test_throughput_keeps_the_largest_peak_per_worker(monkeypatch):
+    monkeypatch.setattr(ingestion, "_max_rss", lambda: 0)
+    monkeypatch.setattr(ingestion.sys, "platform", "linux")
+    throughput = Throughput()
+    throughput.add_worker_peak(101, 100 * 1024)
+    throughput.add_worker_peak(101, 150 * 1024)
+    throughput.add_worker_peak(102, 50 * 1024)
+    throughput.add_worker_peak(101, 120 * 1024)
+    assert throughput.report()["peak_memory_mb"] == 200.0
+
+
+def test_no_peak_memory_without_the_resource_module(monkeypatch):
+    monkeypatch.setattr(ingestion, "resource", None)
+    assert peak_memory_mb({101: 0}) == 0.0
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="workers inherit the fake via fork")
+def test_workers_report_their_own_peak_memory(fake_embeddings):
+    documents = [f"offer {'x' * i}" for i in range(10)]
+    throughput = Throughput()
+    with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("fork")) as pool:
+        embeddings = embed_documents(documents, batch_size=3, pool=pool, throughput=throughput)
+
+    assert embeddings == [[len(document)] for document in documents]
+    assert throughput.worker_peaks and os.getpid() not in throughput.worker_peaks
+    assert all(peak > 0 for peak in throughput.worker_peaks.values())
+    assert throughput.report()["peak_memory_mb"] > peak_memory_mb()
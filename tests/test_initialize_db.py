@@ -0,0 +1,144 @@
+import hashlib
+from types import SimpleNamespace
+
+import chromadb
+import pandas as pd
+import pytest
+
+from src.utils import ingestion, vectorstore
+from src.utils.initialize_db import KEY_FIELDS, _hash, load_offers, sync_collection
+from src.utils.semantic_cache import SemanticCache, answer_scope
+
+
+class FakeEmbeddingFunction:
+    """Deterministic 8-dimensional vectors from the text hash, instead of the ONNX model"""
+
+    def __call__(self, documents):
+        return [[byte / 255 for byte in hashlib.sha1(document.encode("utf-8")).digest()[:8]] for document in documents]
+
+
+@pytest.fixture
+def fake_embeddings(monkeypatch):
+    monkeypatch.setattr(ingestion, "_embedding_function", FakeEmbeddingFunction())
+
+
+@pytest.fixture
+def client(tmp_path):
+    return chromadb.PersistentClient(path=str(tmp_path / "chroma"))
+
+
+def offers(texts):
+    """ids, documents and metadata with the hashes load_offers adds"""
+    ids, documents, metadatas = [], [], []
+    for doc_id, (text, metadata) in texts.items():
+        metadata = {**metadata, "content_hash": _hash(text)}
+        metadata["metadata_hash"] = _hash(metadata)
+        ids.append(doc_id)
+        documents.append(text)
+        metadatas.append(metadata)
+    return ids, documents, metadatas
+
+
+OFFERS = {
+    "offer_0": ("Voedselbank Amsterdam deelt voedselpakketten uit", {"subdomain": "Food & Clothing"}),
+    "offer_1": ("Nachtopvang in Rotterdam, elke dag open", {"subdomain": "Shelter"}),
+    "offer_2": ("Veilig Thuis advieslijn", {"subdomain": "Safety & Protection"}),
+}
+
+
+def sync(collection, texts):
+    return sync_collection(collection, *offers(texts), batch_size=2, workers=1)
+
+
+def test_sync_writes_a_data_version_that_follows_the_data(fake_embeddings, client):
+    collection = client.get_or_create_collection("offers", embedding_function=None)
+    sync(collection, OFFERS)
+    version = client.get_collection("offers", embedding_function=None).metadata["data_version"]
+
+    sync(collection, OFFERS)
+    assert client.get_collection("offers", embedding_function=None).metadata["data_version"] == version
+
+    changed = {**OFFERS, "offer_1": ("Nachtopvang in Rotterdam, alleen in het weekend", {"subdomain": "Shelter"})}
+    sync(collection, changed)
+    assert client.get_collection("offers", embedding_function=None).metadata["data_version"] != version
+
+
+def test_cached_answers_expire_when_another_process_re_ingests(fake_embeddings, client, monkeypatch):
+    collection = client.get_or_create_collection("offers", embedding_function=None)
+    sync(collection, OFFERS)
+
+    # The API process' view: its own resources, the version re-read once the check interval is over
+    resources = SimpleNamespace(client=client, collection_name="offers", embedding_function=None, generation=0)
+    monkeypatch.setattr(vectorstore, "get_resources", lambda: resources)
+    vectorstore._data_version_cache.clear()
+
+    cache = SemanticCache(threshold=0.9, maxsize=4, ttl=None)
+    scope = answer_scope("english", ["Shelter"], "Rotterdam")
+    cache.store([1.0, 0.0], scope, "Open every day", generation=vectorstore.data_generation())
+    assert cache.lookup([1.0, 0.0], scope, generation=vectorstore.data_generation()) == "Open every day"
+
+    sync(collection, {**OFFERS, "offer_1": ("Nachtopvang in Rotterdam, alleen in het weekend", {"subdomain": "Shelter"})})
+    vectorstore._data_version_cache.clear()  # DATA_VERSION_CHECK_SECONDS later
+    assert cache.lookup([1.0, 0.0], scope, generation=vectorstore.data_generation()) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_numpy_backend_has_no_data_version(monkeypatch):
+    resources = SimpleNamespace(client=None, collection_name="offers", embedding_function=None, generation=3)
+    monkeypatch.setattr(vectorstore, "get_resources", lambda: resources)
+    vectorstore._data_version_cache.clear()
+    assert vectorstore.data_generation() == (3, None)
+
+
+def test_sync_adds_updates_and_deletes_only_what_changed(fake_embeddings, client):
+    collection = client.get_or_create_collection("offers", embedding_function=None)
+    report = sync(collection, OFFERS)
+    assert (report.added, report.updated, report.metadata_updated, report.unchanged, report.deleted) == (3, 0, 0, 0, 0)
+    embedding_before = collection.get(ids=["offer_0"], include=["embeddings"])["embeddings"][0]
+
+    changed = {
+        "offer_0": OFFERS["offer_0"],  # unchanged
+        "offer_1": ("Nachtopvang in Rotterdam, alleen in het weekend", {"subdomain": "Shelter"}),  # new text
+        # offer_2 removed from the export
+        "offer_3": ("Gratis taalles in de bibliotheek", {"subdomain": "Courses & Activities"}),  # new offer
+    }
+    report = sync(collection, changed)
+    assert (report.added, report.updated, report.metadata_updated, report.unchanged, report.deleted) == (1, 1, 0, 1, 1)
+
+    stored = collection.get(include=["documents", "embeddings"])
+    documents = dict(zip(stored["ids"], stored["documents"]))
+    assert documents == {doc_id: text for doc_id, (text, _) in changed.items()}
+    # The unchanged offer kept its embedding, it was not re-embedded
+    unchanged = stored["ids"].index("offer_0")
+    assert list(stored["embeddings"][unchanged]) == list(embedding_before)
+
+
+def test_sync_updates_metadata_without_re_embedding(fake_embeddings, client):
+    collection = client.get_or_create_collection("offers", embedding_function=None)
+    sync(collection, OFFERS)
+
+    moved = {**OFFERS, "offer_2": (OFFERS["offer_2"][0], {"subdomain": "Women"})}
+    report = sync(collection, moved)
+    assert (report.added, report.updated, report.metadata_updated, report.unchanged, report.deleted) == (0, 0, 1, 2, 0)
+    assert collection.get(ids=["offer_2"])["metadatas"][0]["subdomain"] == "Women"
+    assert report.docs_per_second == 0.0
+
+
+def test_offers_outside_the_gazetteer_are_logged(tmp_path, caplog):
+    csv_path = tmp_path / "offers.csv"
+    columns = ["offer_edited", "subdomain", "icon_url", "link", "address", "date_added", "email", "phone_number",
+               "opening_hours_weekday", "opening_hours_weekend", *KEY_FIELDS]
+    rows = [
+        {"offer_edited": "Voedselbank", "address": "Damrak 1, 1012 LG Amsterdam"},
+        {"offer_edited": "Inloophuis", "address": "Dorpsstraat 1, 9999 ZZ Nergenshuizen"},
+        {"offer_edited": "Landelijke hulplijn", "address": None},
+    ]
+    pd.DataFrame(rows, columns=list(dict.fromkeys(columns))).to_csv(csv_path, index=False)
+
+    with caplog.at_level("WARNING", logger="src.utils.initialize_db"):
+        _, _, metadatas = load_offers(str(csv_path))
+
+    assert [metadata["municipality"] for metadata in metadatas] == ["amsterdam", "", ""]
+    # The offer without an address is meant to be national; only the unknown town is reported
+    assert "1 offers have an address in no known municipality" in caplog.text
+    assert "Nergenshuizen" in caplog.text
@@ -0,0 +1,44 @@
+from src.utils.language_id import conversation_language, detect_language, identify_language, reply_language
+
+
+def test_latin_script_languages():
+    assert detect_language("Where can I get food for my children?") == "english"
+    assert detect_language("Waar kan ik eten krijgen voor mijn kinderen?") == "dutch"
+    assert detect_language("Ich brauche einen Arzt für mein Kind") == "german"
+    assert detect_language("Je cherche un logement pour ce soir") == "french"
+    assert detect_language("Necesito ayuda con mi solicitud de asilo") == "spanish"
+
+
+def test_script_and_distinctive_letters():
+    assert identify_language("Мені потрібна допомога") == ("ukrainian", 1.0)
+    assert detect_language("Мне нужна помощь") == "russian"
+    assert detect_language("أحتاج مساعدة") == "arabic"
+    assert detect_language("کمک میخواهم") == "persian"
+
+
+def test_place_names_do_not_decide_the_language():
+    assert detect_language("Is there a Voedselbank near Centraal Station?") == "english"
+    assert detect_language("Amsterdam") is None
+
+
+def test_short_follow_ups_keep_the_conversation_language():
+    history = [
+        {"role": "user", "content": "Waar kan ik vannacht slapen?"},
+        {"role": "assistant", "content": "To better help you, please select the area(s)"},
+    ]
+    assert conversation_language("ok", history) == "dutch"
+    assert conversation_language("ok", [], default="english") == "english"
+
+
+def test_llm_language_is_kept_for_languages_the_model_does_not_know():
+    italian = "Dove posso trovare cibo per la mia famiglia? Ho bisogno di un posto dove dormire stanotte."
+    # Confidently wrong: Italian isn't one of the seed languages
+    assert detect_language(italian) == "portuguese"
+    assert reply_language("italian", italian) == "italian"
+    assert reply_language("bulgarian", "Имам нужда от лекар за детето си") == "bulgarian"
+
+
+def test_local_language_fills_in_when_the_llm_has_none():
+    history = [{"role": "user", "content": "Waar kan ik vannacht slapen?"}]
+    assert reply_language("unknown", "ok", history) == "dutch"
+    assert reply_language(None, "Where can I get food for my children?") == "english"
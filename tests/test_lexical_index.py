@@ -0,0 +1,48 @@
+from src.utils.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def make_index():
+    return BM25Index(
+        ids=["doc_0", "doc_1", "doc_2"],
+        documents=[
+            "Voedselbank Amsterdam deelt elke week voedselpakketten uit",
+            "Veilig Thuis is the advice line for domestic violence",
+            "Night shelter in Rotterdam, open every day",
+        ],
+        metadatas=[{"domain": "food & clothing"}, {"domain": "safety & protection"}, {"domain": "shelter"}],
+    )
+
+
+def test_tokenize_is_case_insensitive():
+    assert tokenize("Veilig Thuis, 0800-2000") == ["veilig", "thuis", "0800", "2000"]
+
+
+def test_tokenize_drops_stopwords():
+    assert tokenize("Where is the voedselbank? Waar is de voedselbank?") == ["voedselbank", "voedselbank"]
+
+
+def test_exact_terms_are_found():
+    hits = make_index().search("where is the voedselbank", n_results=3)
+    assert hits[0]["id"] == "doc_0"
+
+    hits = make_index().search("veilig thuis", n_results=3)
+    assert hits[0]["id"] == "doc_1"
+
+
+def test_search_applies_domain_filter():
+    index = make_index()
+    assert index.search("veilig thuis", n_results=3, where={"domain": {"$in": ["shelter"]}}) == []
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    path = str(tmp_path / "bm25_index.json")
+    make_index().save(path)
+    hits = BM25Index.load(path).search("Rotterdam shelter", n_results=1)
+    assert hits[0]["id"] == "doc_2"
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    dense = [{"id": "a"}, {"id": "b"}, {"id": "c"}]
+    lexical = [{"id": "b"}, {"id": "c"}]
+    fused = reciprocal_rank_fusion([dense, lexical], n_results=2)
+    assert [hit["id"] for hit in fused] == ["b", "c"]
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.utils import llm_utils
+from src.utils.llm_utils import LLMClientRegistry
+
+
+class MockMessagesAPI(BaseHTTPRequestHandler):
+    """Answers every POST like the Messages API, on a keep-alive HTTP/1.1 connection"""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = (
+            b'{"id": "msg_1", "type": "message", "role": "assistant", "model": "claude-3-5-haiku-20241022",'
+            b' "content": [{"type": "text", "text": "ok"}], "stop_reason": "end_turn", "stop_sequence": null,'
+            b' "usage": {"input_tokens": 5, "output_tokens": 1}}'
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def mock_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockMessagesAPI)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_sync_requests_reuse_one_connection(mock_server):
+    registry = LLMClientRegistry(base_url=mock_server)
+    for _ in range(3):
+        response = registry.http_client.post(f"{mock_server}/v1/messages", json={"model": "haiku"})
+        assert response.json()["content"][0]["text"] == "ok"
+    registry.close()
+
+    stats = registry.connection_stats()
+    assert stats["requests"] == 3
+    assert stats["connections_opened"] == 1
+    assert stats["connections_reused"] == 2
+
+
+def test_async_requests_reuse_one_connection(mock_server):
+    registry = LLMClientRegistry(base_url=mock_server)
+
+    async def run():
+        for _ in range(3):
+            await registry.async_http_client.post(f"{mock_server}/v1/messages", json={"model": "sonnet"})
+        await registry.aclose()
+
+    asyncio.run(run())
+    stats = registry.connection_stats()
+    assert stats["requests"] == 3
+    assert stats["connections_opened"] == 1
+    assert stats["reuse_rate"] == pytest.approx(2 / 3, abs=0.001)
+
+
+def test_chat_models_from_the_registry_share_one_pooled_connection(mock_server):
+    pytest.importorskip("langchain_anthropic")
+    registry = LLMClientRegistry(base_url=mock_server)
+    haiku = registry.get("haiku", api_key="test-key")
+    assert registry.get("haiku", api_key="test-key") is haiku
+
+    assert haiku.invoke("Where is the food bank?").content == "ok"
+    assert registry.get("sonnet", api_key="test-key").invoke("And in Utrecht?").content == "ok"
+    registry.close()
+
+    stats = registry.connection_stats()
+    assert stats["chat_models"] == 2
+    assert stats["requests"] == 2
+    assert stats["connections_opened"] == 1
+
+
+def test_async_chat_models_share_one_pooled_connection(mock_server):
+    pytest.importorskip("langchain_anthropic")
+    registry = LLMClientRegistry(base_url=mock_server)
+
+    async def run():
+        for name in ("haiku", "sonnet", "haiku"):
+            response = await registry.get(name, api_key="test-key").ainvoke("Where can I sleep tonight?")
+            assert response.content == "ok"
+        await registry.aclose()
+
+    asyncio.run(run())
+    stats = registry.connection_stats()
+    assert stats["requests"] == 3
+    assert stats["connections_opened"] == 1
+
+
+def test_api_key_is_looked_up_once(mock_server, monkeypatch):
+    pytest.importorskip("langchain_anthropic")
+    lookups = []
+    monkeypatch.delenv("ANTHROPIC_API_KEY", raising=False)
+    monkeypatch.setattr(llm_utils, "get_api_key", lambda: lookups.append(1) or "key-from-dotenv")
+    registry = LLMClientRegistry(base_url=mock_server)
+
+    for name in ("haiku", "sonnet", "haiku"):
+        registry.get(name)
+    assert len(lookups) == 1
+    assert registry.get("haiku").anthropic_api_key.get_secret_value() == "key-from-dotenv"
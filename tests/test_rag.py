@@ -1,6 +1,16 @@
+import threading
+from types import SimpleNamespace
+
 import pytest
 from datetime import datetime
-from src.agents.rag import rag_node, RAGInput, RAGState, RAGOutput, InformationMetadata
+from src.agents import rag
+from src.agents.rag import (
+    rag_node, RAGInput, RAGState, RAGOutput, InformationMetadata, filter_relevant, retrieve_for_domains,
+    reuse_speculative, split_by_domain
+)
+from src.utils import vectorstore
+from src.utils.retrievers import Retriever, matches_where
+from src.utils.speculation import Speculator
 
 
 @pytest.fixture
@@ -196,4 +206,199 @@ def test_domain_priority(base_state):
     response_text = result.update["response"]["text"].lower()
     domain_mentions = sum(1 for domain in ["food", "shelter", "health"]
                           if domain in response_text)
-    assert domain_mentions > 1
\ No newline at end of file
+    assert domain_mentions > 1
+
+def dense_hit(doc_id, distance):
+    return {"id": doc_id, "document": doc_id, "metadata": {}, "distance": distance}
+
+
+def lexical_hit(doc_id, bm25_score=None):
+    hit = {"id": doc_id, "document": doc_id, "metadata": {}, "distance": None}
+    if bm25_score is not None:
+        hit["bm25_score"] = bm25_score
+    return hit
+
+
+def test_filter_relevant_dense_hits_around_the_distance_threshold(monkeypatch):
+    monkeypatch.setattr(rag, "MAX_DISTANCE", 1.3)
+    monkeypatch.setattr(rag, "MAX_DISTANCE_PER_DOMAIN", {})
+    relevant = filter_relevant({
+        "Shelter": [dense_hit("close", 1.29), dense_hit("at_threshold", 1.3), dense_hit("far", 1.31)],
+        "Food & Clothing": [dense_hit("too_far", 1.31)],
+    })
+    # A domain left without relevant hits is dropped, so the query goes to the web fallback
+    assert list(relevant) == ["Shelter"]
+    assert [hit["id"] for hit in relevant["Shelter"]] == ["close", "at_threshold"]
+    assert filter_relevant({"Shelter": [dense_hit("far", 1.31)]}) == {}
+
+    monkeypatch.setattr(rag, "MAX_DISTANCE", 0.5)
+    assert filter_relevant({"Shelter": [dense_hit("close", 0.5), dense_hit("mid", 0.6)]}) == {
+        "Shelter": [dense_hit("close", 0.5)]
+    }
+
+
+def test_filter_relevant_lexical_only_hits_need_a_strong_bm25_score(monkeypatch):
+    monkeypatch.setattr(rag, "MIN_BM25_SCORE", 3.0)
+    relevant = filter_relevant({
+        "Safety & Protection": [lexical_hit("strong", 4.2), lexical_hit("at_minimum", 3.0),
+                                lexical_hit("weak", 2.9), lexical_hit("unscored")],
+    })
+    assert [hit["id"] for hit in relevant["Safety & Protection"]] == ["strong", "at_minimum"]
+    assert filter_relevant({"Safety & Protection": [lexical_hit("weak", 2.9)]}) == {}
+
+    monkeypatch.setattr(rag, "MIN_BM25_SCORE", 1.0)
+    relevant = filter_relevant({"Safety & Protection": [lexical_hit("weak", 2.9)]})
+    assert [hit["id"] for hit in relevant["Safety & Protection"]] == ["weak"]
+
+
+def test_filter_relevant_uses_the_per_domain_threshold(monkeypatch):
+    monkeypatch.setattr(rag, "MAX_DISTANCE", 1.3)
+    monkeypatch.setattr(rag, "MAX_DISTANCE_PER_DOMAIN", {"shelter": 1.1})
+    relevant = filter_relevant({"Shelter": [dense_hit("close", 1.0), dense_hit("mid", 1.2)],
+                                "Food & Clothing": [dense_hit("mid", 1.2)]})
+    assert [hit["id"] for hit in relevant["Shelter"]] == ["close"]
+    assert [hit["id"] for hit in relevant["Food & Clothing"]] == ["mid"]
+
+
+class FakeRetriever(Retriever):
+    """In-memory retriever over hits with a fixed distance, honouring the where filter and recording searches"""
+
+    def __init__(self, hits):
+        self.hits = sorted(hits, key=lambda hit: hit["distance"])
+        self.searches = []
+
+    def search(self, query_embedding, n_results, where=None):
+        self.searches.append((n_results, where))
+        return [hit for hit in self.hits if matches_where(hit["metadata"], where)][:n_results]
+
+
+def offer(doc_id, domain, distance, **metadata):
+    return {"id": doc_id, "document": doc_id, "metadata": {"domain": domain, **metadata}, "distance": distance}
+
+
+def test_split_by_domain_keeps_rank_order_and_drops_empty_domains():
+    dense = [offer("f1", "food & clothing", 0.2), offer("s1", "shelter", 0.3), offer("f2", "food & clothing", 0.4),
+             offer("x1", "work", 0.5)]
+    lexical = [dict(offer("s2", "shelter", None), bm25_score=5.0)]
+    results = split_by_domain([dense, lexical], ["Food & Clothing", "Shelter", "Healthcare"], 2)
+    assert list(results) == ["Food & Clothing", "Shelter"]
+    assert [hit["id"] for hit in results["Food & Clothing"]] == ["f1", "f2"]
+    assert {hit["id"] for hit in results["Shelter"]} == {"s1", "s2"}
+
+
+def test_split_by_domain_collapses_chunks_of_one_offer():
+    dense = [offer("o1#0", "shelter", 0.2, parent_id="o1", chunk_index=0),
+             offer("o1#1", "shelter", 0.25, parent_id="o1", chunk_index=1),
+             offer("o2", "shelter", 0.3)]
+    results = split_by_domain([dense], ["Shelter"], 3)
+    assert [hit["id"] for hit in results["Shelter"]] == ["o1", "o2"]
+
+
+def test_retrieve_for_domains_uses_one_search_when_it_covers_every_domain():
+    retriever = FakeRetriever([offer(f"f{i}", "food & clothing", 0.1 + i / 100) for i in range(3)]
+                              + [offer(f"s{i}", "shelter", 0.2 + i / 100) for i in range(3)])
+    results = retrieve_for_domains(retriever, [0.0], ["Food & Clothing", "Shelter"], 2)
+    assert {domain: len(hits) for domain, hits in results.items()} == {"Food & Clothing": 2, "Shelter": 2}
+    assert len(retriever.searches) == 1
+
+
+def test_crowded_out_domains_are_topped_up_with_their_own_search():
+    # 100 close food offers fill the whole over-fetched multi-domain search
+    retriever = FakeRetriever([offer(f"f{i}", "food & clothing", 0.1 + i / 1000) for i in range(100)]
+                              + [offer(f"s{i}", "shelter", 0.9 + i / 100) for i in range(5)])
+    results = retrieve_for_domains(retriever, [0.0], ["Food & Clothing", "Shelter"], 6)
+    assert {domain: len(hits) for domain, hits in results.items()} == {"Food & Clothing": 6, "Shelter": 5}
+    assert [hit["id"] for hit in results["Shelter"]] == [f"s{i}" for i in range(5)]
+    assert retriever.searches[-1] == (6, {"domain": "shelter"})
+
+
+def test_top_up_keeps_the_location_filter():
+    retriever = FakeRetriever([offer(f"f{i}", "food & clothing", 0.1, municipality="utrecht") for i in range(40)]
+                              + [offer("s_far", "shelter", 0.5, municipality="groningen"),
+                                 offer("s_near", "shelter", 0.6, municipality="utrecht")])
+    where = {"municipality": {"$in": ["utrecht", ""]}}
+    results = retrieve_for_domains(retriever, [0.0], ["Food & Clothing", "Shelter"], 2, where=where)
+    assert [hit["id"] for hit in results["Shelter"]] == ["s_near"]
+    assert retriever.searches[-1] == (2, {"$and": [{"domain": "shelter"}, where]})
+
+
+def speculation(hits, where=None, generation=0):
+    """What speculative_search returns: the dense ranking over all domains"""
+    return {"rankings": [hits], "where": where, "generation": generation}
+
+
+FOOD_AND_SHELTER = [offer("f1", "food & clothing", 0.2), offer("f2", "food & clothing", 0.3),
+                    offer("s1", "shelter", 0.4)]
+
+
+@pytest.fixture
+def resources(monkeypatch):
+    resources = SimpleNamespace(generation=0)
+    monkeypatch.setattr(vectorstore, "get_resources", lambda: resources)
+    return resources
+
+
+def test_speculation_is_reused_for_the_domains_it_fully_answers(resources):
+    reused = reuse_speculative(speculation(FOOD_AND_SHELTER), ["Food & Clothing", "Shelter"], 2, None)
+    # Shelter has one hit where two are needed, so it gets its own search
+    assert list(reused) == ["Food & Clothing"]
+    assert [hit["id"] for hit in reused["Food & Clothing"]] == ["f1", "f2"]
+
+
+def test_speculation_for_other_domains_location_or_data_is_discarded(resources):
+    assert reuse_speculative(speculation(FOOD_AND_SHELTER), ["Healthcare"], 1, None) == {}
+    near_utrecht = {"municipality": {"$in": ["utrecht", ""]}}
+    assert reuse_speculative(speculation(FOOD_AND_SHELTER), ["Food & Clothing"], 1, near_utrecht) == {}
+    assert reuse_speculative(speculation(FOOD_AND_SHELTER, where=near_utrecht), ["Food & Clothing"], 1, None) == {}
+    resources.generation = 1
+    assert reuse_speculative(speculation(FOOD_AND_SHELTER), ["Food & Clothing"], 1, None) == {}
+    assert reuse_speculative(None, ["Food & Clothing"], 1, None) == {}
+
+
+@pytest.fixture
+def retrieval(monkeypatch, resources):
+    """Fake vectorstore and a private speculator for _prepare_generation"""
+    retriever = FakeRetriever([offer(f"f{i}", "food & clothing", 0.2 + i / 100, source="voedselbank.nl")
+                               for i in range(rag.MAX_K)])
+    monkeypatch.setattr(vectorstore, "get_retriever", lambda: retriever)
+    monkeypatch.setattr(vectorstore, "get_lexical_index", lambda: None)
+    monkeypatch.setattr(vectorstore, "embed_query", lambda text: [1.0, 0.0])
+    monkeypatch.setattr(vectorstore, "data_generation", lambda: (0, None))
+    monkeypatch.setattr(rag, "SEMANTIC_CACHE_ENABLED", False)
+    monkeypatch.setattr(rag, "speculator", Speculator(workers=1))
+    return retriever
+
+
+FOOD_QUERY = {"original_query": "Where can I get food?", "domains": ["Food & Clothing"], "entities": {},
+              "language": "english"}
+
+
+def test_prepare_generation_uses_a_finished_speculation(retrieval):
+    speculated = [offer(f"spec{i}", "food & clothing", 0.1 + i / 100) for i in range(rag.MAX_K)]
+    token = rag.speculator.start(lambda: speculation(speculated))
+    plan = rag._prepare_generation(FOOD_QUERY, token)
+    assert retrieval.searches == []
+    assert plan["documents"][0] == "spec0"
+    assert rag.speculator.stats()["taken"] == 1
+
+
+def test_prepare_generation_searches_itself_when_the_speculation_is_too_slow(retrieval):
+    release = threading.Event()
+    token = rag.speculator.start(lambda: release.wait() and speculation([]))
+    try:
+        plan = rag._prepare_generation(FOOD_QUERY, token)
+    finally:
+        release.set()
+    assert len(retrieval.searches) == 1
+    assert plan["documents"][0] == "f0"
+    assert rag.speculator.stats()["timed_out"] == 1
+
+
+def test_prepare_generation_widens_the_search_when_nothing_nearby_is_relevant(retrieval):
+    # Nearby offers exist, but none passes the relevance gate
+    retrieval.hits = sorted([offer("near", "food & clothing", 1.9, municipality="utrecht"),
+                             offer("national", "food & clothing", 0.3, municipality="groningen")],
+                            key=lambda hit: hit["distance"])
+    plan = rag._prepare_generation({**FOOD_QUERY, "entities": {"location": "Utrecht"}})
+    assert plan["documents"] == ["national"]
+    assert retrieval.searches[0][1] is not None and retrieval.searches[-1][1] == {"domain": {"$in": ["food & clothing"]}}
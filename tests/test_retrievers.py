@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from src.utils.retrievers import NumpyRetriever
+
+
+@pytest.fixture
+def retriever(tmp_path):
+    NumpyRetriever.build(
+        str(tmp_path),
+        ids=["doc_0", "doc_1", "doc_2", "doc_3"],
+        documents=["Food bank Amsterdam", "Night shelter Amsterdam", "Food parcels Rotterdam", "Dentist"],
+        metadatas=[
+            {"domain": "food & clothing", "source": "offers"},
+            {"domain": "shelter", "source": "offers"},
+            {"domain": "food & clothing"},
+            {"domain": "dentist", "source": "offers"},
+        ],
+        embeddings=[[1.0, 0.0, 0.0], [0.0, 2.0, 0.0], [0.8, 0.6, 0.0], [0.0, 0.0, 1.0]],
+    )
+    return NumpyRetriever(str(tmp_path))
+
+
+def test_index_is_memory_mapped(retriever):
+    assert isinstance(retriever.embeddings, np.memmap)
+    assert retriever.count() == 4
+
+
+def test_search_returns_top_k_sorted_by_distance(retriever):
+    hits = retriever.search([1.0, 0.1, 0.0], n_results=2)
+    assert [hit["id"] for hit in hits] == ["doc_0", "doc_2"]
+    assert hits[0]["distance"] <= hits[1]["distance"]
+    assert hits[0]["document"] == "Food bank Amsterdam"
+
+
+def test_stored_vectors_are_normalized(retriever):
+    hits = retriever.search([0.0, 1.0, 0.0], n_results=1)
+    assert hits[0]["id"] == "doc_1"
+    assert hits[0]["distance"] == pytest.approx(0.0, abs=1e-6)
+
+
+def test_metadata_filters(retriever):
+    hits = retriever.search([1.0, 0.0, 0.0], n_results=10, where={"domain": {"$in": ["shelter", "dentist"]}})
+    assert {hit["id"] for hit in hits} == {"doc_1", "doc_3"}
+
+    hits = retriever.search([1.0, 0.0, 0.0], n_results=10, where={"domain": "food & clothing"})
+    assert {hit["id"] for hit in hits} == {"doc_0", "doc_2"}
+
+    hits = retriever.search(
+        [1.0, 0.0, 0.0],
+        n_results=10,
+        where={"$and": [{"domain": "food & clothing"}, {"source": {"$eq": "offers"}}]}
+    )
+    assert [hit["id"] for hit in hits] == ["doc_0"]
+
+
+def test_filter_without_matches_returns_nothing(retriever):
+    assert retriever.search([1.0, 0.0, 0.0], n_results=3, where={"domain": "work"}) == []
@@ -0,0 +1,98 @@
+import pytest
+
+from src.utils.caching import SQLiteTTLCache
+from src.utils.search_cache import CachedSearch
+
+QUERY = "voedselbank utrecht site:rodekruis.nl OR site:voedselbank.nl"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeSearchProvider:
+    """Local stand-in for DuckDuckGo: numbered results, optionally failing"""
+
+    def __init__(self):
+        self.calls = []
+        self.fail = False
+
+    def __call__(self, query):
+        if self.fail:
+            raise ConnectionError("rate limited")
+        self.calls.append(query)
+        return f"result {len(self.calls)} for {query}"
+
+
+class InlineExecutor:
+    """Runs background refreshes immediately so tests are deterministic"""
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_search(tmp_path, clock, provider, ttl=60, stale_ttl=600):
+    cache = SQLiteTTLCache(str(tmp_path / "web_search.sqlite"), maxsize=100, ttl=ttl + stale_ttl, clock=clock)
+    return CachedSearch(provider, cache, ttl=ttl, stale_ttl=stale_ttl, clock=clock, executor=InlineExecutor())
+
+
+def test_repeated_query_is_served_from_cache(tmp_path, clock):
+    provider = FakeSearchProvider()
+    search = make_search(tmp_path, clock, provider)
+    assert search(QUERY) == search(QUERY)
+    # The site: restrictions are part of the key
+    search("voedselbank utrecht")
+    assert provider.calls == [QUERY, "voedselbank utrecht"]
+    assert search.stats()["fresh_hits"] == 1
+    assert search.stats()["misses"] == 2
+
+
+def test_results_survive_a_restart(tmp_path, clock):
+    provider = FakeSearchProvider()
+    make_search(tmp_path, clock, provider)(QUERY)
+    assert make_search(tmp_path, clock, provider)(QUERY) == f"result 1 for {QUERY}"
+    assert len(provider.calls) == 1
+
+
+def test_stale_results_are_served_while_refreshing(tmp_path, clock):
+    provider = FakeSearchProvider()
+    search = make_search(tmp_path, clock, provider)
+    search(QUERY)
+
+    clock.now += 120  # past the TTL, within the stale window
+    assert search(QUERY) == f"result 1 for {QUERY}"
+    assert search(QUERY) == f"result 2 for {QUERY}"
+    stats = search.stats()
+    assert stats["stale_hits"] == 1
+    assert stats["refreshes"] == 1
+
+
+def test_failed_refresh_keeps_stale_results(tmp_path, clock):
+    provider = FakeSearchProvider()
+    search = make_search(tmp_path, clock, provider)
+    search(QUERY)
+
+    clock.now += 120
+    provider.fail = True
+    assert search(QUERY) == f"result 1 for {QUERY}"
+    assert search(QUERY) == f"result 1 for {QUERY}"
+    assert search.stats()["refresh_failures"] == 2
+
+
+def test_expired_results_are_fetched_again(tmp_path, clock):
+    provider = FakeSearchProvider()
+    search = make_search(tmp_path, clock, provider)
+    search(QUERY)
+
+    clock.now += 1000  # past TTL and stale window
+    assert search(QUERY) == f"result 2 for {QUERY}"
+    assert search.stats()["misses"] == 2
@@ -0,0 +1,54 @@
+from src.utils.semantic_cache import SemanticCache, answer_scope
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_similar_query_in_same_scope_is_a_hit():
+    cache = SemanticCache(threshold=0.95, maxsize=4, ttl=60, clock=FakeClock())
+    scope = answer_scope("english", ["Food & Clothing"], "Amsterdam")
+    cache.store([1.0, 0.0, 0.0], scope, {"text": "Go to the food bank"})
+
+    assert cache.lookup([0.99, 0.05, 0.0], scope) == {"text": "Go to the food bank"}
+    assert cache.lookup([0.0, 1.0, 0.0], scope) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_scope_separates_language_domains_and_location():
+    cache = SemanticCache(threshold=0.9, maxsize=4, ttl=60, clock=FakeClock())
+    cache.store([1.0, 0.0], answer_scope("english", ["Shelter"], "Amsterdam"), "answer")
+
+    assert cache.lookup([1.0, 0.0], answer_scope("dutch", ["Shelter"], "Amsterdam")) is None
+    assert cache.lookup([1.0, 0.0], answer_scope("english", ["Food & Clothing"], "Amsterdam")) is None
+    assert cache.lookup([1.0, 0.0], answer_scope("english", ["Shelter"], "Rotterdam")) is None
+    # Case and domain order don't matter
+    assert cache.lookup([1.0, 0.0], answer_scope("English", ["shelter"], " amsterdam")) == "answer"
+
+
+def test_entries_expire_and_are_evicted():
+    clock = FakeClock()
+    cache = SemanticCache(threshold=0.9, maxsize=1, ttl=10, clock=clock)
+    scope = answer_scope("english", ["Shelter"], None)
+    cache.store([1.0, 0.0], scope, "first")
+    cache.store([0.0, 1.0], scope, "second")
+    assert cache.stats()["evictions"] == 1
+    assert cache.lookup([1.0, 0.0], scope) is None
+
+    clock.now = 11
+    assert cache.lookup([0.0, 1.0], scope) is None
+    assert len(cache) == 0
+
+
+def test_new_collection_generation_invalidates_cache():
+    cache = SemanticCache(threshold=0.9, maxsize=4, ttl=60, clock=FakeClock())
+    scope = answer_scope("english", ["Shelter"], None)
+    cache.store([1.0, 0.0], scope, "answer", generation=0)
+    assert cache.lookup([1.0, 0.0], scope, generation=0) == "answer"
+    assert cache.lookup([1.0, 0.0], scope, generation=1) is None
+    assert cache.stats()["invalidations"] == 1
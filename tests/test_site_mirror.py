@@ -0,0 +1,154 @@
+import typing
+
+import pytest
+
+from src.agents.query_understanding import Domains
+from src.utils.site_mirror import (
+    DOMAIN_SITE_GROUPS, TRUSTED_SITES, SiteMirror, format_results, html_to_text, load_site_pages, page_chunks,
+    site_for, trusted_sites_for
+)
+
+PAGE = """
+<html>
+<head><title>Voedselbank Utrecht | Hulp</title><style>p { color: red; }</style></head>
+<body>
+<nav><a href="/">Home</a><a href="/over-ons">Over ons</a></nav>
+<h1>Voedselpakket aanvragen</h1>
+<p>Elke dinsdag kunt u een pakket ophalen &amp; meenemen.</p>
+<script>var tracking = "do not index";</script>
+<ul><li>Neem uw ID mee</li><li>Aanmelden via het wijkteam</li></ul>
+<footer>Cookies en privacy</footer>
+</body>
+</html>
+"""
+
+
+def write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+
+
+@pytest.fixture
+def snapshots(tmp_path):
+    write(tmp_path / "www.voedselbank.nl" / "utrecht" / "index.html", PAGE)
+    write(tmp_path / "voedselbank.nl" / "contact.html", "<title>Contact</title><p>Bel 030 123 4567</p>")
+    write(tmp_path / "amsterdam.nl" / "onderwijs" / "taalles.txt", "Gratis taalles voor nieuwkomers")
+    write(tmp_path / "amsterdam.nl" / "parkeren.html", "<p>Parkeervergunning aanvragen</p>")
+    write(tmp_path / "nieuws.nl" / "artikel.html", "<p>Het Rode Kruis deed dit vorig jaar</p>")
+    write(tmp_path / "rodekruis.nl" / "logo.png", "not a page")
+    write(tmp_path / "rodekruis.nl" / "leeg.html", "<script>only()</script>")
+    return tmp_path
+
+
+def test_html_to_text_keeps_content_and_drops_chrome():
+    title, text = html_to_text(PAGE)
+    assert title == "Voedselbank Utrecht | Hulp"
+    assert text.splitlines() == [
+        "Voedselpakket aanvragen",
+        "Elke dinsdag kunt u een pakket ophalen & meenemen.",
+        "Neem uw ID mee",
+        "Aanmelden via het wijkteam",
+    ]
+
+
+def test_site_for_prefers_most_specific_site():
+    sites = ["amsterdam.nl", "amsterdam.nl/onderwijs", "voedselbank.nl"]
+    assert site_for("amsterdam.nl/onderwijs/taalles.txt", sites) == "amsterdam.nl/onderwijs"
+    assert site_for("www.voedselbank.nl/utrecht/", sites) == "voedselbank.nl"
+    assert site_for("voedselbankennederland.nl/", sites) is None
+
+
+def test_only_pages_of_trusted_sites_are_loaded(snapshots):
+    pages = {page.url: page for page in load_site_pages(str(snapshots))}
+    assert set(pages) == {
+        "https://amsterdam.nl/onderwijs/taalles.txt",
+        "https://voedselbank.nl/contact.html",
+        "https://www.voedselbank.nl/utrecht/",
+    }
+    utrecht = pages["https://www.voedselbank.nl/utrecht/"]
+    assert (utrecht.site, utrecht.domain, utrecht.page_type) == ("voedselbank.nl", "food", "content")
+    assert pages["https://voedselbank.nl/contact.html"].page_type == "contact"
+    assert pages["https://amsterdam.nl/onderwijs/taalles.txt"].domain == "education"
+
+
+def test_page_chunks_are_tagged_and_hashed(snapshots):
+    pages = load_site_pages(str(snapshots))
+    ids, documents, metadatas = page_chunks(pages, chunk_size=5, chunk_overlap=1)
+    assert len(ids) == len(set(ids)) > len(pages)
+    assert all(metadata["site"] and metadata["domain"] and metadata["url"] for metadata in metadatas)
+    assert all("content_hash" in metadata and "metadata_hash" in metadata for metadata in metadatas)
+    # Same snapshots, same ids and hashes: a re-sync re-embeds nothing
+    assert page_chunks(pages, chunk_size=5, chunk_overlap=1) == (ids, documents, metadatas)
+
+
+class FakeCollection:
+    """In-memory stand-in for the Chroma collection: fixed ranked hits, honouring the site filter"""
+
+    def __init__(self, hits):
+        self.hits = hits
+        self.queries = []
+
+    def query(self, query_embeddings, n_results, where, include):
+        self.queries.append(where)
+        sites = where["site"]["$in"]
+        hits = [hit for hit in self.hits if hit[1]["site"] in sites][:n_results]
+        return {
+            "documents": [[hit[0] for hit in hits]],
+            "metadatas": [[hit[1] for hit in hits]],
+            "distances": [[hit[2] for hit in hits]],
+        }
+
+
+HITS = [
+    ("Pakket ophalen op dinsdag", {"url": "https://voedselbank.nl/utrecht/", "site": "voedselbank.nl", "title": "Utrecht"}, 0.6),
+    ("Neem uw ID mee", {"url": "https://voedselbank.nl/utrecht/", "site": "voedselbank.nl", "title": "Utrecht"}, 0.7),
+    ("Noodhulp", {"url": "https://rodekruis.nl/hulp", "site": "rodekruis.nl", "title": "Hulp"}, 0.9),
+    ("Vacatures", {"url": "https://rodekruis.nl/werken", "site": "rodekruis.nl", "title": "Werken"}, 1.5),
+]
+
+
+def test_search_keeps_one_close_chunk_per_page():
+    mirror = SiteMirror(embed=lambda text: [0.0], collection=FakeCollection(HITS), max_distance=1.2)
+    hits = mirror.search("voedselpakket utrecht", ["rodekruis.nl", "voedselbank.nl"])
+    assert [(hit["url"], hit["document"]) for hit in hits] == [
+        ("https://voedselbank.nl/utrecht/", "Pakket ophalen op dinsdag"),
+        ("https://rodekruis.nl/hulp", "Noodhulp"),
+    ]
+    assert "link: https://voedselbank.nl/utrecht/" in format_results(hits)
+
+
+def test_search_misses_outside_the_requested_sites_or_distance():
+    mirror = SiteMirror(embed=lambda text: [0.0], collection=FakeCollection(HITS), max_distance=0.5)
+    assert mirror.search("voedselpakket", ["voedselbank.nl"]) == []
+    assert mirror.search("voedselpakket", ["veiligthuis.nl"]) == []
+    stats = mirror.stats()
+    assert (stats["searches"], stats["hits"], stats["misses"]) == (2, 0, 2)
+
+
+def test_missing_mirror_falls_back_without_errors():
+    mirror = SiteMirror(embed=lambda text: [0.0])
+    mirror._open = lambda: (_ for _ in ()).throw(ValueError("Collection trusted_sites does not exist"))
+    assert mirror.search("voedselpakket", ["voedselbank.nl"]) == []
+    assert mirror.contacts(["voedselbank.nl"]) == []
+    assert mirror.stats()["available"] is False
+
+
+def test_analysis_domains_search_their_trusted_sites():
+    assert trusted_sites_for(["Food & Clothing"]) == ["rodekruis.nl", "voedselbank.nl", "voedselbankennederland.nl"]
+    assert "veiligthuis.nl" in trusted_sites_for(["Women", "Safety & Protection"])
+    assert trusted_sites_for(["Work", "Other"]) == ["rodekruis.nl"]
+
+    collection = FakeCollection(HITS)
+    mirror = SiteMirror(embed=lambda text: [0.0], collection=collection)
+    hits = mirror.search("voedselpakket utrecht", trusted_sites_for(["Food & Clothing"]))
+    assert "voedselbank.nl" in collection.queries[0]["site"]["$in"]
+    assert hits[0]["site"] == "voedselbank.nl"
+
+
+def test_analysis_domains_map_to_known_site_groups():
+    # Domains without a group only search the Red Cross site; a renamed domain must not silently do so
+    unmapped = {"work", "search missing relatives", "feedback", "helpdesk & social support"}
+    for domain in typing.get_args(Domains):
+        groups = DOMAIN_SITE_GROUPS.get(domain.lower())
+        assert groups or domain.lower() in unmapped, domain
+        assert all(group in TRUSTED_SITES for group in groups or [])
@@ -0,0 +1,40 @@
+import threading
+
+from src.utils.speculation import Speculator
+
+
+def test_result_is_taken_once():
+    speculator = Speculator(workers=1)
+    token = speculator.start(lambda query: query.upper(), "i need food")
+    assert speculator.take(token, timeout=1) == "I NEED FOOD"
+    assert speculator.take(token, timeout=1) is None
+    assert speculator.stats()["taken"] == 1
+
+
+def test_cancelled_work_is_not_returned():
+    speculator = Speculator(workers=1)
+    release = threading.Event()
+    blocking = speculator.start(release.wait)
+    queued = speculator.start(lambda: "never needed")
+
+    speculator.cancel(queued)
+    release.set()
+    assert speculator.take(queued) is None
+    assert speculator.take(blocking, timeout=1) is True
+    assert speculator.stats()["cancelled"] == 1
+
+
+def test_slow_or_failing_work_gives_none():
+    speculator = Speculator(workers=2)
+    release = threading.Event()
+    slow = speculator.start(release.wait)
+    assert speculator.take(slow, timeout=0.01) is None
+    release.set()
+
+    def fail():
+        raise ValueError("vectorstore not available")
+
+    assert speculator.take(speculator.start(fail), timeout=1) is None
+    stats = speculator.stats()
+    assert stats["timed_out"] == 1
+    assert stats["failed"] == 1
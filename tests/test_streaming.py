@@ -0,0 +1,44 @@
+import json
+from types import SimpleNamespace
+
+from src.utils.streaming import TimeToFirstToken, graph_events, sse_event
+
+
+def test_answer_tokens_are_streamed_only_from_answer_nodes():
+    chunk = SimpleNamespace(content="Voedselbank ")
+    assert graph_events("messages", (chunk, {"langgraph_node": "rag"})) == [("token", {"text": "Voedselbank "})]
+    # The query analysis also runs through a chat model, its tokens stay internal
+    assert graph_events("messages", (chunk, {"langgraph_node": "query_understanding"})) == []
+
+
+def test_content_blocks_are_joined():
+    chunk = SimpleNamespace(content=[{"type": "text", "text": "Open "}, {"type": "tool_use", "id": "x"}, {"type": "text", "text": "daily"}])
+    assert graph_events("messages", (chunk, {"langgraph_node": "rag"})) == [("token", {"text": "Open daily"})]
+
+
+def test_updates_become_route_message_and_final_events():
+    events = graph_events("updates", {"query_understanding": {"analysis": {"query_type": "emergency", "domains": []}}})
+    assert events == [("route", {"node": "query_understanding", "query_type": "emergency", "domains": []})]
+
+    events = graph_events("updates", {"emergency": {"messages": [{"role": "assistant", "content": "Call 112"}]}})
+    assert events[1] == ("message", {"text": "Call 112"})
+
+    events = graph_events("updates", {"response_quality": {"final_response": {"text": "Reviewed answer"}}})
+    assert events[1] == ("final", {"text": "Reviewed answer"})
+
+
+def test_sse_event_format():
+    message = sse_event("token", {"text": "hallo"})
+    assert message.startswith("event: token\ndata: ")
+    assert message.endswith("\n\n")
+    assert json.loads(message.split("data: ", 1)[1]) == {"text": "hallo"}
+
+
+def test_time_to_first_token_records_once_per_request():
+    tracker = TimeToFirstToken()
+    timer = tracker.start()
+    first = timer.first_output()
+    assert timer.first_output() == first
+    stats = tracker.stats()
+    assert stats["requests"] == 1
+    assert stats["p50_ms"] is not None
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from src.agents import web_agent
+from src.utils.caching import TTLCache
+
+RESULTS = (
+    "snippet: Voedselpakket ophalen, link: https://www.voedselbank.nl/utrecht, "
+    "snippet: Nachtopvang, link: https://leger.nl/opvang, "
+    "snippet: Meer over de voedselbank, link: https://voedselbank.nl/contact"
+)
+
+
+class FakeContactSearch:
+    """Stand-in for the DuckDuckGo contact search: counts calls, and hangs on the domains in `hang`"""
+
+    def __init__(self, hang=()):
+        self.calls = []
+        self.hang = set(hang)
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+
+    def run(self, query):
+        with self.lock:
+            self.calls.append(query)
+        domain = query.split()[0]
+        if domain in self.hang:
+            self.release.wait()
+        if domain == "broken.nl":
+            raise ConnectionError("rate limited")
+        return f"contact for {domain}"
+
+
+@pytest.fixture
+def contact_search(monkeypatch):
+    search = FakeContactSearch()
+    monkeypatch.setattr(web_agent, "contact_search_tool", search)
+    monkeypatch.setattr(web_agent, "contact_cache", TTLCache(maxsize=16, ttl=None))
+    monkeypatch.setattr(web_agent, "CONTACT_LOOKUP_TIMEOUT", 0.3)
+    yield search
+    search.release.set()
+
+
+def test_each_domain_is_looked_up_once_and_then_cached(contact_search):
+    contacts = web_agent.get_contact_info(RESULTS)
+    assert {contact["domain"]: contact["contact_info"] for contact in contacts} == {
+        "www.voedselbank.nl": "contact for www.voedselbank.nl",
+        "leger.nl": "contact for leger.nl",
+        "voedselbank.nl": "contact for voedselbank.nl",
+    }
+    assert sorted(contact_search.calls) == ["leger.nl contact", "voedselbank.nl contact", "www.voedselbank.nl contact"]
+
+    assert web_agent.get_contact_info(RESULTS) == contacts
+    assert len(contact_search.calls) == 3
+
+
+def test_concurrent_requests_share_a_running_lookup(contact_search):
+    contact_search.hang = {"leger.nl"}
+    results = []
+    requests = [
+        threading.Thread(target=lambda: results.append(web_agent.get_contact_info("link: https://leger.nl/opvang")))
+        for _ in range(3)
+    ]
+    for request in requests:
+        request.start()
+    time.sleep(0.1)
+    contact_search.release.set()
+    for request in requests:
+        request.join()
+
+    assert contact_search.calls == ["leger.nl contact"]
+    assert results == [[{"domain": "leger.nl", "contact_info": "contact for leger.nl"}]] * 3
+
+
+def test_failed_lookups_are_left_out(contact_search):
+    contacts = web_agent.get_contact_info("link: https://broken.nl, link: https://leger.nl")
+    assert contacts == [{"domain": "leger.nl", "contact_info": "contact for leger.nl"}]
+
+
+def test_hung_searches_are_bounded_and_free_their_workers(contact_search, monkeypatch):
+    monkeypatch.setattr(web_agent, "_search_slots", threading.BoundedSemaphore(2))
+    # Domains with digits are skipped by get_contact_info, so letters tell them apart
+    hung = [f"hung{letter}.nl" for letter in "abcdefgh"[:web_agent.CONTACT_LOOKUP_WORKERS + 1]]
+    contact_search.hang = set(hung)
+    results = ", ".join(f"link: https://{domain}" for domain in hung)
+
+    start = time.monotonic()
+    assert web_agent.get_contact_info(results) == []
+    assert time.monotonic() - start < 1.0
+
+    # Asking again for the same domains starts no more searches than there are slots
+    for _ in range(3):
+        assert web_agent.get_contact_info(results) == []
+    assert len(contact_search.calls) == 2
+
+    # While every slot is held, other lookups are rejected right away instead of queueing
+    start = time.monotonic()
+    assert web_agent.get_contact_info("link: https://voedselbank.nl") == []
+    assert time.monotonic() - start < 0.3
+    assert len(contact_search.calls) == 2
+
+    # Finished searches give their slot back and still fill the cache
+    contact_search.release.set()
+    time.sleep(0.1)
+    searched = [query.split()[0] for query in contact_search.calls]
+    assert all(web_agent.contact_cache.get(domain) == f"contact for {domain}" for domain in searched)
+    assert web_agent.get_contact_info("link: https://voedselbank.nl") == [
+        {"domain": "voedselbank.nl", "contact_info": "contact for voedselbank.nl"}
+    ]